@@ -0,0 +1,189 @@
+"""
+Latency, throughput and query counts of the REST API, measured in-process
+with Django's test client against a seeded throwaway SQLite database:
+
+    cd backend/core
+    python -m benchmarks.api --save benchmarks/baselines/api.json
+    python -m benchmarks.api --compare benchmarks/baselines/api.json
+
+Requests go through the full middleware and JWT stack but no network, so the
+numbers isolate the Django side. Catalog scenarios run twice: with the
+catalog response cache cleared before every request, and again as
+"(warm cache)" with it left to fill. --compare exits non-zero when a scenario
+issues more queries than the baseline or its p95 regresses by more than
+--threshold percent.
+"""
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import migrate, percentile, seed, setup_django
+
+USERNAME, PASSWORD = 'bench', 'bench'
+
+
+def scenarios(scale):
+    # name -> (method, path or callable(i) -> path, body or callable(i) -> body)
+    orders, warehouses, products = scale['orders'], scale['warehouses'], scale['products']
+    quantities = scale['warehouse_items'] + orders
+    return {
+        'catalog: product list': ('get', '/api/v1/products/?limit=50', None),
+        'catalog: product search': ('get', '/api/v1/products/?search=product%201&ordering=price', None),
+        'catalog: product detail': ('get', lambda i: f'/api/v1/products/{i % products + 1}/', None),
+        'catalog: supplier list': ('get', '/api/v1/suppliers/', None),
+        'orders: list by stage': ('get', '/api/v1/orders/?stage=Paid&ordering=-created_at&limit=50', None),
+        'orders: create': ('post', '/api/v1/orders/', lambda i: {'stage': 'Draft', 'description': f'Bench {i}'}),
+        'orders: add line': ('post', '/api/v1/order-items/', lambda i: {
+            'order': i % orders + 1, 'product_quantity': i % quantities + 1,
+        }),
+        'nested: warehouse items': ('get', lambda i: f'/api/v1/items/{i % warehouses + 1}/?page_size=50', None),
+        'nested: order items': ('get', lambda i: f'/api/v1/order/{i % orders + 1}/', None),
+        'nested: order items expanded': (
+            'get', lambda i: f'/api/v1/order/{i % orders + 1}/?expand=product_quantity.product', None,
+        ),
+    }
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def make_client():
+    from django.contrib.auth.models import User
+    from rest_framework.test import APIClient
+
+    User.objects.create_user(username=USERNAME, password=PASSWORD)
+    client = APIClient()
+    token = client.post('/api/token/', {'username': USERNAME, 'password': PASSWORD}, format='json').data['access']
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+def run_scenario(client, scenario, requests, warmup, cold=False):
+    from django.db import connection
+    from warehouse.api.caching import get_cache
+
+    method, path, body = scenario
+    send = getattr(client, method)
+
+    def request(i):
+        url = path(i) if callable(path) else path
+        data = body(i) if callable(body) else body
+        response = send(url, data, format='json') if data is not None else send(url)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method.upper()} {url} -> {response.status_code}: {response.content[:200]!r}')
+
+    for i in range(warmup):
+        request(i)
+
+    latencies, counter = [], QueryCounter()
+    with connection.execute_wrapper(counter):
+        started = time.perf_counter()
+        for i in range(warmup, warmup + requests):
+            if cold:
+                get_cache().clear()
+            begin = time.perf_counter()
+            request(i)
+            latencies.append((time.perf_counter() - begin) * 1000)
+        elapsed = time.perf_counter() - started
+    return {
+        'requests': requests,
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'queries_per_request': round(counter.count / requests, 2),
+    }
+
+
+def report(results, baseline=None, threshold=20.0):
+    regressions = []
+    print(f"{'scenario':45} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for name, result in results.items():
+        print(f"{name:45} {result['rps']:8.1f} {result['p50_ms']:9.3f} {result['p95_ms']:9.3f} "
+              f"{result['p99_ms']:9.3f} {result['queries_per_request']:8.2f}")
+        old = (baseline or {}).get(name)
+        if old is None:
+            continue
+        change = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+        print(f"{'':45} {'baseline':>8} p95 {old['p95_ms']:.3f} ms ({change:+.1f}%), "
+              f"queries {old['queries_per_request']:.2f}")
+        if result['queries_per_request'] > old['queries_per_request']:
+            regressions.append(f'{name}: {old["queries_per_request"]} -> {result["queries_per_request"]} queries')
+        if change > threshold:
+            regressions.append(f'{name}: p95 {change:+.1f}%')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suppliers', type=int, default=100)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--items-per-order', type=int, default=3)
+    parser.add_argument('--warehouses', type=int, default=20)
+    parser.add_argument('--warehouse-items', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--only', help='run the scenarios whose name contains this text')
+    parser.add_argument('--save', type=Path, help='write the results as a baseline to this file')
+    parser.add_argument('--compare', type=Path, help='diff against a baseline written by --save')
+    parser.add_argument('--threshold', type=float, default=20.0, help='allowed p95 regression in percent')
+    args = parser.parse_args()
+
+    scale = {
+        'suppliers': args.suppliers,
+        'products': args.products,
+        'orders': args.orders,
+        'items_per_order': args.items_per_order,
+        'warehouses': args.warehouses,
+        'warehouse_items': args.warehouse_items,
+    }
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    if baseline and baseline['scale'] != scale:
+        print(f"warning: baseline was recorded at a different scale: {baseline['scale']}", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(Path(tmp) / 'bench.sqlite3')
+        from django.conf import settings
+        settings.DEBUG = False
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        migrate()
+        seed(days=365, **scale)
+        client = make_client()
+
+        results = {}
+        for name, scenario in scenarios(scale).items():
+            if args.only and args.only not in name:
+                continue
+            cached = name.startswith('catalog:')
+            results[name] = run_scenario(client, scenario, args.requests, args.warmup, cold=cached)
+            if cached:
+                results[f'{name} (warm cache)'] = run_scenario(client, scenario, args.requests, args.warmup)
+
+    regressions = report(results, baseline and baseline['results'], args.threshold)
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps({
+            'scale': scale,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }, indent=2) + '\n')
+    if regressions:
+        print('\nRegressions against the baseline:\n  ' + '\n  '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
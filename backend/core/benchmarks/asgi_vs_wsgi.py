@@ -0,0 +1,80 @@
+"""
+Throughput of the hot read endpoints under WSGI (DRF views) and ASGI
+(async views), measured against two running servers:
+
+    cd backend/core
+    gunicorn core.wsgi -w 1 --threads 8 -b 127.0.0.1:8000
+    uvicorn core.asgi:application --workers 1 --port 8001
+    python -m benchmarks.asgi_vs_wsgi --token <access token> \\
+        --order 1 --warehouse 1 --concurrency 200 --requests 5000
+
+Each server is driven through the endpoints it serves best: the DRF routes on
+WSGI and their /api/v1/async/ twins on ASGI.
+"""
+import argparse
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import percentile
+
+SCENARIOS = {
+    'product list': ('/api/v1/products/', '/api/v1/async/products/'),
+    'order detail': ('/api/v1/orders/{order}/', '/api/v1/async/orders/{order}/'),
+    'warehouse stock': ('/api/v1/warehouses/{warehouse}/stock/', '/api/v1/async/warehouses/{warehouse}/stock/'),
+}
+
+
+def fetch(url, token):
+    request = urllib.request.Request(url, headers={'Authorization': f'Bearer {token}'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, TimeoutError):
+        ok = False
+    return (time.perf_counter() - started) * 1000, ok
+
+
+def run(url, token, requests, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: fetch(url, token), range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, ok in results if ok]
+    return {
+        'rps': len(latencies) / elapsed,
+        'errors': len(results) - len(latencies),
+        'p50': percentile(latencies, 50) if latencies else None,
+        'p95': percentile(latencies, 95) if latencies else None,
+        'p99': percentile(latencies, 99) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wsgi', default='http://127.0.0.1:8000')
+    parser.add_argument('--asgi', default='http://127.0.0.1:8001')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--order', type=int, default=1)
+    parser.add_argument('--warehouse', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<18}{'server':<7}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, paths in SCENARIOS.items():
+        for server, base, path in (('wsgi', args.wsgi, paths[0]), ('asgi', args.asgi, paths[1])):
+            url = base.rstrip('/') + path.format(order=args.order, warehouse=args.warehouse)
+            fetch(url, args.token)  # warm up connections and caches
+            result = run(url, args.token, args.requests, args.concurrency)
+            latencies = ''.join(
+                f'{result[key]:>10.1f}' if result[key] is not None else f"{'-':>10}" for key in ('p50', 'p95', 'p99')
+            )
+            print(f"{name:<18}{server:<7}{result['rps']:>10.1f}{latencies}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
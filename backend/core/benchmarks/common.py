@@ -0,0 +1,140 @@
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path):
+    # Benchmarks always run against a throwaway SQLite file, never the
+    # project database.
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = str(db_path)
+
+    import django
+    django.setup()
+
+
+def migrate(target=None):
+    from django.core.management import call_command
+    args = ['warehouse', target] if target else []
+    call_command('migrate', *args, verbosity=0)
+
+
+def _insert(table, columns, rows, batch_size=10000):
+    from django.db import connection, transaction
+
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+def _columns(table):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        return {column.name for column in connection.introspection.get_table_description(cursor, table)}
+
+
+def _with_defaults(rows, defaults):
+    return lambda: (row + defaults for row in rows())
+
+
+def _insert_catalog(table, columns, rows):
+    # Catalog tables carry change_seq from 0012 on; seeded rows count as one
+    # change, as the migration stamps existing rows. Products and suppliers
+    # carry name_search from 0020 on, which raw inserts must fill themselves.
+    existing = _columns(table)
+    if 'change_seq' in existing:
+        columns, rows = columns + ['change_seq'], (row + (1,) for row in rows)
+    if 'name_search' in existing:
+        from warehouse.models import search_key
+        name = columns.index('name')
+        columns, rows = columns + ['name_search'], (row + (search_key(row[name]),) for row in rows)
+    _insert(table, columns, rows)
+
+
+def seed(suppliers=100, categories=50, products=1000, warehouses=50, warehouse_items=200000,
+         orders=1000000, items_per_order=1, days=730, seed_value=42):
+    # Raw inserts so created_at can be spread over `days` (auto_now_add would
+    # stamp every row with the same instant) and a million rows load in seconds.
+    from django.utils import timezone
+    from warehouse.models import (
+        Supplier, Category, Product, ProductQuantity, Order, OrderItem, Warehouse, WarehouseItem
+    )
+
+    rng = random.Random(seed_value)
+    now = timezone.now()
+    stages = [stage for stage, _ in Order.STAGE_CHOICES]
+    stage_weights = [5, 5, 5, 70, 10, 5]
+
+    _insert_catalog(Supplier._meta.db_table, ['id', 'name'], ((i, f'Supplier {i}') for i in range(1, suppliers + 1)))
+    _insert_catalog(Category._meta.db_table, ['id', 'name'], ((i, f'Category {i}') for i in range(1, categories + 1)))
+    _insert_catalog(Product._meta.db_table, ['id', 'name', 'description', 'price', 'category_id', 'supplier_id'], (
+        (i, f'Product {i}', f'Description of product {i}', Decimal(rng.randint(100, 5000)) / 100,
+         rng.randint(1, categories), rng.randint(1, suppliers))
+        for i in range(1, products + 1)
+    ))
+    _insert_catalog(Warehouse._meta.db_table, ['id', 'name'], ((i, f'Warehouse {i}') for i in range(1, warehouses + 1)))
+
+    order_items = orders * items_per_order
+    quantities = warehouse_items + order_items
+    _insert(ProductQuantity._meta.db_table, ['id', 'product_id', 'quantity'], (
+        (i, rng.randint(1, products), rng.randint(1, 50)) for i in range(1, quantities + 1)
+    ))
+    _insert(WarehouseItem._meta.db_table, ['id', 'warehouse_id', 'product_quantity_id'], (
+        (i, rng.randint(1, warehouses), i) for i in range(1, warehouse_items + 1)
+    ))
+
+    def order_rows():
+        for i in range(1, orders + 1):
+            created_at = now - timedelta(seconds=rng.randint(0, days * 86400))
+            yield i, created_at, created_at, rng.choices(stages, stage_weights)[0], None
+
+    order_columns = ['id', 'created_at', 'updated_at', 'stage', 'description']
+    if 'total' in _columns(Order._meta.db_table):
+        # Stored totals exist from 0006 on; reconcile_order_totals fills them.
+        order_columns += ['total', 'line_count']
+        order_rows = _with_defaults(order_rows, ('0.00', 0))
+    _insert(Order._meta.db_table, order_columns, order_rows())
+    _insert(OrderItem._meta.db_table, ['id', 'order_id', 'product_quantity_id'], (
+        (i, (i - 1) // items_per_order + 1, warehouse_items + i) for i in range(1, order_items + 1)
+    ))
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def median(values):
+    return statistics.median(values)
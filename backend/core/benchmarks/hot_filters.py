@@ -0,0 +1,93 @@
+"""
+Query plans and timings for the dashboard filters, before and after the
+0005_hot_filter_indexes migration.
+
+Seeds a throwaway SQLite database (1M orders by default), measures every
+query at migration 0004, migrates to 0005 and measures again:
+
+    cd backend/core
+    python -m benchmarks.hot_filters --orders 1000000
+"""
+import argparse
+import json
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from benchmarks.common import median, migrate, percentile, seed, setup_django, timed
+
+BEFORE = '0004_stock_ledger'
+AFTER = '0005_hot_filter_indexes'
+
+
+def hot_queries():
+    from django.utils import timezone
+    from warehouse.models import Order, OrderItem, ProductQuantity, WarehouseItem
+
+    since = timezone.now() - timedelta(days=30)
+    # Both runs happen before later migrations add columns to the order and
+    # order item tables, so only the columns of 0004 are selected.
+    orders = Order.objects.only('id', 'created_at', 'updated_at', 'stage', 'description')
+    order_items = OrderItem.objects.only('id', 'order_id', 'product_quantity_id')
+    return [
+        ('latest confirmed orders', orders.filter(stage='Confirmed').order_by('-created_at')[:100], list),
+        ('paid orders in last 30 days', orders.filter(stage='Paid', created_at__gte=since), lambda qs: qs.count()),
+        ('items of one order', order_items.filter(order_id=500), list),
+        ('first page of a warehouse', WarehouseItem.objects.filter(warehouse_id=7).order_by('id')[:100], list),
+        ('product quantity in warehouse', WarehouseItem.objects.filter(warehouse_id=7, product_quantity_id=1234),
+         lambda qs: qs.exists()),
+        ('quantities of one product', ProductQuantity.objects.filter(product_id=42), lambda qs: qs.count()),
+    ]
+
+
+def measure(repeat):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    results = {}
+    for label, queryset, evaluate in hot_queries():
+        evaluate(queryset.all())  # warm the page cache
+        timings = timed(lambda: evaluate(queryset.all()), repeat)
+        results[label] = {
+            'plan': queryset.explain(),
+            'median_ms': round(median(timings), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+        }
+    return results
+
+
+def report(before, after):
+    for label in before:
+        old, new = before[label], after[label]
+        speedup = old['median_ms'] / new['median_ms'] if new['median_ms'] else float('inf')
+        print(f'\n== {label}')
+        print(f"   before: {old['median_ms']:9.3f} ms median, {old['p95_ms']:9.3f} ms p95")
+        print(f"   after:  {new['median_ms']:9.3f} ms median, {new['p95_ms']:9.3f} ms p95  ({speedup:.1f}x)")
+        print('   plan before:\n      ' + old['plan'].replace('\n', '\n      '))
+        print('   plan after:\n      ' + new['plan'].replace('\n', '\n      '))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--warehouse-items', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--json', type=Path, help='also write the results to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(Path(tmp) / 'bench.sqlite3')
+        migrate(BEFORE)
+        seed(orders=args.orders, warehouse_items=args.warehouse_items)
+        before = measure(args.repeat)
+        migrate(AFTER)
+        after = measure(args.repeat)
+
+    report(before, after)
+    if args.json:
+        args.json.write_text(json.dumps({'before': before, 'after': after}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
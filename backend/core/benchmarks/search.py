@@ -0,0 +1,89 @@
+"""
+Latency of product search (warehouse.search) against the unindexed
+icontains scan it replaces, on a throwaway SQLite catalog:
+
+    cd backend/core
+    python -m benchmarks.search --products 100000
+"""
+import argparse
+import json
+import random
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import _insert_catalog, median, migrate, percentile, setup_django, timed
+
+ADJECTIVES = ['Iced', 'Hot', 'Spiced', 'Vanilla', 'Caramel', 'Hazelnut', 'Honey', 'Salted', 'Smoked', 'Double',
+              'Oat', 'Almond', 'Coconut', 'Maple', 'Cinnamon', 'Ginger', 'Dark', 'White', 'Matcha', 'Berry']
+ITEMS = ['Latte', 'Cappuccino', 'Espresso', 'Americano', 'Macchiato', 'Mocha', 'Flat White', 'Cortado', 'Chai',
+         'Croissant', 'Muffin', 'Brownie', 'Cheesecake', 'Bagel', 'Cookie', 'Scone', 'Smoothie', 'Lemonade']
+SIZES = ['Small', 'Regular', 'Large', 'Tall', 'Grande', 'Venti', 'Mini', 'Family']
+
+QUERIES = [
+    ('two-letter prefix', 'Ca'),
+    ('word prefix', 'macch'),
+    ('substring', 'ppucc'),
+    ('two words', 'oat latte'),
+    ('typo', 'capucino'),
+    ('typo, two words', 'hazlenut moca'),
+]
+
+
+def seed_products(count, seed_value=42):
+    from warehouse.models import Product
+
+    rng = random.Random(seed_value)
+    _insert_catalog(Product._meta.db_table, ['id', 'name', 'description', 'price'], (
+        (i, f'{rng.choice(ADJECTIVES)} {rng.choice(ITEMS)} {rng.choice(SIZES)} {i}',
+         f'{rng.choice(ADJECTIVES)} and {rng.choice(ADJECTIVES).lower()} notes', rng.randint(100, 900) / 100)
+        for i in range(1, count + 1)
+    ))
+
+
+def unindexed(text, limit):
+    from django.db.models import Q
+    from warehouse.models import Product
+
+    matches = Q()
+    for word in text.split():
+        matches &= Q(name__icontains=word) | Q(description__icontains=word)
+    return list(Product.objects.filter(matches).order_by('name').values_list('id', flat=True)[:limit])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--json', type=Path, help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(Path(tmp) / 'bench.sqlite3')
+        migrate()
+        seed_products(args.products)
+        from warehouse.search import find_products
+
+        for label, text in QUERIES:
+            found = find_products(text, args.limit)
+            indexed = timed(lambda: find_products(text, args.limit), args.repeat)
+            scan = timed(lambda: unindexed(text, args.limit), args.repeat)
+            results[label] = {
+                'query': text,
+                'found': len(found),
+                'median_ms': round(median(indexed), 3),
+                'p95_ms': round(percentile(indexed, 95), 3),
+                'icontains_median_ms': round(median(scan), 3),
+            }
+
+    print(f"{'query':20} {'text':16} {'found':>6} {'median ms':>10} {'p95 ms':>9} {'icontains ms':>13}")
+    for label, result in results.items():
+        print(f"{label:20} {result['query']:16} {result['found']:6} {result['median_ms']:10.3f} "
+              f"{result['p95_ms']:9.3f} {result['icontains_median_ms']:13.3f}")
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.db import connections
+
+from core import metrics
+
+slow_log = logging.getLogger('core.slow_requests')
+
+
+class ApiSessionMiddleware(SessionMiddleware):
+    # Token-authenticated API paths get an empty, never-saved session, so no
+    # session row is read or written and request.user resolves without a query.
+    def is_sessionless(self, request):
+        return request.path.startswith(settings.SESSIONLESS_PATH_PREFIXES)
+
+    def process_request(self, request):
+        if self.is_sessionless(request):
+            request.session = self.SessionStore()
+        else:
+            super().process_request(request)
+
+    def process_response(self, request, response):
+        if self.is_sessionless(request):
+            return response
+        return super().process_response(request, response)
+
+
+class MetricsMiddleware:
+    # Every request feeds the count, wall-time and size histograms, which cost
+    # a clock read and a lock. A METRICS_SAMPLE_RATE share of requests also
+    # counts its queries and times them and its serializers. Requests slower
+    # than METRICS_SLOW_REQUEST_MS are logged. Works in either handler mode,
+    # so it does not push ASGI requests through a thread.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened before this module was loaded.
+        for connection in connections.all():
+            metrics.install(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if request.path == settings.METRICS_PATH:
+            return self.get_response(request)
+        sample, token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_sample.reset(token)
+        return self.finish(request, response, sample, started)
+
+    async def __acall__(self, request):
+        if request.path == settings.METRICS_PATH:
+            return await self.get_response(request)
+        sample, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_sample.reset(token)
+        return self.finish(request, response, sample, started)
+
+    def start(self):
+        sample = metrics.Sample() if random.random() < settings.METRICS_SAMPLE_RATE else None
+        return sample, metrics.current_sample.set(sample), time.perf_counter()
+
+    def finish(self, request, response, sample, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        metrics.REQUESTS.inc(view, request.method, str(response.status_code))
+        metrics.REQUEST_SECONDS.observe(elapsed, view)
+        if not response.streaming:
+            metrics.RESPONSE_BYTES.observe(len(response.content), view)
+        if sample is not None:
+            metrics.DB_QUERIES.observe(sample.queries, view)
+            metrics.DB_SECONDS.observe(sample.db_seconds, view)
+            metrics.SERIALIZER_SECONDS.observe(sample.serializer_seconds, view)
+
+        if elapsed * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+            detail = f', {sample.queries} queries in {sample.db_seconds * 1000:.1f} ms' if sample else ''
+            slow_log.warning('Slow request: %s %s (%s) took %.1f ms%s',
+                             request.method, request.get_full_path(), view, elapsed * 1000, detail)
+        return response
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import importlib.util
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,8 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.ApiSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -81,18 +84,87 @@ WSGI_APPLICATION = 'core.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+#
+# DB_ENGINE=postgresql selects the PostgreSQL profile, configured through the
+# POSTGRES_* variables. Anything else uses a tuned single-node SQLite file.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    # Django's native pool (psycopg[pool]) cannot be combined with persistent
+    # connections, so CONN_MAX_AGE only applies when DB_POOL is off.
+    DB_POOL = os.environ.get('DB_POOL', 'true').lower() in ('1', 'true', 'yes')
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'cafapp'),
+            'USER': os.environ.get('POSTGRES_USER', 'cafapp'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 20)),
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                },
+            } if DB_POOL else {},
+        },
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # sqlite3's timeout is the busy_timeout: writers wait for the
+                # lock instead of failing with "database is locked".
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+                # Take the write lock at BEGIN so concurrent writers queue on
+                # the busy timeout instead of failing on a lock upgrade.
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA cache_size=-64000;'
+                    'PRAGMA mmap_size=268435456;'
+                ),
+            },
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        },
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
 
-DATABASES = {
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-        'TEST': {
-            'NAME': BASE_DIR / 'test_db.sqlite3',
-        }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Catalog responses (products, categories, suppliers). Set CATALOG_CACHE_URL
+    # to a redis:// URL to share it between workers; requires the redis package.
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CATALOG_CACHE_URL'],
+    } if os.environ.get('CATALOG_CACHE_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
     },
-
 }
 
+CATALOG_CACHE_ALIAS = 'catalog'
+
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -136,12 +208,66 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Authentication
+#
+# JWT_AUTH_MODE=stateless trusts the signed token claims instead of loading the
+# User row on every request; deactivating a user then takes effect when their
+# access token expires. Verified tokens are remembered for a short while.
+
+JWT_AUTH_MODE = os.environ.get('JWT_AUTH_MODE', 'database')
+
+JWT_AUTHENTICATION_CLASS = {
+    'database': 'rest_framework_simplejwt.authentication.JWTAuthentication',
+    'stateless': 'warehouse.api.authentication.CachedJWTStatelessUserAuthentication',
+}[JWT_AUTH_MODE]
+
+JWT_VERIFIED_TOKEN_CACHE_SIZE = int(os.environ.get('JWT_VERIFIED_TOKEN_CACHE_SIZE', 10000))
+
+JWT_VERIFIED_TOKEN_TTL = int(os.environ.get('JWT_VERIFIED_TOKEN_TTL', 60))
+
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'warehouse.api.authentication.StaffClaimsTokenObtainPairSerializer',
+}
+
+# Request metrics, served in Prometheus text format at METRICS_PATH. Query
+# and serializer timing is collected for METRICS_SAMPLE_RATE of requests.
+METRICS_PATH = '/metrics'
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.05))
+METRICS_SLOW_REQUEST_MS = float(os.environ.get('METRICS_SLOW_REQUEST_MS', 1000))
+
+# Change feed at /api/v1/events/. The in-process broker only reaches streams
+# held by the same worker; point EVENT_BROKER at a shared broker to fan out
+# across processes.
+EVENT_BROKER = os.environ.get('EVENT_BROKER', 'warehouse.events.InProcessBroker')
+EVENT_STREAM_HEARTBEAT = float(os.environ.get('EVENT_STREAM_HEARTBEAT', 15))
+
+# Background jobs (`manage.py run_workers`). Idle workers poll every
+# JOB_POLL_INTERVAL seconds; a running job whose worker has not checked in for
+# JOB_STALE_AFTER seconds is requeued, up to the job's max_attempts.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+JOB_STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', 300))
+
+# Requests under these prefixes are token authenticated and skip sessions.
+SESSIONLESS_PATH_PREFIXES = ('/api/v1/',)
+
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        JWT_AUTHENTICATION_CLASS,
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+    ),
+    'DEFAULT_FILTER_BACKENDS': (
+        'warehouse.api.filters.QueryParamFilterBackend',
+        'rest_framework.filters.OrderingFilter',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        # Columnar list payloads: Accept: application/vnd.cafapp.compact+json or ?format=compact.
+        'warehouse.api.renderers.CompactJSONRenderer',
+    ],
     'PAGE_SIZE': 100,
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
         'TEST_REQUEST_RENDERER_CLASSES': [
@@ -149,4 +275,7 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
         'rest_framework.renderers.TemplateHTMLRenderer'
     ],
-}
\ No newline at end of file
+}
+
+if importlib.util.find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('warehouse.api.renderers.MessagePackRenderer')
@@ -7,6 +7,8 @@ from rest_framework_simplejwt.views import (
 )
 from rest_framework.schemas import get_schema_view
 
+from core.metrics import metrics_view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -21,4 +23,5 @@ urlpatterns = [
         name="openapi-schema",
     ),
     path('api/v1/', include('warehouse.api.urls', namespace='warehouse')),
+    path('metrics', metrics_view, name='metrics'),
 ]
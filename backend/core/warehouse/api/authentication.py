@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, raw_token):
+        with self.lock:
+            entry = self.entries.get(raw_token)
+            if entry is None:
+                return None
+            token, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[raw_token]
+                return None
+            self.entries.move_to_end(raw_token)
+            return token
+
+    def set(self, raw_token, token, expires_at):
+        with self.lock:
+            self.entries[raw_token] = (token, expires_at)
+            self.entries.move_to_end(raw_token)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+verified_tokens = VerifiedTokenCache(settings.JWT_VERIFIED_TOKEN_CACHE_SIZE)
+
+
+class CachedJWTStatelessUserAuthentication(JWTStatelessUserAuthentication):
+    # Builds a TokenUser from the signed claims instead of loading the User
+    # row, and skips signature verification for tokens verified in the last
+    # JWT_VERIFIED_TOKEN_TTL seconds. A cached token never outlives its exp.
+    def get_validated_token(self, raw_token):
+        token = verified_tokens.get(raw_token)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            expires_at = min(token['exp'], time.time() + settings.JWT_VERIFIED_TOKEN_TTL)
+            verified_tokens.set(raw_token, token, expires_at)
+        return token
+
+
+class StaffClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    # TokenUser reads is_staff and is_superuser from the claims, so stateless
+    # mode needs them in the token for IsAdminUser to pass. Refreshed access
+    # tokens copy them; a change to either takes effect on the next login.
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
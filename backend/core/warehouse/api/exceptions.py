@@ -0,0 +1,27 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The resource was changed by another request.'
+    default_code = 'conflict'
+
+    def __init__(self, detail=None, code=None, data=None):
+        # APIException turns every value in `detail` into a string; `data` is
+        # added to the body as it is, for values clients use as ids.
+        super().__init__(detail, code)
+        if data:
+            self.detail = {**self.detail, **data}
+
+
+class Gone(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'The requested data is no longer available.'
+    default_code = 'gone'
+
+
+class UnprocessableEntity(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'The request could not be processed.'
+    default_code = 'unprocessable'
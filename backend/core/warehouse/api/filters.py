@@ -0,0 +1,110 @@
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from warehouse.models import search_key
+
+
+def parse_moment(value):
+    # Dates mean midnight; naive values are taken in the current time zone.
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            date = parse_date(value)
+            moment = datetime.combine(date, time.min) if date else None
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValueError('Enter a valid date or datetime (ISO 8601).')
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+def parse_int(value):
+    # isdecimal(), not isdigit(): '²' is a digit that int() rejects.
+    if not value.isdecimal():
+        raise ValueError('A valid integer is required.')
+    return int(value)
+
+
+def parse_decimal(value):
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        number = None
+    # Decimal() also accepts NaN and Infinity, which the database cannot compare.
+    if number is None or not number.is_finite():
+        raise ValueError('A valid number is required.')
+    return number
+
+
+class Filter:
+    # One query parameter mapped onto one ORM lookup.
+    def __init__(self, lookup, parse=str):
+        self.lookup = lookup
+        self.parse = parse
+
+    def filter(self, queryset, value):
+        return queryset.filter(**{self.lookup: self.parse(value)})
+
+
+class InFilter(Filter):
+    # Comma-separated values, e.g. `?stage=Paid,Delivered`.
+    def __init__(self, lookup, parse=str, choices=None):
+        super().__init__(lookup, parse)
+        self.choices = choices
+
+    def filter(self, queryset, value):
+        values = [self.parse(part) for part in value.split(',') if part]
+        if self.choices is not None:
+            invalid = [part for part in values if part not in self.choices]
+            if invalid:
+                raise ValueError(f'Choose from: {", ".join(self.choices)}.')
+        return queryset.filter(**{f'{self.lookup}__in': values})
+
+
+# Sorts after any character a name can contain, closing the prefix range.
+PREFIX_END = '\U0010ffff'
+
+
+def prefix_match(lookup, prefix):
+    # Rows whose `lookup` starts with `prefix`, in a form the index on it can
+    # serve. SQLite compares code points, so a range closed by PREFIX_END
+    # works; under a linguistic collation (PostgreSQL's usual default) it
+    # does not, and LIKE 'prefix%' uses the varchar_pattern_ops index instead.
+    if connection.vendor == 'sqlite':
+        return Q(**{f'{lookup}__gte': prefix, f'{lookup}__lt': prefix + PREFIX_END})
+    return Q(**{f'{lookup}__startswith': prefix})
+
+
+class PrefixSearchFilter(Filter):
+    # Case-insensitive prefix match on a SearchKeyField, e.g. name_search.
+    def filter(self, queryset, value):
+        field = queryset.model._meta.get_field(self.lookup)
+        prefix = search_key(value.strip())[:field.max_length]
+        if not prefix:
+            return queryset
+        return queryset.filter(prefix_match(self.lookup, prefix))
+
+
+class QueryParamFilterBackend(BaseFilterBackend):
+    # Applies the view's `filter_fields` ({param: Filter}) for every parameter
+    # present in the query string; unknown parameters are ignored.
+    def filter_queryset(self, request, queryset, view):
+        errors = {}
+        for param, query_filter in getattr(view, 'filter_fields', {}).items():
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                queryset = query_filter.filter(queryset, value)
+            except ValueError as exc:
+                errors[param] = [str(exc)]
+        if errors:
+            raise ValidationError(errors)
+        return queryset
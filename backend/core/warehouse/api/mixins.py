@@ -0,0 +1,262 @@
+import copy
+import logging
+from contextlib import contextmanager
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as ModelValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from warehouse import changes
+from warehouse.models import SearchKeyField
+
+logger = logging.getLogger(__name__)
+
+# Database messages name tables and constraints, so clients only get this.
+CONFLICT_MESSAGE = 'This row conflicts with existing data.'
+
+
+def _row_id(row):
+    pk = row.get('id') if isinstance(row, dict) else None
+    return pk if isinstance(pk, int) else None
+
+
+def parse_fields(request):
+    if request is None or request.method not in SAFE_METHODS:
+        return []
+    return [name for name in request.query_params.get('fields', '').split(',') if name]
+
+
+def parse_expand(request, serializer_class):
+    if request is None or request.method not in SAFE_METHODS:
+        return []
+    requested = [path for path in request.query_params.get('expand', '').split(',') if path]
+    fields = parse_fields(request)
+    if fields:
+        # Expanding a field that is not rendered would only cost a join.
+        requested = [path for path in requested if path.partition('.')[0] in fields]
+    return serializer_class.expandable_paths(requested)
+
+
+def with_related(queryset, expand):
+    # Forward foreign keys are joined in; anything that crosses a reverse
+    # relation is fetched with one extra query per level instead of per row.
+    select, prefetch = [], []
+    for path in expand:
+        lookup = path.replace('.', '__')
+        if _is_forward_path(queryset.model, path):
+            select.append(lookup)
+        else:
+            prefetch.append(lookup)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def with_fields(queryset, fields):
+    # Narrows the SELECT to the requested columns. Reverse relations and names
+    # that are not model fields are left to the serializer.
+    names = []
+    for name in fields:
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete:
+            names.append(name)
+    return queryset.only(*names) if names else queryset
+
+
+def _is_forward_path(model, path):
+    for name in path.split('.'):
+        field = model._meta.get_field(name)
+        if not field.concrete or not (field.many_to_one or field.one_to_one):
+            return False
+        model = field.related_model
+    return True
+
+
+@contextmanager
+def bulk_transaction(instances=()):
+    # Constraint violations that per-row validation cannot see, such as
+    # duplicates inside one payload, roll the batch back and become a 400
+    # aligned with the payload, like the validation errors.
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as exc:
+        logger.warning('Bulk write rolled back: %s', exc)
+        conflicts = _conflicting_rows(instances)
+        if not conflicts:
+            raise ValidationError({'non_field_errors': [CONFLICT_MESSAGE]}) from exc
+        raise ValidationError([
+            {'non_field_errors': [CONFLICT_MESSAGE]} if index in conflicts else {} for index in range(len(instances))
+        ]) from exc
+
+
+def _conflicting_rows(instances):
+    # The database does not say which row broke a constraint, so the unique
+    # checks are repeated per row, against the rest of the payload and against
+    # the stored rows. Only runs once a batch has already failed.
+    conflicts, seen = set(), set()
+    for index, instance in enumerate(instances):
+        for fields in _unique_field_sets(type(instance)):
+            values = tuple(getattr(instance, instance._meta.get_field(name).attname) for name in fields)
+            if None in values:
+                continue
+            if (fields, values) in seen:
+                conflicts.add(index)
+            seen.add((fields, values))
+        try:
+            instance.validate_unique()
+            instance.validate_constraints()
+        except ModelValidationError:
+            conflicts.add(index)
+    return conflicts
+
+
+def _unique_field_sets(model):
+    opts = model._meta
+    sets = [(field.name,) for field in opts.local_fields if field.unique and not field.primary_key]
+    sets.extend(tuple(fields) for fields in opts.unique_together)
+    sets.extend(tuple(constraint.fields) for constraint in opts.total_unique_constraints if constraint.fields)
+    return sets
+
+
+class BulkModelMixin:
+    # List-payload create/update/delete on `<prefix>/bulk/`. Every row is
+    # validated first; errors come back as a list aligned with the payload, and
+    # a valid batch is written with bulk_create/bulk_update in one transaction.
+    bulk_max_size = 1000
+
+    def get_bulk_data(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if len(request.data) > self.bulk_max_size:
+            raise ValidationError({'non_field_errors': [f'Ensure this list has no more than {self.bulk_max_size} items.']})
+        return request.data
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        rows = self.get_bulk_data(request)
+        serializers = [self.get_serializer(data=row) for row in rows]
+        errors = [{} if serializer.is_valid() else serializer.errors for serializer in serializers]
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        instances = [model(**serializer.validated_data) for serializer in serializers]
+        with bulk_transaction(instances):
+            instances = self.perform_bulk_create(instances)
+        serializer = self.get_serializer(instances, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        rows = self.get_bulk_data(request)
+        instances = self.get_queryset().in_bulk([_row_id(row) for row in rows if _row_id(row) is not None])
+
+        serializers, errors = [], []
+        for row in rows:
+            instance = instances.get(_row_id(row))
+            if instance is None:
+                serializers.append(None)
+                errors.append({'id': ['Not found.']})
+                continue
+            serializer = self.get_serializer(instance, data=row, partial=True)
+            serializers.append(serializer)
+            errors.append({} if serializer.is_valid() else serializer.errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        updates, fields = [], set()
+        for serializer in serializers:
+            original = copy.copy(serializer.instance)
+            for attr, value in serializer.validated_data.items():
+                setattr(serializer.instance, attr, value)
+                fields.add(attr)
+            updates.append((original, serializer.instance))
+        fields.update(self._touch_auto_now([instance for _, instance in updates]))
+        fields.update(self._touch_search_keys([instance for _, instance in updates], fields))
+
+        with bulk_transaction([instance for _, instance in updates]):
+            self.perform_bulk_update(updates, sorted(fields))
+        serializer = self.get_serializer([instance for _, instance in updates], many=True)
+        return Response(serializer.data)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request):
+        ids = self.get_bulk_data(request)
+        if not all(isinstance(pk, int) for pk in ids):
+            raise ValidationError({'non_field_errors': ['Expected a list of ids.']})
+        with bulk_transaction():
+            self.perform_bulk_destroy(self.get_queryset().filter(pk__in=ids))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def perform_bulk_create(self, instances):
+        return self.get_queryset().model.objects.bulk_create(instances)
+
+    def perform_bulk_update(self, updates, fields):
+        if fields:
+            self.get_queryset().model.objects.bulk_update([instance for _, instance in updates], fields)
+
+    def perform_bulk_destroy(self, queryset):
+        queryset.delete()
+
+    def _touch_auto_now(self, instances):
+        # bulk_update() skips Model.save(), so auto_now fields are set here.
+        fields = [field for field in self.get_queryset().model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+        now = timezone.now()
+        for instance in instances:
+            for field in fields:
+                setattr(instance, field.attname, now)
+        return [field.name for field in fields]
+
+    def _touch_search_keys(self, instances, changed):
+        # Nor does it fill SearchKeyFields; they follow their source field.
+        fields = [
+            field for field in self.get_queryset().model._meta.concrete_fields
+            if isinstance(field, SearchKeyField) and field.source in changed
+        ]
+        for instance in instances:
+            for field in fields:
+                field.pre_save(instance, False)
+        return [field.name for field in fields]
+
+
+class ChangeTrackingMixin:
+    # Stamps bulk writes for /sync/; single saves and deletes are covered by
+    # the signals in warehouse.signals, which bulk_create/bulk_update skip.
+    def perform_bulk_create(self, instances):
+        instances = super().perform_bulk_create(instances)
+        changes.changed(self.get_queryset().model, [instance.pk for instance in instances])
+        return instances
+
+    def perform_bulk_update(self, updates, fields):
+        super().perform_bulk_update(updates, fields)
+        changes.changed(self.get_queryset().model, [instance.pk for _, instance in updates])
+
+
+class ExpandMixin:
+    # ?expand= joins related objects in; ?fields= trims both the response and
+    # the SELECT to the named fields.
+    def get_expand(self):
+        return parse_expand(self.request, self.get_serializer_class())
+
+    def get_fields(self):
+        return parse_fields(self.request)
+
+    def get_queryset(self):
+        return with_fields(with_related(super().get_queryset(), self.get_expand()), self.get_fields())
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        context['fields'] = self.get_fields()
+        return context
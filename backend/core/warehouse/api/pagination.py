@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination
+
+
+class NestedItemCursorPagination(CursorPagination):
+    # Keyset pagination for the nested item endpoints. The queryset is already
+    # filtered by its parent (warehouse or order), so ordering by id walks the
+    # (parent_id, id) index and every page costs the same however deep it is.
+    ordering = ('id',)
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,43 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def to_columns(data):
+    # Lists of objects become {'columns': [...], 'rows': [[...], ...]}, so every
+    # key is sent once per page rather than once per row. Paginated envelopes
+    # keep their count/next/previous; anything else passes through unchanged.
+    # Rows need not share keys: the columns are every key seen, in the order
+    # first seen, and a row without one gets null there.
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return {**{key: value for key, value in data.items() if key != 'results'}, **to_columns(data['results'])}
+    if isinstance(data, list) and all(isinstance(row, dict) for row in data):
+        columns = list(dict.fromkeys(key for row in data for key in row))
+        return {'columns': columns, 'rows': [[row.get(column) for column in columns] for row in data]}
+    return data
+
+
+class CompactJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.cafapp.compact+json'
+    format = 'compact'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(to_columns(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    # Columnar layout as above, packed as MessagePack. Only listed in the
+    # renderer settings when the msgpack package is installed.
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        encoder = JSONRenderer.encoder_class()
+        return msgpack.packb(to_columns(data), default=encoder.default)
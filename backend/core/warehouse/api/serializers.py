@@ -1,51 +1,290 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils.module_loading import import_string
 from rest_framework import serializers
-from warehouse.models import Supplier, Category, Product, ProductQuantity, Order, OrderItem, Warehouse, WarehouseItem
+
+from core import metrics
+from warehouse import events, jobs, stages
+from warehouse.api.filters import parse_decimal
+from warehouse.orders import CENT
+from warehouse.models import (
+    Supplier, Category, Product, ProductQuantity, Order, OrderItem, Warehouse, WarehouseItem, StockLevel,
+    ArchivedOrder, ArchivedOrderItem, Job,
+)
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with metrics.serializing():
+            return super().data
+
+
+class ExpandableModelSerializer(serializers.ModelSerializer):
+    # `expandable_fields` maps a field name to the serializer (or its name in
+    # this module) that replaces the primary key when the client asks for it
+    # with ?expand=. Dotted paths expand nested serializers in turn. `fields`
+    # (or ?fields= via the context) keeps only the named top-level fields.
+    expandable_fields = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = getattr(cls, 'Meta', None)
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with metrics.serializing():
+            return super().data
+
+    def __init__(self, *args, expand=None, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if expand is None:
+            expand = self.context.get('expand', ())
+        if fields is None:
+            fields = self.context.get('fields', ())
+        for name, children in split_expand(expand).items():
+            if name not in self.expandable_fields:
+                continue
+            serializer_class, options = self.get_expandable_field(name)
+            self.fields[name] = serializer_class(read_only=True, expand=children, **options)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_expandable_field(cls, name):
+        serializer_class, options = cls.expandable_fields[name], {}
+        if isinstance(serializer_class, tuple):
+            serializer_class, options = serializer_class
+        if isinstance(serializer_class, str):
+            serializer_class = import_string(f'{cls.__module__}.{serializer_class}')
+        return serializer_class, options
+
+    @classmethod
+    def expandable_paths(cls, expand):
+        paths = []
+        for name, children in split_expand(expand).items():
+            if name not in cls.expandable_fields:
+                continue
+            serializer_class, _ = cls.get_expandable_field(name)
+            paths.append(name)
+            paths.extend(f'{name}.{path}' for path in serializer_class.expandable_paths(children))
+        return paths
+
+
+def split_expand(expand):
+    tree = {}
+    for path in expand:
+        name, _, rest = path.partition('.')
+        children = tree.setdefault(name, [])
+        if rest:
+            children.append(rest)
+    return tree
 
 
-class SupplierSerializer(serializers.ModelSerializer):
+class SupplierSerializer(ExpandableModelSerializer):
     class Meta:
         model = Supplier
-        fields = '__all__'
+        # change_seq is stamped for /sync/ after the row is saved and would be stale here.
+        exclude = ('change_seq',)
 
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(ExpandableModelSerializer):
     class Meta:
         model = Category
-        fields = '__all__'
+        exclude = ('change_seq',)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(ExpandableModelSerializer):
+    expandable_fields = {
+        'category': 'CategorySerializer',
+        'supplier': 'SupplierSerializer',
+    }
+
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('change_seq',)
 
 
-class ProductQuantitySerializer(serializers.ModelSerializer):
+class ProductQuantitySerializer(ExpandableModelSerializer):
+    expandable_fields = {
+        'product': 'ProductSerializer',
+    }
+
     class Meta:
         model = ProductQuantity
         fields = '__all__'
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(ExpandableModelSerializer):
+    expandable_fields = {
+        'items': ('OrderItemSerializer', {'many': True}),
+    }
+
     class Meta:
         model = Order
-        fields = '__all__'
+        exclude = ('idempotency_user', 'idempotency_fingerprint')
+        read_only_fields = ('total', 'line_count', 'idempotency_key')
+
+    def validate_stage(self, value):
+        if self.instance is None and value not in ('Draft', 'Confirmed'):
+            raise serializers.ValidationError('New orders start as Draft or Confirmed.')
+        if self.instance is not None and not stages.can_transition(self.instance.stage, value):
+            raise serializers.ValidationError(f'Cannot move an order from {self.instance.stage} to {value}.')
+        return value
+
+    def validate_warehouse(self, value):
+        # Reserved stock stays in the warehouse it was taken from.
+        if self.instance is not None and value != self.instance.warehouse and self.instance.stage != 'Draft':
+            raise serializers.ValidationError('The warehouse can only be changed while the order is a Draft.')
+        return value
+
+    def update(self, instance, validated_data):
+        # Writes only the fields sent. The stage moves through stages.move and
+        # the totals through warehouse.orders, both as conditional UPDATEs
+        # that a full save() of this (older) instance would undo.
+        validated_data.pop('stage', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
+
+
+class OrderLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
 
+class OrderCreateSerializer(OrderSerializer):
+    # An order and its lines in one request. Products are checked with a
+    # single query and the lines are written with bulk_create; the order is
+    # always stored as a Draft and the view moves it on when asked to.
+    max_lines = 500
+    lines = OrderLineSerializer(many=True, write_only=True, required=False)
+
+    def validate_lines(self, lines):
+        if len(lines) > self.max_lines:
+            raise serializers.ValidationError(f'Ensure there are no more than {self.max_lines} lines.')
+        product_ids = {line['product'] for line in lines}
+        prices = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'price'))
+        missing = sorted(product_ids - set(prices))
+        if missing:
+            raise serializers.ValidationError(f'Unknown products: {", ".join(map(str, missing))}.')
+        return [{**line, 'price': prices[line['product']]} for line in lines]
+
+    def create(self, validated_data):
+        lines = validated_data.pop('lines', [])
+        validated_data['stage'] = 'Draft'
+        total = sum((line['price'] * line['quantity'] for line in lines), Decimal('0'))
+        with transaction.atomic():
+            order = Order.objects.create(**validated_data, total=total.quantize(CENT), line_count=len(lines))
+            product_quantities = ProductQuantity.objects.bulk_create(
+                ProductQuantity(product_id=line['product'], quantity=line['quantity']) for line in lines
+            )
+            order_items = OrderItem.objects.bulk_create(
+                OrderItem(order=order, product_quantity=product_quantity, price=line['price'])
+                for product_quantity, line in zip(product_quantities, lines)
+            )
+            events.order_items_changed(order_items, 'created')
+        return order
+
+
+class OrderItemSerializer(ExpandableModelSerializer):
+    expandable_fields = {
+        'order': 'OrderSerializer',
+        'product_quantity': 'ProductQuantitySerializer',
+    }
 
-class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = '__all__'
+        read_only_fields = ('price',)
 
 
-class WarehouseSerializer(serializers.ModelSerializer):
+class ArchivedOrderItemSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = ArchivedOrderItem
+        exclude = ('order',)
+
+
+class ArchivedOrderSerializer(ExpandableModelSerializer):
+    # Read-only stand-in for OrderSerializer once an order is archived; its
+    # lines come inline since /order/{id}/ only serves live ones.
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        exclude = ('idempotency_user', 'idempotency_fingerprint')
+
+
+class WarehouseSerializer(ExpandableModelSerializer):
     class Meta:
         model = Warehouse
-        fields = '__all__'
+        exclude = ('change_seq',)
+
 
+class WarehouseItemSerializer(ExpandableModelSerializer):
+    expandable_fields = {
+        'product_quantity': 'ProductQuantitySerializer',
+        'warehouse': 'WarehouseSerializer',
+    }
 
-class WarehouseItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = WarehouseItem
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class StockLevelSerializer(ExpandableModelSerializer):
+    expandable_fields = {
+        'product': 'ProductSerializer',
+        'warehouse': 'WarehouseSerializer',
+    }
+
+    class Meta:
+        model = StockLevel
+        fields = ('warehouse', 'product', 'quantity')
+
+
+class JobSerializer(ExpandableModelSerializer):
+    class Meta:
+        model = Job
+        fields = '__all__'
+        read_only_fields = (
+            'status', 'progress', 'total', 'result', 'checkpoint', 'error', 'attempts', 'worker', 'created_by',
+            'started_at', 'heartbeat_at', 'finished_at',
+        )
+
+    def validate_kind(self, value):
+        if value not in jobs.HANDLERS:
+            raise serializers.ValidationError(f'Choose from: {", ".join(sorted(jobs.HANDLERS))}.')
+        return value
+
+    def validate_params(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Expected an object.')
+        return value
+
+    def validate(self, attrs):
+        _, required = jobs.HANDLERS[attrs['kind']]
+        missing = [name for name in required if name not in attrs.get('params', {})]
+        if missing:
+            raise serializers.ValidationError({'params': [f'Missing: {", ".join(missing)}.']})
+        if attrs['kind'] == 'change_prices':
+            self.validate_percent(attrs['params']['percent'])
+        return attrs
+
+    def validate_percent(self, value):
+        # Checked here rather than when the job runs: NaN or Infinity would
+        # otherwise reach the prices.
+        try:
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError
+            percent = parse_decimal(str(value))
+        except ValueError:
+            raise serializers.ValidationError({'params': ['percent must be a finite number.']})
+        if percent < -100:
+            raise serializers.ValidationError({'params': ['percent cannot be below -100.']})
@@ -0,0 +1,52 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from warehouse import changes
+from warehouse.api.exceptions import Gone
+from warehouse.api.serializers import CategorySerializer, ProductSerializer, SupplierSerializer, WarehouseSerializer
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 5000
+
+SERIALIZERS = {
+    'suppliers': SupplierSerializer,
+    'categories': CategorySerializer,
+    'products': ProductSerializer,
+    'warehouses': WarehouseSerializer,
+}
+
+
+def _parse_count(params, name, default, maximum=None):
+    value = params.get(name)
+    if value is None:
+        return default
+    # isdecimal(), not isdigit(): '²' is a digit that int() rejects.
+    if not value.isdecimal():
+        raise ValidationError({name: ['A valid integer is required.']})
+    value = int(value)
+    return min(value, maximum) if maximum else value
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync(request):
+    # Catalog rows changed and deleted since the client's token. Start with no
+    # token (or 0) for a full copy, then pass back the returned token; while
+    # has_more is true, call again straight away with the new token.
+    since = _parse_count(request.query_params, 'since', 0)
+    limit = max(_parse_count(request.query_params, 'limit', DEFAULT_LIMIT, MAX_LIMIT), 1)
+    if since and since < changes.get_counter(changes.PRUNED):
+        raise Gone('This token predates the retained deletions; sync again without a token.')
+
+    token, rows, removed, has_more = changes.changes_since(since, limit)
+    return Response({
+        'token': str(token),
+        'has_more': has_more,
+        'changed': {
+            name: SERIALIZERS[name](rows[name], many=True).data if name in rows else []
+            for name in SERIALIZERS
+        },
+        'deleted': removed,
+    })
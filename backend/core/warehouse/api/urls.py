@@ -1,8 +1,9 @@
-from django.urls import path
+from django.urls import path, re_path
 from rest_framework.routers import DefaultRouter
 
 app_name = 'warehouse'
 
+from warehouse.api import async_views, export, sync
 from warehouse.api.views import (
     SupplierViewSet, 
     CategoryViewSet, 
@@ -12,6 +13,8 @@ from warehouse.api.views import (
     OrderItemViewSet, 
     WarehouseViewSet, 
     WarehouseItemViewSet,
+    ReportViewSet,
+    JobViewSet,
     warehouse_items,
     order_items
 )
@@ -26,10 +29,18 @@ router.register(r'orders', OrderViewSet)
 router.register(r'order-items', OrderItemViewSet)
 router.register(r'warehouses', WarehouseViewSet)
 router.register(r'warehouse-items', WarehouseItemViewSet)
+router.register(r'reports', ReportViewSet, basename='report')
+router.register(r'jobs', JobViewSet)
 
 urlpatterns = [
     path('items/<int:warehouse_pk>/', warehouse_items, name='warehouse-items'),
     path('order/<int:order_pk>/', order_items, name='order-items'),
+    re_path(r'^export/(?P<dataset>orders|order-items|stock)\.(?P<fmt>csv|jsonl)$', export.export, name='export'),
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/orders/<int:pk>/', async_views.order_detail, name='async-order-detail'),
+    path('async/warehouses/<int:pk>/stock/', async_views.warehouse_stock, name='async-warehouse-stock'),
+    path('events/', async_views.event_stream, name='events'),
+    path('sync/', sync.sync, name='sync'),
 ]
 
 urlpatterns += router.urls
\ No newline at end of file
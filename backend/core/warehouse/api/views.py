@@ -1,90 +1,580 @@
-from rest_framework import viewsets
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import IsAuthenticated
+import copy
+import hashlib
+import json
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.http import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
 
-from warehouse.models import Supplier, Category, Product, ProductQuantity, Order, OrderItem, Warehouse, WarehouseItem
+from warehouse import archive, events, orders, reports, search, stages, stock
+from warehouse.api.caching import CatalogCacheMixin
+from warehouse.api.exceptions import Conflict, UnprocessableEntity
+from warehouse.api.filters import Filter, InFilter, PrefixSearchFilter, parse_decimal, parse_int, parse_moment
+from warehouse.api.mixins import BulkModelMixin, ChangeTrackingMixin, ExpandMixin, parse_expand, parse_fields, with_fields, with_related
+from warehouse.api.pagination import NestedItemCursorPagination
+from warehouse.models import (
+    Supplier, Category, Product, ProductQuantity, Order, OrderItem, Warehouse, WarehouseItem, StockLevel, SalesRollup,
+    ArchivedOrder, Job,
+)
 from warehouse.api.serializers import (
     SupplierSerializer, 
     CategorySerializer, 
     ProductSerializer, 
     ProductQuantitySerializer, 
     OrderSerializer, 
+    OrderCreateSerializer,
+    ArchivedOrderSerializer,
+    JobSerializer,
     OrderItemSerializer, 
     WarehouseSerializer, 
-    WarehouseItemSerializer
+    WarehouseItemSerializer,
+    StockLevelSerializer
 )
 
 
 
-class SupplierViewSet(viewsets.ModelViewSet):
+def lock_lines(order_ids):
+    try:
+        stages.lock_lines(order_ids)
+    except stages.LinesLocked as exc:
+        raise Conflict({'order': [str(exc)]}, data={'orders': exc.order_ids})
+
+
+class SupplierViewSet(CatalogCacheMixin, ChangeTrackingMixin, ExpandMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
     permission_classes = [IsAuthenticated]
+    filter_fields = {
+        'search': PrefixSearchFilter('name_search'),
+    }
+    ordering_fields = ('id', 'name')
+    ordering = ('id',)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, ChangeTrackingMixin, ExpandMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
+    ordering_fields = ('id', 'name')
+    ordering = ('id',)
 
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, ChangeTrackingMixin, ExpandMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    filter_fields = {
+        'search': PrefixSearchFilter('name_search'),
+        'category': InFilter('category_id', parse_int),
+        'supplier': InFilter('supplier_id', parse_int),
+        'min_price': Filter('price__gte', parse_decimal),
+        'max_price': Filter('price__lte', parse_decimal),
+    }
+    ordering_fields = ('id', 'name', 'price')
+    ordering = ('id',)
+    cache_models = (Product, Category, Supplier)
+    search_max_limit = 100
+
+    @action(detail=False)
+    def search(self, request):
+        # ?q= matched against name and description through the search index,
+        # tolerant of typos and ranked best first; see warehouse.search.
+        return self.cached_response(request, self.search_results)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            orders.products_removed([instance.pk])
+            super().perform_destroy(instance)
+
+    def perform_bulk_destroy(self, queryset):
+        orders.products_removed(list(queryset.values_list('pk', flat=True)))
+        super().perform_bulk_destroy(queryset)
 
+    def search_results(self, request):
+        try:
+            limit = min(parse_int(request.query_params.get('limit', '20')), self.search_max_limit)
+        except ValueError as exc:
+            raise ValidationError({'limit': [str(exc)]})
+        ids = search.find_products(request.query_params.get('q', ''), limit)
+        products = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer([products[pk] for pk in ids if pk in products], many=True)
+        return Response({'results': serializer.data})
 
-class ProductQuantityViewSet(viewsets.ModelViewSet):
+
+class ProductQuantityViewSet(ExpandMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = ProductQuantity.objects.all()
     serializer_class = ProductQuantitySerializer
     permission_classes = [IsAuthenticated]
+    filter_fields = {
+        'product': InFilter('product_id', parse_int),
+    }
+    ordering_fields = ('id', 'quantity')
+    ordering = ('id',)
+
+    # A product quantity used by order lines changes those lines, so it is
+    # held to the same rule as editing them directly.
+    def perform_update(self, serializer):
+        old_product_quantity = copy.copy(serializer.instance)
+        with transaction.atomic():
+            order_items = orders.quantity_items([old_product_quantity])
+            lock_lines(order_item.order_id for order_item in order_items)
+            orders.items_removed(order_items)
+            product_quantity = serializer.save()
+            stock.quantities_changed([(old_product_quantity, product_quantity)])
+            orders.items_added(order_items)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            lock_lines(order_item.order_id for order_item in orders.quantity_items([instance]))
+            stock.quantities_removed([instance])
+            orders.quantities_removed([instance])
+            instance.delete()
+
+    def perform_bulk_update(self, updates, fields):
+        order_items = orders.quantity_items([product_quantity for product_quantity, _ in updates])
+        lock_lines(order_item.order_id for order_item in order_items)
+        orders.items_removed(order_items)
+        super().perform_bulk_update(updates, fields)
+        stock.quantities_changed(updates)
+        orders.items_added(order_items)
 
+    def perform_bulk_destroy(self, queryset):
+        product_quantities = list(queryset)
+        lock_lines(order_item.order_id for order_item in orders.quantity_items(product_quantities))
+        stock.quantities_removed(product_quantities)
+        orders.quantities_removed(product_quantities)
+        queryset.delete()
 
-class OrderViewSet(viewsets.ModelViewSet):
+
+class OrderViewSet(ExpandMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    filter_fields = {
+        'stage': InFilter('stage', choices=[stage for stage, _ in Order.STAGE_CHOICES]),
+        'created_after': Filter('created_at__gte', parse_moment),
+        'created_before': Filter('created_at__lt', parse_moment),
+    }
+    ordering_fields = ('id', 'created_at', 'updated_at', 'total')
+    ordering = ('id',)
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return OrderCreateSerializer
+        return super().get_serializer_class()
+
+    def create(self, request, *args, **kwargs):
+        # A retried request with the same Idempotency-Key gets the order the
+        # first attempt created instead of a duplicate; two attempts racing
+        # each other are settled by the unique constraint on (user, key).
+        # Keys belong to the user who sent them, and reusing one for a
+        # different body is refused rather than answered with the old order.
+        key = request.headers.get('Idempotency-Key')
+        if key is not None and not 0 < len(key) <= 255:
+            raise ValidationError({'Idempotency-Key': ['Must be between 1 and 255 characters.']})
+        if key is not None:
+            order = self.find_by_key(key)
+            if order is not None:
+                return self.replay(order)
+        try:
+            return super().create(request, *args, **kwargs)
+        except IntegrityError:
+            order = self.find_by_key(key) if key is not None else None
+            if order is None:
+                raise
+            return self.replay(order)
+
+    def fingerprint(self):
+        data = self.request.data
+        if hasattr(data, 'lists'):
+            data = dict(data.lists())
+        return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def find_by_key(self, key):
+        # Keys stored before they were scoped per user have no user; orders do
+        # not record who created them, so such a key still matches for anyone,
+        # as it did then, until replay() hands it to the first user to retry.
+        lookup = Q(idempotency_user_id=self.request.user.pk) | Q(idempotency_user__isnull=True)
+        ordering = F('idempotency_user_id').asc(nulls_last=True)
+        return (
+            Order.objects.filter(lookup, idempotency_key=key).order_by(ordering).first()
+            or ArchivedOrder.objects.prefetch_related('items').filter(lookup, idempotency_key=key).order_by(ordering).first()
+        )
+
+    def replay(self, order):
+        if order.idempotency_fingerprint not in (None, self.fingerprint()):
+            raise UnprocessableEntity('This Idempotency-Key was already used for a different request.')
+        if order.idempotency_user_id is None:
+            type(order).objects.filter(pk=order.pk, idempotency_user__isnull=True).update(
+                idempotency_user_id=self.request.user.pk
+            )
+        serializer_class = ArchivedOrderSerializer if isinstance(order, ArchivedOrder) else OrderSerializer
+        serializer = serializer_class(order, context=self.get_serializer_context())
+        return Response(serializer.data, headers={'Idempotent-Replayed': 'true'})
+
+    def retrieve(self, request, *args, **kwargs):
+        # Archived orders are not in the queryset but keep their URL.
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            pk = kwargs[self.lookup_field]
+            archived = ArchivedOrder.objects.prefetch_related('items').filter(pk=pk).first() if pk.isdigit() else None
+            if archived is None:
+                raise
+            return Response(ArchivedOrderSerializer(archived, context=self.get_serializer_context()).data)
+
+    def perform_create(self, serializer):
+        key = self.request.headers.get('Idempotency-Key')
+        idempotency = {}
+        if key is not None:
+            idempotency = {
+                'idempotency_key': key,
+                'idempotency_user_id': self.request.user.pk,
+                'idempotency_fingerprint': self.fingerprint(),
+            }
+        with transaction.atomic():
+            order = serializer.save(**idempotency)
+            stage = serializer.validated_data.get('stage', 'Draft')
+            if stage != order.stage:
+                self.move_stage(order, (order.stage,), stage)
+
+    def perform_update(self, serializer):
+        order = serializer.instance
+        target = serializer.validated_data.get('stage', order.stage)
+        with transaction.atomic():
+            if target != order.stage:
+                # Moved with the incoming values so a warehouse set in the same
+                # request is the one stock gets reserved from.
+                pending = copy.copy(order)
+                for attr, value in serializer.validated_data.items():
+                    setattr(pending, attr, value)
+                self.move_stage(pending, (order.stage,), target)
+                order.stage = pending.stage
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            if instance.stage in stages.HOLDING_STOCK:
+                stock.release(instance)
+            reports.orders_deleted([instance])
+            instance.delete()
+
+    def perform_bulk_create(self, instances):
+        # Stored as Drafts like single creates, then confirmed one by one so
+        # their stock is reserved.
+        targets = [order.stage for order in instances]
+        for order in instances:
+            order.stage = 'Draft'
+        order_list = super().perform_bulk_create(instances)
+        events.orders_changed(order_list, 'created')
+        for order, target in zip(order_list, targets):
+            if target != order.stage:
+                self.move_stage(order, (order.stage,), target)
+        return order_list
+
+    def perform_bulk_update(self, updates, fields):
+        for original, order in updates:
+            if order.stage != original.stage:
+                self.move_stage(order, (original.stage,), order.stage)
+        # move_stage wrote the stages that changed; writing the column again
+        # would put back stale stages on the rows that did not.
+        super().perform_bulk_update(updates, [field for field in fields if field != 'stage'])
+        events.orders_changed([order for _, order in updates], 'updated')
+
+    def perform_bulk_destroy(self, queryset):
+        for order in queryset.filter(stage__in=stages.HOLDING_STOCK):
+            stock.release(order)
+        reports.orders_deleted(queryset.only('created_at'))
+        queryset.delete()
+
+    def move_stage(self, order, sources, target):
+        try:
+            stages.move(order, sources, target)
+        except Order.DoesNotExist:
+            raise Http404
+        except stages.TransitionConflict as exc:
+            raise Conflict({'stage': [str(exc)], 'current_stage': exc.current})
+        except stock.InsufficientStock as exc:
+            raise Conflict({'stage': [str(exc)]}, data={'products': exc.product_ids})
+
+    def transition(self, action_name):
+        order = self.get_object()
+        self.move_stage(order, *stages.ACTIONS[action_name])
+        return Response(self.get_serializer(order).data)
+
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, pk=None):
+        return self.transition('confirm')
+
+    @action(detail=True, methods=['post'])
+    def pay(self, request, pk=None):
+        return self.transition('pay')
 
+    @action(detail=True, methods=['post'])
+    def deliver(self, request, pk=None):
+        return self.transition('deliver')
 
-class OrderItemViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        return self.transition('cancel')
+
+    @action(detail=True, methods=['post'])
+    def restore(self, request, pk=None):
+        try:
+            order = archive.restore(int(pk))
+        except (ValueError, ArchivedOrder.DoesNotExist):
+            raise Http404
+        except archive.ArchiveError as exc:
+            raise Conflict({'detail': str(exc)})
+        return Response(OrderSerializer(order, context=self.get_serializer_context()).data)
+
+
+class OrderItemViewSet(ExpandMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
     permission_classes = [IsAuthenticated]
+    filter_fields = {
+        'order': InFilter('order_id', parse_int),
+        'product': InFilter('product_quantity__product_id', parse_int),
+    }
+    ordering_fields = ('id',)
+    ordering = ('id',)
+
+    # Lines only change while their order is a Draft; see stages.lock_lines.
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            lock_lines([serializer.validated_data['order'].pk])
+            order_item = serializer.save()
+            orders.items_added([order_item])
+
+    def perform_update(self, serializer):
+        product_quantity = serializer.validated_data.get('product_quantity')
+        order = serializer.validated_data.get('order')
+        with transaction.atomic():
+            lock_lines([serializer.instance.order_id, order.pk if order is not None else None])
+            orders.items_removed([serializer.instance])
+            if product_quantity is not None and product_quantity.pk != serializer.instance.product_quantity_id:
+                serializer.instance.price = None  # repriced on save
+            order_item = serializer.save()
+            orders.items_added([order_item])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            lock_lines([instance.order_id])
+            orders.items_removed([instance])
+            instance.delete()
+
+    def perform_bulk_create(self, instances):
+        lock_lines(order_item.order_id for order_item in instances)
+        order_items = super().perform_bulk_create(orders.price_items(instances))
+        orders.items_added(order_items)
+        events.order_items_changed(order_items, 'created')
+        return order_items
 
+    def perform_bulk_update(self, updates, fields):
+        lock_lines(order_item.order_id for pair in updates for order_item in pair)
+        repriced = orders.price_items([
+            order_item for original, order_item in updates if order_item.product_quantity_id != original.product_quantity_id
+        ])
+        if repriced:
+            fields = [*fields, 'price']
+        orders.items_removed([order_item for order_item, _ in updates])
+        super().perform_bulk_update(updates, fields)
+        orders.items_added([order_item for _, order_item in updates])
+        events.order_items_changed([order_item for _, order_item in updates], 'updated')
 
-class WarehouseViewSet(viewsets.ModelViewSet):
+    def perform_bulk_destroy(self, queryset):
+        order_items = list(queryset)
+        lock_lines(order_item.order_id for order_item in order_items)
+        orders.items_removed(order_items)
+        queryset.delete()
+
+
+class WarehouseViewSet(ChangeTrackingMixin, ExpandMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = Warehouse.objects.all()
     serializer_class = WarehouseSerializer
     permission_classes = [IsAuthenticated]
+    ordering_fields = ('id', 'name')
+    ordering = ('id',)
 
+    @action(detail=True)
+    def stock(self, request, pk=None):
+        warehouse = self.get_object()
+        expand, fields = parse_expand(request, StockLevelSerializer), parse_fields(request)
+        levels = StockLevel.objects.filter(warehouse=warehouse).order_by('product_id')
+        levels = with_fields(with_related(levels, expand), fields)
+        product = request.query_params.get('product')
+        if product is not None:
+            try:
+                levels = levels.filter(product_id=parse_int(product))
+            except ValueError as exc:
+                raise ValidationError({'product': [str(exc)]})
+        page = self.paginate_queryset(levels)
+        serializer = StockLevelSerializer(page, many=True, expand=expand, fields=fields)
+        return self.get_paginated_response(serializer.data)
 
-class WarehouseItemViewSet(viewsets.ModelViewSet):
+
+class WarehouseItemViewSet(ExpandMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = WarehouseItem.objects.all()
     serializer_class = WarehouseItemSerializer
     permission_classes = [IsAuthenticated]
+    filter_fields = {
+        'warehouse': InFilter('warehouse_id', parse_int),
+        'product': InFilter('product_quantity__product_id', parse_int),
+    }
+    ordering_fields = ('id',)
+    ordering = ('id',)
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            warehouse_item = serializer.save()
+            stock.items_added([warehouse_item])
+
+    def perform_update(self, serializer):
+        old_warehouse_item = copy.copy(serializer.instance)
+        with transaction.atomic():
+            warehouse_item = serializer.save()
+            stock.items_changed([(old_warehouse_item, warehouse_item)])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            stock.items_removed([instance])
+            instance.delete()
+
+    def perform_bulk_create(self, instances):
+        warehouse_items = super().perform_bulk_create(instances)
+        stock.items_added(warehouse_items)
+        events.warehouse_items_changed(warehouse_items, 'created')
+        return warehouse_items
+
+    def perform_bulk_update(self, updates, fields):
+        super().perform_bulk_update(updates, fields)
+        stock.items_changed(updates)
+        events.warehouse_items_changed([warehouse_item for _, warehouse_item in updates], 'updated')
+
+    def perform_bulk_destroy(self, queryset):
+        stock.items_removed(list(queryset.select_related('product_quantity')))
+        queryset.delete()
+
+
+class JobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    # Jobs are queued here and run by `manage.py run_workers`; poll the job
+    # for status and progress. Queuing is for staff, since jobs read server
+    # paths and rewrite the catalog.
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    filter_fields = {
+        'status': InFilter('status', choices=[choice for choice, _ in Job.STATUS_CHOICES]),
+        'kind': InFilter('kind'),
+    }
+    ordering_fields = ('id', 'created_at')
+    ordering = ('-id',)
+
+    def get_permissions(self):
+        if self.action == 'create':
+            return [IsAdminUser()]
+        return super().get_permissions()
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+    def perform_create(self, serializer):
+        # request.user is a TokenUser in stateless mode, not a User row.
+        serializer.save(created_by_id=self.request.user.pk)
+
+
+class ReportViewSet(viewsets.ViewSet):
+    # Served from SalesRollup (see the build_rollups command), never from the
+    # order tables, so latency does not grow with order history.
+    permission_classes = [IsAuthenticated]
+    group_by_fields = {
+        'hour': ('bucket',),
+        'day': ('bucket',),
+        'stage': ('stage',),
+        'category': ('category_id', 'category__name'),
+        'supplier': ('supplier_id', 'supplier__name'),
+    }
+    metrics = {
+        'revenue': Sum('revenue'),
+        'units': Sum('units'),
+        'lines': Sum('lines'),
+    }
+
+    def get_rollups(self, granularity):
+        rollups = SalesRollup.objects.filter(granularity=granularity)
+        for param, lookup, days in (('start', 'bucket__gte', 0), ('end', 'bucket__lt', 1)):
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            date = parse_date(value)
+            if date is None:
+                raise ValidationError({param: ['Enter a valid date (YYYY-MM-DD).']})
+            moment = timezone.make_aware(datetime.combine(date + timedelta(days=days), time.min))
+            rollups = rollups.filter(**{lookup: moment})
+        stage = self.request.query_params.get('stage')
+        if stage:
+            rollups = rollups.filter(stage__in=stage.split(','))
+        return rollups
+
+    @action(detail=False)
+    def revenue(self, request):
+        group_by = request.query_params.get('group_by', 'day')
+        if group_by not in self.group_by_fields:
+            raise ValidationError({'group_by': [f'Choose one of: {", ".join(self.group_by_fields)}.']})
+        fields = self.group_by_fields[group_by]
+        rollups = self.get_rollups('hour' if group_by == 'hour' else 'day')
+        results = rollups.values(*fields).annotate(**self.metrics).order_by(fields[0])
+        return Response({'group_by': group_by, 'results': list(results)})
+
+    @action(detail=False, url_path='top-products')
+    def top_products(self, request):
+        order_by = request.query_params.get('by', 'revenue')
+        if order_by not in self.metrics:
+            raise ValidationError({'by': [f'Choose one of: {", ".join(self.metrics)}.']})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        results = (
+            self.get_rollups('day')
+            .filter(product__isnull=False)
+            .values('product_id', 'product__name')
+            .annotate(**self.metrics)
+            .order_by(f'-{order_by}', 'product_id')[:limit]
+        )
+        return Response({'by': order_by, 'results': list(results)})
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def warehouse_items(request, warehouse_pk):
-    paginator = PageNumberPagination()
-    paginator.page_size = 10
-    warehouse_items = WarehouseItem.objects.filter(warehouse=warehouse_pk)
+    paginator = NestedItemCursorPagination()
+    expand, fields = parse_expand(request, WarehouseItemSerializer), parse_fields(request)
+    warehouse_items = with_fields(with_related(WarehouseItem.objects.filter(warehouse=warehouse_pk), expand), fields)
     result_page = paginator.paginate_queryset(warehouse_items, request)
-    serializer = WarehouseItemSerializer(warehouse_items, many=True)
+    serializer = WarehouseItemSerializer(result_page, many=True, expand=expand, fields=fields)
     return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def order_items(request, order_pk):
-    paginator = PageNumberPagination()
-    paginator.page_size = 10
-    order_items = OrderItem.objects.filter(order=order_pk)
+    paginator = NestedItemCursorPagination()
+    expand, fields = parse_expand(request, OrderItemSerializer), parse_fields(request)
+    order_items = with_fields(with_related(OrderItem.objects.filter(order=order_pk), expand), fields)
     result_page = paginator.paginate_queryset(order_items, request)
-    serializer = OrderItemSerializer(order_items, many=True)
+    serializer = OrderItemSerializer(result_page, many=True, expand=expand, fields=fields)
     return paginator.get_paginated_response(serializer.data)
\ No newline at end of file
@@ -0,0 +1,105 @@
+from django.db import IntegrityError, transaction
+
+from warehouse import events
+from warehouse.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from warehouse.orders import UNIT_PRICE
+
+# Closed orders are moved out of Order (and their lines out of OrderItem) into
+# ArchivedOrder/ArchivedOrderItem, so the live tables and their indexes only
+# grow with the working set. Archived orders keep their ids and are still
+# served by /orders/{id}/; restore() moves one back.
+
+CLOSED = ('Delivered', 'Cancelled', 'Trash')
+
+ORDER_FIELDS = (
+    'id', 'created_at', 'updated_at', 'stage', 'description', 'total', 'line_count', 'warehouse_id',
+    'idempotency_key', 'idempotency_user_id', 'idempotency_fingerprint',
+)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_orders(before, batch_size=500, progress=None):
+    # Orders created and last changed before `before`, one transaction per
+    # batch so an interrupted run keeps the batches it finished.
+    archived = 0
+    while True:
+        with transaction.atomic():
+            order_ids = list(
+                Order.objects
+                .select_for_update(skip_locked=True)
+                .filter(stage__in=CLOSED, created_at__lt=before, updated_at__lt=before)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not order_ids:
+                return archived
+            archive_batch(order_ids)
+        archived += len(order_ids)
+        if progress is not None:
+            progress(archived)
+
+
+def archive_batch(order_ids):
+    orders = Order.objects.filter(pk__in=order_ids)
+    ArchivedOrder.objects.bulk_create(
+        ArchivedOrder(**{field: getattr(order, field) for field in ORDER_FIELDS}) for order in orders
+    )
+    items = OrderItem.objects.filter(order_id__in=order_ids).values(
+        'id',
+        'order_id',
+        'product_quantity_id',
+        'product_quantity__quantity',
+        'product_quantity__product_id',
+        'product_quantity__product__category_id',
+        'product_quantity__product__supplier_id',
+        unit_price=UNIT_PRICE,
+    )
+    ArchivedOrderItem.objects.bulk_create(
+        ArchivedOrderItem(
+            id=item['id'],
+            order_id=item['order_id'],
+            product_quantity_id=item['product_quantity_id'],
+            product_id=item['product_quantity__product_id'],
+            category_id=item['product_quantity__product__category_id'],
+            supplier_id=item['product_quantity__product__supplier_id'],
+            quantity=item['product_quantity__quantity'],
+            price=item['unit_price'],
+        )
+        for item in items
+    )
+    OrderItem.objects.filter(order_id__in=order_ids).delete()
+    orders.delete()
+
+
+def restore(order_id):
+    # Raises ArchivedOrder.DoesNotExist, or ArchiveError when a line's product
+    # quantity has since been deleted or the id/key was taken in the meantime.
+    with transaction.atomic():
+        archived = ArchivedOrder.objects.select_for_update().get(pk=order_id)
+        items = list(archived.items.all())
+        missing = [item.id for item in items if item.product_quantity_id is None]
+        if missing:
+            raise ArchiveError(f'Lines {missing} refer to product quantities that no longer exist.')
+
+        # Written with bulk_create, so the change feed is told here instead of
+        # by signals; the timestamps it resets are put back with update().
+        order = Order(**{field: getattr(archived, field) for field in ORDER_FIELDS})
+        order_items = [
+            OrderItem(id=item.id, order_id=order.id, product_quantity_id=item.product_quantity_id, price=item.price)
+            for item in items
+        ]
+        try:
+            with transaction.atomic():
+                Order.objects.bulk_create([order])
+                OrderItem.objects.bulk_create(order_items)
+                Order.objects.filter(pk=order.pk).update(created_at=archived.created_at, updated_at=archived.updated_at)
+        except IntegrityError as exc:
+            raise ArchiveError(str(exc)) from exc
+        order.created_at, order.updated_at = archived.created_at, archived.updated_at
+        archived.delete()
+        events.orders_changed([order], 'created')
+        events.order_items_changed(order_items, 'created')
+    return order
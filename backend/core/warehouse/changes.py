@@ -0,0 +1,109 @@
+from django.db import transaction
+from django.db.models import F
+
+from warehouse.models import Category, ChangeCounter, Product, Supplier, Tombstone, Warehouse
+
+# Change tracking for the catalog served by /sync/. Every write stamps the
+# rows it touched with the next value of one global counter (one value per
+# batch), and every delete leaves a Tombstone stamped the same way.
+#
+# Stamping runs inside the write's own transaction, and advancing the counter
+# row-locks it until that transaction ends. Stamps therefore become visible in
+# counter order, which is what lets a client keep only the highest value it
+# has seen: nothing can later appear below it. It also means a write and its
+# stamp commit or roll back together, so no committed row is left unstamped.
+# The price is that catalog writes queue on the counter until they commit.
+
+SYNCED = {
+    'suppliers': Supplier,
+    'categories': Category,
+    'products': Product,
+    'warehouses': Warehouse,
+}
+
+CATALOG = 'catalog'
+# Highest change_seq whose tombstones have been pruned; older tokens must resync.
+PRUNED = 'tombstones_pruned'
+
+
+def _advance(name):
+    # Row-locks the counter until the surrounding transaction ends.
+    if not ChangeCounter.objects.filter(name=name).update(value=F('value') + 1):
+        ChangeCounter.objects.get_or_create(name=name)
+        ChangeCounter.objects.filter(name=name).update(value=F('value') + 1)
+    return ChangeCounter.objects.values_list('value', flat=True).get(name=name)
+
+
+def get_counter(name):
+    return ChangeCounter.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+
+def changed(model, pks):
+    # Call inside the transaction that wrote the rows, after writing them.
+    # Returns the stamp, or None when there was nothing to stamp.
+    pks = sorted(set(pks))
+    if not pks:
+        return None
+    with transaction.atomic():
+        seq = _advance(CATALOG)
+        model.objects.filter(pk__in=pks).update(change_seq=seq)
+    return seq
+
+
+def deleted(model, pks):
+    pks = sorted(set(pks))
+    if not pks:
+        return
+    with transaction.atomic():
+        seq = _advance(CATALOG)
+        Tombstone.objects.bulk_create(
+            Tombstone(model=model._meta.model_name, object_id=pk, change_seq=seq) for pk in pks
+        )
+
+
+def prune_tombstones(before):
+    # Drops tombstones created before `before`; tokens older than the newest
+    # of them can no longer be served a complete delta.
+    with transaction.atomic():
+        tombstones = Tombstone.objects.filter(created_at__lt=before)
+        newest = max(tombstones.values_list('change_seq', flat=True), default=None)
+        if newest is None:
+            return 0
+        count, _ = Tombstone.objects.filter(change_seq__lte=newest).delete()
+        ChangeCounter.objects.get_or_create(name=PRUNED)
+        ChangeCounter.objects.filter(name=PRUNED, value__lt=newest).update(value=newest)
+    return count
+
+
+def changes_since(since, limit):
+    # Returns (token, {name: queryset of changed rows}, {name: [deleted ids]},
+    # has_more); names without changes are left out of the rows.
+    # Pages end on a whole stamp, so a batch written together is never split
+    # and a page may run past `limit` by the rest of its last batch.
+    tombstones = Tombstone.objects.filter(change_seq__gt=since)
+    querysets = {name: model.objects.filter(change_seq__gt=since) for name, model in SYNCED.items()}
+    if since:
+        querysets[None] = tombstones
+    firsts, seqs = {}, []
+    for name, queryset in querysets.items():
+        found = list(queryset.order_by('change_seq').values_list('change_seq', flat=True)[:limit + 1])
+        if found:
+            firsts[name] = found[0]
+            seqs.extend(found)
+    seqs.sort()
+    has_more = len(seqs) > limit
+    token = seqs[limit - 1] if has_more else seqs[-1] if seqs else since
+
+    # Sources with nothing up to the token are not queried again.
+    rows, removed = {}, {name: [] for name in SYNCED}
+    for name, queryset in querysets.items():
+        if name is None or firsts.get(name, token + 1) > token:
+            continue
+        rows[name] = queryset.filter(change_seq__lte=token).order_by('change_seq', 'pk')
+    if firsts.get(None, token + 1) <= token:
+        labels = {model._meta.model_name: name for name, model in SYNCED.items()}
+        for model_name, object_id in (
+            tombstones.filter(change_seq__lte=token).order_by('change_seq').values_list('model', 'object_id')
+        ):
+            removed[labels[model_name]].append(object_id)
+    return token, rows, removed, has_more
@@ -0,0 +1,132 @@
+import asyncio
+import itertools
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from warehouse.models import Order
+
+# Change feed for orders, order lines and warehouse items. Events are built
+# while the change is being written and handed to the broker once the
+# transaction commits, so subscribers never hear about rolled-back work.
+
+OVERFLOW = object()
+
+
+class Subscription:
+    def __init__(self, broker, matches, queue_size):
+        self.broker = broker
+        self.matches = matches
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+
+    def deliver(self, event):
+        # Called from whichever thread committed the change.
+        if self.matches(event):
+            self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A consumer this far behind is told to resync and dropped rather
+            # than letting its queue grow without bound.
+            self.broker.unsubscribe(self)
+            self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class InProcessBroker:
+    # Fans events out to the subscribers of this process and keeps the last
+    # `history` events so a reconnecting client can catch up from its
+    # Last-Event-ID. With several workers, EVENT_BROKER should name a broker
+    # with the same interface backed by a shared channel.
+    def __init__(self, history=1000, queue_size=1000):
+        self.queue_size = queue_size
+        self.history = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._subscribers = set()
+
+    def publish(self, events):
+        with self._lock:
+            events = [{'seq': next(self._seq), **event} for event in events]
+            self.history.extend(events)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            for event in events:
+                try:
+                    subscription.deliver(event)
+                except RuntimeError:
+                    # Its event loop has shut down.
+                    self.unsubscribe(subscription)
+                    break
+
+    def subscribe(self, matches, last_seq=None):
+        subscription = Subscription(self, matches, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            backlog = [] if last_seq is None else [
+                event for event in self.history if event['seq'] > last_seq and matches(event)
+            ]
+        return subscription, backlog
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.EVENT_BROKER)()
+        return _broker
+
+
+def publish_on_commit(events):
+    events = list(events)
+    if events:
+        transaction.on_commit(lambda: get_broker().publish(events))
+
+
+def _event(kind, action, pk, warehouse_id, stage, **extra):
+    return {'type': f'{kind}.{action}', 'id': pk, 'warehouse': warehouse_id, 'stage': stage, **extra}
+
+
+def orders_changed(orders, action):
+    publish_on_commit(_event('order', action, order.pk, order.warehouse_id, order.stage) for order in orders)
+
+
+def order_items_changed(items, action):
+    # Lines carry their order's warehouse and stage so subscribers can filter
+    # them the same way; one query covers any number of lines. Deleted lines
+    # skip the lookup (it would run once per row during cascades) and go to
+    # every subscriber of the feed.
+    orders = {} if action == 'deleted' else {
+        pk: (warehouse_id, stage)
+        for pk, warehouse_id, stage in Order.objects
+        .filter(pk__in={item.order_id for item in items})
+        .values_list('pk', 'warehouse_id', 'stage')
+    }
+    publish_on_commit(
+        _event('order_item', action, item.pk, *orders.get(item.order_id, (None, None)), order=item.order_id)
+        for item in items
+    )
+
+
+def warehouse_items_changed(items, action):
+    publish_on_commit(
+        _event('warehouse_item', action, item.pk, item.warehouse_id, None, product_quantity=item.product_quantity_id)
+        for item in items
+    )
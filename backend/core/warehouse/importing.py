@@ -0,0 +1,249 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.db import transaction
+
+from warehouse import changes, stock
+from warehouse.api import caching
+from warehouse.models import (
+    Supplier, Category, Product, ProductQuantity, Warehouse, WarehouseItem, ImportCheckpoint
+)
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt):
+    # Streams (line number, row dict) pairs; the file is never held in memory.
+    with open(path, newline='', encoding='utf-8') as source:
+        if fmt == 'csv':
+            yield from enumerate(csv.DictReader(source), start=2)
+            return
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as exc:
+                raise RowError(f'line {line_number}: invalid JSON ({exc.msg})') from exc
+            if not isinstance(row, dict):
+                raise RowError(f'line {line_number}: expected a JSON object')
+            yield line_number, row
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _text(row, name, required=False, field=None):
+    # Too long for `field` is rejected here for the same reason as in _decimal;
+    # SQLite would store it, PostgreSQL fails the whole batch.
+    value = row.get(name)
+    value = str(value).strip() if value is not None else ''
+    if required and not value:
+        raise RowError(f'{name} is required')
+    if field is not None and field.max_length is not None and len(value) > field.max_length:
+        raise RowError(f'{name} must be at most {field.max_length} characters')
+    return value or None
+
+
+def _field(model, name):
+    return model._meta.get_field(name)
+
+
+def _decimal(row, name, field):
+    # Rejected here rather than by the database: bulk_create fails on NaN or
+    # on values the column cannot hold without saying which row it was.
+    try:
+        value = Decimal(_text(row, name, required=True))
+    except InvalidOperation:
+        raise RowError(f'{name} must be a number')
+    if not value.is_finite():
+        raise RowError(f'{name} must be a finite number')
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+    if abs(value) >= limit:
+        raise RowError(f'{name} must be less than {limit}')
+    return value
+
+
+class NameMap:
+    # name -> id for a model, loaded once; missing names can be created in bulk.
+    def __init__(self, model):
+        self.model = model
+        self.ids = dict(model.objects.values_list('name', 'id'))
+
+    def resolve(self, names):
+        missing = sorted({name for name in names if name and name not in self.ids})
+        if missing:
+            for obj in self.model.objects.bulk_create(self.model(name=name) for name in missing):
+                self.ids[obj.name] = obj.id
+            caching.invalidate(self.model)
+            changes.changed(self.model, [self.ids[name] for name in missing])
+
+    def get(self, name):
+        return self.ids.get(name) if name else None
+
+
+class SupplierImporter:
+    def build(self, rows):
+        return [
+            Supplier(
+                name=_text(row, 'name', required=True, field=_field(Supplier, 'name')),
+                email=_text(row, 'email', field=_field(Supplier, 'email')),
+                phone=_text(row, 'phone', field=_field(Supplier, 'phone')),
+                address=_text(row, 'address'),
+            )
+            for row in rows
+        ]
+
+    def save(self, objects):
+        Supplier.objects.bulk_create(objects)
+        caching.invalidate(Supplier)
+        changes.changed(Supplier, [obj.pk for obj in objects])
+
+
+class CategoryImporter:
+    def build(self, rows):
+        return [
+            Category(
+                name=_text(row, 'name', required=True, field=_field(Category, 'name')),
+                description=_text(row, 'description'),
+            )
+            for row in rows
+        ]
+
+    def save(self, objects):
+        Category.objects.bulk_create(objects)
+        caching.invalidate(Category)
+        changes.changed(Category, [obj.pk for obj in objects])
+
+
+class ProductImporter:
+    def __init__(self):
+        self.categories = NameMap(Category)
+        self.suppliers = NameMap(Supplier)
+
+    def build(self, rows):
+        # Every row is checked before missing categories and suppliers are
+        # created from it.
+        parsed = [
+            (
+                _text(row, 'name', required=True, field=_field(Product, 'name')),
+                _text(row, 'description'),
+                _decimal(row, 'price', _field(Product, 'price')),
+                _text(row, 'category', field=_field(Category, 'name')),
+                _text(row, 'supplier', field=_field(Supplier, 'name')),
+            )
+            for row in rows
+        ]
+        self.categories.resolve(category for *_, category, _ in parsed)
+        self.suppliers.resolve(supplier for *_, supplier in parsed)
+        return [
+            Product(
+                name=name,
+                description=description,
+                price=price,
+                category_id=self.categories.get(category),
+                supplier_id=self.suppliers.get(supplier),
+            )
+            for name, description, price, category, supplier in parsed
+        ]
+
+    def save(self, objects):
+        Product.objects.bulk_create(objects)
+        caching.invalidate(Product)
+        changes.changed(Product, [obj.pk for obj in objects])
+
+
+class StockImporter:
+    def __init__(self):
+        self.products = NameMap(Product)
+        self.warehouses = NameMap(Warehouse)
+
+    def build(self, rows):
+        self.warehouses.resolve(_text(row, 'warehouse', field=_field(Warehouse, 'name')) for row in rows)
+        entries = []
+        for row in rows:
+            product_name = _text(row, 'product', required=True)
+            product_id = self.products.get(product_name)
+            if product_id is None:
+                raise RowError(f'unknown product {product_name!r}')
+            try:
+                quantity = int(_text(row, 'quantity', required=True))
+            except ValueError:
+                raise RowError('quantity must be an integer')
+            if quantity < 0:
+                raise RowError('quantity must not be negative')
+            entries.append((
+                ProductQuantity(product_id=product_id, quantity=quantity),
+                self.warehouses.get(_text(row, 'warehouse')),
+            ))
+        return entries
+
+    def save(self, objects):
+        ProductQuantity.objects.bulk_create([product_quantity for product_quantity, _ in objects])
+        items = WarehouseItem.objects.bulk_create(
+            WarehouseItem(warehouse_id=warehouse_id, product_quantity=product_quantity)
+            for product_quantity, warehouse_id in objects
+            if warehouse_id is not None
+        )
+        stock.items_added(items)
+
+
+IMPORTERS = {
+    'suppliers': SupplierImporter,
+    'categories': CategoryImporter,
+    'products': ProductImporter,
+    'stock': StockImporter,
+}
+
+
+def import_catalog(kind, path, fmt=None, batch_size=1000, resume=False, progress=None):
+    # Each batch is validated, written with bulk_create and recorded in its
+    # ImportCheckpoint inside one transaction, so --resume continues exactly
+    # after the last committed batch. A batch with a bad row is rolled back
+    # whole and the first offending line is reported.
+    path = Path(path)
+    fmt = fmt or path.suffix.lstrip('.').lower()
+    if fmt not in ('csv', 'jsonl'):
+        raise RowError(f'unsupported format {fmt!r}; use csv or jsonl')
+
+    importer = IMPORTERS[kind]()
+    checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=f'{kind}:{path.resolve()}'[:255])
+    done = checkpoint.rows if resume else 0
+    imported = 0
+    started = time.perf_counter()
+
+    for batch in _batches(islice(read_rows(path, fmt), done, None), batch_size):
+        try:
+            with transaction.atomic():
+                importer.save(importer.build([row for _, row in batch]))
+                ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(rows=done + len(batch))
+        except RowError as exc:
+            _raise_for_row(importer, batch, exc)
+        done += len(batch)
+        imported += len(batch)
+        if progress:
+            progress(done, imported, imported / (time.perf_counter() - started))
+
+    return {'rows': done, 'imported': imported, 'seconds': time.perf_counter() - started}
+
+
+def _raise_for_row(importer, batch, error):
+    # Always raises: the first row that fails on its own is named, otherwise
+    # the whole batch, which is never counted as committed either way.
+    for line_number, row in batch:
+        try:
+            with transaction.atomic():
+                importer.build([row])
+                transaction.set_rollback(True)
+        except RowError as exc:
+            raise RowError(f'line {line_number}: {exc}') from exc
+    raise RowError(f'lines {batch[0][0]}-{batch[-1][0]}: {error}') from error
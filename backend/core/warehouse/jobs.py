@@ -0,0 +1,230 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from warehouse import archive, changes, importing, reports
+from warehouse.api import caching
+from warehouse.models import Job, Product
+from warehouse.orders import CENT
+
+logger = logging.getLogger(__name__)
+
+# A database table is the queue: no broker to run, and a job is committed (or
+# not) together with whatever enqueued it. Workers claim the oldest due job
+# with SELECT ... FOR UPDATE SKIP LOCKED where the database has it; the claim
+# itself is a conditional UPDATE on status, which is what makes it safe on
+# SQLite (where FOR UPDATE is a no-op) and when two workers race anyway.
+
+PRICE_BATCH_SIZE = 1000
+
+
+class Lost(Exception):
+    # The job was reclaimed by another worker while this one ran it.
+    pass
+
+
+class Progress:
+    # Passed to handlers; every report also serves as the worker's heartbeat.
+    # `checkpoint` is what the previous attempt last saved. A handler that
+    # must not repeat work passes a new one from inside the transaction that
+    # does the work, so the two commit together; Lost is raised there when
+    # the job is no longer this worker's, rolling the work back.
+    def __init__(self, job):
+        self.job = job
+        self.checkpoint = job.checkpoint
+
+    def __call__(self, done, total=None, checkpoint=None):
+        updates = {'progress': done, 'heartbeat_at': timezone.now()}
+        if total is not None:
+            updates['total'] = total
+        if checkpoint is not None:
+            updates['checkpoint'] = checkpoint
+        updated = Job.objects.filter(pk=self.job.pk, status='Running', worker=self.job.worker).update(**updates)
+        if checkpoint is not None and not updated:
+            raise Lost(f'Job {self.job.pk} was reclaimed by another worker.')
+
+
+def import_catalog(params, progress):
+    # A retried attempt resumes from the file's ImportCheckpoint, which every
+    # committed batch of the earlier attempt advanced with it.
+    return importing.import_catalog(
+        params['kind'],
+        params['path'],
+        fmt=params.get('format'),
+        batch_size=params.get('batch_size', 1000),
+        resume=params.get('resume', False) or progress.job.attempts > 1,
+        progress=lambda done, imported, rate: progress(done),
+    )
+
+
+def build_rollups(params, progress):
+    days = reports.build_rollups(full=params.get('full', False))
+    progress(len(days), len(days))
+    return {'days': len(days)}
+
+
+def archive_orders(params, progress):
+    before = timezone.now() - timedelta(days=params.get('days', 180))
+    return {'archived': archive.archive_orders(before, batch_size=params.get('batch_size', 500), progress=progress)}
+
+
+def change_prices(params, progress):
+    # Multiplies prices by (100 + percent) / 100, rounded to the cent, for the
+    # products matching the optional category/supplier/products filters. Not
+    # idempotent, so each batch commits with a checkpoint and a retried
+    # attempt resumes after the last committed batch.
+    factor = (100 + Decimal(str(params['percent']))) / 100
+    if factor < 0:
+        raise ValueError('percent cannot be below -100')
+    products = Product.objects.order_by('pk')
+    if params.get('category') is not None:
+        products = products.filter(category_id=params['category'])
+    if params.get('supplier') is not None:
+        products = products.filter(supplier_id=params['supplier'])
+    if params.get('products') is not None:
+        products = products.filter(pk__in=params['products'])
+
+    checkpoint = progress.checkpoint or {'last_id': 0, 'done': 0}
+    total, done, last_id = products.count(), checkpoint['done'], checkpoint['last_id']
+    progress(done, total)
+    while True:
+        with transaction.atomic():
+            batch = list(products.filter(pk__gt=last_id).only('pk', 'price')[:PRICE_BATCH_SIZE])
+            if not batch:
+                break
+            for product in batch:
+                product.price = (product.price * factor).quantize(CENT, ROUND_HALF_UP)
+            Product.objects.bulk_update(batch, ['price'])
+            caching.invalidate(Product)
+            changes.changed(Product, [product.pk for product in batch])
+            last_id = batch[-1].pk
+            done += len(batch)
+            progress(done, total, checkpoint={'last_id': last_id, 'done': done})
+    return {'updated': done}
+
+
+# kind -> (handler(params, progress) returning a JSON-serializable result, required params)
+HANDLERS = {
+    'import_catalog': (import_catalog, ('kind', 'path')),
+    'build_rollups': (build_rollups, ()),
+    'archive_orders': (archive_orders, ()),
+    'change_prices': (change_prices, ('percent',)),
+}
+
+
+def enqueue(kind, params=None, user=None, run_after=None, max_attempts=3):
+    return Job.objects.create(
+        kind=kind,
+        params=params or {},
+        created_by=user,
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def claim(worker):
+    # Returns the claimed job, or None when nothing is due.
+    due = Job.objects.filter(status='Queued', run_after__lte=timezone.now()).order_by('run_after', 'id')
+    while True:
+        with transaction.atomic():
+            pk = due.select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            now = timezone.now()
+            claimed = Job.objects.filter(pk=pk, status='Queued').update(
+                status='Running', worker=worker, attempts=F('attempts') + 1, started_at=now, heartbeat_at=now,
+            )
+        if claimed:
+            return Job.objects.get(pk=pk)
+
+
+def reclaim_stale():
+    # Jobs whose worker died mid-run: back to the queue while attempts remain.
+    now = timezone.now()
+    stale = Job.objects.filter(status='Running', heartbeat_at__lt=now - timedelta(seconds=settings.JOB_STALE_AFTER))
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(
+        status='Queued', worker='', error='Requeued after its worker stopped responding.',
+    )
+    failed = stale.update(status='Failed', finished_at=now, error='Its worker stopped responding.')
+    if requeued or failed:
+        logger.warning('Reclaimed stale jobs: %d requeued, %d failed', requeued, failed)
+
+
+class Heartbeat:
+    # Keeps a claimed job alive while its handler runs between progress
+    # reports, from a thread with its own database connection.
+    def __init__(self, job):
+        self.job = job
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, daemon=True)
+
+    def beat(self):
+        try:
+            while not self.stopped.wait(settings.JOB_STALE_AFTER / 3):
+                Job.objects.filter(pk=self.job.pk, status='Running', worker=self.job.worker).update(
+                    heartbeat_at=timezone.now()
+                )
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def run(job):
+    handler, _ = HANDLERS[job.kind]
+    try:
+        with Heartbeat(job):
+            result = handler(job.params, Progress(job))
+    except Lost:
+        logger.warning('Job %s (%s) was reclaimed; leaving it to its new worker', job.pk, job.kind)
+        return
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed', job.pk, job.kind)
+        updates = {'status': 'Failed', 'error': f'{type(exc).__name__}: {exc}'}
+    else:
+        updates = {'status': 'Succeeded', 'result': result, 'error': ''}
+    updates['finished_at'] = timezone.now()
+    # Guarded so a job that was reclaimed meanwhile is left to its new worker.
+    Job.objects.filter(pk=job.pk, status='Running', worker=job.worker).update(**updates)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def work(stop=None, burst=False, poll_interval=None):
+    # Claims and runs jobs until `stop` is set, or the queue is empty with
+    # burst=True. Returns the number of jobs run.
+    stop = stop or threading.Event()
+    poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+    worker = worker_name()
+    processed, reclaimed_at = 0, float('-inf')
+    while not stop.is_set():
+        close_old_connections()
+        if time.monotonic() - reclaimed_at > settings.JOB_STALE_AFTER / 3:
+            reclaim_stale()
+            reclaimed_at = time.monotonic()
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        run(job)
+        processed += 1
+    return processed
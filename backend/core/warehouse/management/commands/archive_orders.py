@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from warehouse import archive
+
+
+class Command(BaseCommand):
+    help = 'Move Delivered, Cancelled and Trash orders older than --days, with their lines, into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180, help='archive orders created and last changed before this')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        def progress(done):
+            self.stdout.write(f'{done} orders archived')
+
+        before = timezone.now() - timedelta(days=options['days'])
+        count = archive.archive_orders(before, batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Archived {count} order(s)'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from warehouse import reports
+
+
+class Command(BaseCommand):
+    help = 'Refresh the hourly/daily sales rollups for orders changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='drop and rebuild every rollup')
+
+    def handle(self, *args, **options):
+        days = reports.build_rollups(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups for {len(days)} day(s)'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse import importing
+
+
+class Command(BaseCommand):
+    help = 'Bulk import suppliers, categories, products or stock from a CSV or JSON-lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(importing.IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--resume', action='store_true', help='skip rows committed by a previous run of this file')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        def progress(done, imported, rate):
+            self.stdout.write(f'{done} rows committed ({rate:.0f} rows/s)')
+
+        try:
+            result = importing.import_catalog(
+                options['kind'],
+                options['path'],
+                fmt=options['format'],
+                batch_size=options['batch_size'],
+                resume=options['resume'],
+                progress=progress,
+            )
+        except (importing.RowError, OSError) as exc:
+            raise CommandError(str(exc)) from exc
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['imported']} {options['kind']} rows in {result['seconds']:.2f}s "
+            f"({result['rows']} committed in total)"
+        ))
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from warehouse import changes
+
+
+class Command(BaseCommand):
+    help = 'Delete sync tombstones older than --days; clients holding older tokens are told to resync'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+
+    def handle(self, *args, **options):
+        count = changes.prune_tombstones(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} tombstone(s)'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from warehouse import stock
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-warehouse stock levels from the stock movement log'
+
+    def handle(self, *args, **options):
+        count = stock.rebuild_levels()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} stock levels'))
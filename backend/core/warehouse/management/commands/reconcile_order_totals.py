@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from warehouse import orders
+from warehouse.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored order totals in batches and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='report drift without fixing it')
+
+    def handle(self, *args, **options):
+        batch_size, dry_run = options['batch_size'], options['dry_run']
+        checked = drifted = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    Order.objects
+                    .filter(pk__gt=last_id)
+                    .order_by('pk')
+                    .select_for_update()
+                    .values_list('pk', 'total', 'line_count')[:batch_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                totals = orders.computed_totals([pk for pk, _, _ in batch])
+
+                fixes = []
+                for pk, total, line_count in batch:
+                    expected_total, expected_lines = totals.get(pk, (Decimal('0.00'), 0))
+                    if (expected_total, expected_lines) != (total, line_count):
+                        self.stdout.write(
+                            f'Order {pk}: total {total} -> {expected_total}, lines {line_count} -> {expected_lines}'
+                        )
+                        fixes.append(Order(pk=pk, total=expected_total, line_count=expected_lines))
+                if fixes and not dry_run:
+                    Order.objects.bulk_update(fixes, ['total', 'line_count'])
+            checked += len(batch)
+            drifted += len(fixes)
+
+        action = 'found' if dry_run else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} orders, {action} {drifted} with drift'))
@@ -0,0 +1,54 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from warehouse import jobs
+
+
+def _work(burst):
+    # Entry point of each worker process. SIGTERM/SIGINT let the current job
+    # finish, then the worker exits.
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop.set())
+    return jobs.work(stop=stop, burst=burst)
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the jobs table in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKERS)
+        parser.add_argument('--burst', action='store_true', help='exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes, burst = options['processes'], options['burst']
+        if processes < 1:
+            raise CommandError('--processes must be positive')
+        if processes == 1:
+            processed = _work(burst)
+            self.stdout.write(self.style.SUCCESS(f'Ran {processed} job(s)'))
+            return
+
+        # Forked children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_work, args=(burst,)) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Started {processes} workers')
+
+        def forward(signum, frame):
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+        signal.signal(signal.SIGTERM, forward)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # the terminal sends it to the children too
+        for worker in workers:
+            worker.join()
+        self.stdout.write(self.style.SUCCESS('All workers stopped'))
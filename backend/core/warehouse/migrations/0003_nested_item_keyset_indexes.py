@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-17 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0002_remove_order_total_order_description'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['order', 'id'], name='warehouse_o_order_i_3244a7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warehouseitem',
+            index=models.Index(fields=['warehouse', 'id'], name='warehouse_w_warehou_b29424_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.15 on 2026-10-17 17:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def record_opening_balances(apps, schema_editor):
+    WarehouseItem = apps.get_model('warehouse', 'WarehouseItem')
+    StockMovement = apps.get_model('warehouse', 'StockMovement')
+    StockLevel = apps.get_model('warehouse', 'StockLevel')
+
+    balances = (
+        WarehouseItem.objects
+        .values('warehouse_id', 'product_quantity__product_id')
+        .annotate(quantity=Sum('product_quantity__quantity'))
+        .order_by()
+    )
+    StockMovement.objects.bulk_create(
+        StockMovement(
+            warehouse_id=row['warehouse_id'],
+            product_id=row['product_quantity__product_id'],
+            delta=row['quantity'],
+            reason='Opening',
+        )
+        for row in balances
+    )
+    StockLevel.objects.bulk_create(
+        StockLevel(
+            warehouse_id=row['warehouse_id'],
+            product_id=row['product_quantity__product_id'],
+            quantity=row['quantity'],
+        )
+        for row in balances
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0003_nested_item_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('Opening', 'Opening'), ('Received', 'Received'), ('Adjusted', 'Adjusted'), ('Removed', 'Removed')], max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='warehouse.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='warehouse.warehouse')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_levels', to='warehouse.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_levels', to='warehouse.warehouse')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('warehouse', 'product'), name='unique_stock_level')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.15 on 2026-10-17 17:56
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_warehouse_items(apps, schema_editor):
+    WarehouseItem = apps.get_model('warehouse', 'WarehouseItem')
+    StockMovement = apps.get_model('warehouse', 'StockMovement')
+    StockLevel = apps.get_model('warehouse', 'StockLevel')
+
+    duplicates = (
+        WarehouseItem.objects
+        .values('warehouse_id', 'product_quantity_id')
+        .annotate(keep=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for row in duplicates:
+        extra = (
+            WarehouseItem.objects
+            .filter(warehouse_id=row['warehouse_id'], product_quantity_id=row['product_quantity_id'])
+            .exclude(id=row['keep'])
+            .select_related('product_quantity')
+        )
+        for item in extra:
+            product_quantity = item.product_quantity
+            StockMovement.objects.create(
+                warehouse_id=item.warehouse_id,
+                product_id=product_quantity.product_id,
+                delta=-product_quantity.quantity,
+                reason='Removed',
+            )
+            level = StockLevel.objects.get(warehouse_id=item.warehouse_id, product_id=product_quantity.product_id)
+            level.quantity -= product_quantity.quantity
+            level.save()
+            item.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0004_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['stage', 'created_at'], name='warehouse_o_stage_ca59d6_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_warehouse_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='warehouseitem',
+            constraint=models.UniqueConstraint(fields=('warehouse', 'product_quantity'), name='unique_warehouse_product_quantity'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-17 18:04
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+
+def compute_totals(apps, schema_editor):
+    Order = apps.get_model('warehouse', 'Order')
+    OrderItem = apps.get_model('warehouse', 'OrderItem')
+
+    amount = ExpressionWrapper(
+        F('product_quantity__quantity') * F('product_quantity__product__price'),
+        output_field=DecimalField(max_digits=15, decimal_places=2),
+    )
+    rows = (
+        OrderItem.objects
+        .values('order_id')
+        .annotate(total=Sum(amount), line_count=Count('id'))
+        .order_by()
+    )
+    for row in rows.iterator():
+        Order.objects.filter(pk=row['order_id']).update(total=row['total'], line_count=row['line_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0005_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='line_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.RunPython(compute_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-17 18:19
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0008_import_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='warehouse_o_created_627fb4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Upper('name'), name='product_name_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='warehouse_p_price_7a02b4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(django.db.models.functions.text.Upper('name'), name='supplier_name_upper_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-17 18:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0009_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='warehouse',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='warehouse.warehouse'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='warehouse.order'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='reason',
+            field=models.CharField(choices=[('Opening', 'Opening'), ('Received', 'Received'), ('Adjusted', 'Adjusted'), ('Removed', 'Removed'), ('Reserved', 'Reserved'), ('Released', 'Released')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.15 on 2026-10-17 18:45
+
+from django.db import migrations, models
+
+
+def stamp_existing_rows(apps, schema_editor):
+    # Everything already in the catalog counts as one change, so a client
+    # syncing from scratch (since=0) receives it.
+    for name in ('Supplier', 'Category', 'Product', 'Warehouse'):
+        apps.get_model('warehouse', name).objects.update(change_seq=1)
+    apps.get_model('warehouse', 'ChangeCounter').objects.create(name='catalog', value=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0011_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('change_seq', models.BigIntegerField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='warehouse',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(stamp_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+from warehouse.migrations._search import SQLITE_DROP_TRIGGERS, SQLITE_REBUILD, SQLITE_TRIGGERS
+
+# The search index lives outside the ORM: an FTS5 trigram table kept current by
+# triggers on SQLite, trigram GIN indexes on PostgreSQL. Other backends fall
+# back to unindexed matching in warehouse.search.
+#
+# SQLite cannot alter most columns in place, so Django rebuilds the table
+# (create a copy, move the rows, drop the original), and dropping
+# warehouse_product drops these triggers with it. Any later migration that
+# alters warehouse_product must restore them; see
+# warehouse.migrations._search.restore_sqlite_triggers.
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE warehouse_product_fts USING fts5(
+        name, description, content='warehouse_product', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    *SQLITE_TRIGGERS,
+    SQLITE_REBUILD,
+]
+
+SQLITE_BACKWARD = [
+    *SQLITE_DROP_TRIGGERS,
+    'DROP TABLE IF EXISTS warehouse_product_fts',
+]
+
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS product_name_trgm_idx ON warehouse_product USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS product_description_trgm_idx ON warehouse_product USING gin (description gin_trgm_ops)',
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS product_description_trgm_idx',
+    'DROP INDEX IF EXISTS product_name_trgm_idx',
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0013_order_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
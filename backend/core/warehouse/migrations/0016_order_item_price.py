@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-17 19:30
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def snapshot_prices(apps, schema_editor):
+    # Existing lines take the price their order's total was computed from.
+    OrderItem = apps.get_model('warehouse', 'OrderItem')
+    ProductQuantity = apps.get_model('warehouse', 'ProductQuantity')
+
+    price = ProductQuantity.objects.filter(pk=OuterRef('product_quantity_id')).values('product__price')[:1]
+    OrderItem.objects.update(price=Subquery(price))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0015_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(snapshot_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0018_idempotency_key_per_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='checkpoint',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
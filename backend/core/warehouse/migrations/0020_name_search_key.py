@@ -0,0 +1,55 @@
+# Generated by Django 5.1.15 on 2026-10-17 20:14
+
+import warehouse.models
+from django.db import migrations, models
+
+from warehouse.migrations._search import restore_sqlite_triggers
+
+
+def fill_search_keys(apps, schema_editor):
+    for model_name in ('Product', 'Supplier'):
+        model = apps.get_model('warehouse', model_name)
+        rows = list(model.objects.only('pk', 'name'))
+        for row in rows:
+            row.name_search = warehouse.models.search_key(row.name)[:50]
+        model.objects.bulk_update(rows, ['name_search'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0019_job_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_name_upper_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='supplier',
+            name='supplier_name_upper_idx',
+        ),
+        # Adding a NOT NULL column rebuilds warehouse_product on SQLite.
+        migrations.RunPython(migrations.RunPython.noop, restore_sqlite_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='name_search',
+            field=warehouse.models.SearchKeyField(default='', editable=False, max_length=50, source='name'),
+        ),
+        migrations.RunPython(restore_sqlite_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='supplier',
+            name='name_search',
+            field=warehouse.models.SearchKeyField(default='', editable=False, max_length=50, source='name'),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name_search'], name='product_name_search_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(fields=['name_search'], name='supplier_name_search_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
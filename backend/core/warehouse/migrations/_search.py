@@ -0,0 +1,50 @@
+# Triggers keeping warehouse_product_fts (migration 0014) current on SQLite.
+# Kept outside the numbered migrations (the loader skips modules starting
+# with an underscore) so later migrations can restore them.
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER warehouse_product_fts_insert AFTER INSERT ON warehouse_product BEGIN
+        INSERT INTO warehouse_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER warehouse_product_fts_delete AFTER DELETE ON warehouse_product BEGIN
+        INSERT INTO warehouse_product_fts(warehouse_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER warehouse_product_fts_update AFTER UPDATE OF name, description ON warehouse_product BEGIN
+        INSERT INTO warehouse_product_fts(warehouse_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO warehouse_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+SQLITE_DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS warehouse_product_fts_update',
+    'DROP TRIGGER IF EXISTS warehouse_product_fts_delete',
+    'DROP TRIGGER IF EXISTS warehouse_product_fts_insert',
+]
+
+SQLITE_REBUILD = "INSERT INTO warehouse_product_fts(warehouse_product_fts) VALUES ('rebuild')"
+
+TRIGGER_NAMES = ('warehouse_product_fts_insert', 'warehouse_product_fts_delete', 'warehouse_product_fts_update')
+
+
+def restore_sqlite_triggers(apps, schema_editor):
+    # A table rebuild on SQLite drops the triggers. Run this after any
+    # operation that alters warehouse_product:
+    #
+    #     migrations.AlterField(model_name='product', ...),
+    #     migrations.RunPython(restore_sqlite_triggers, migrations.RunPython.noop),
+    #
+    # and, so the migration also reverses cleanly, put
+    # RunPython(migrations.RunPython.noop, restore_sqlite_triggers) before it.
+    # Rows written while the triggers were missing are picked up by the rebuild.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in [*SQLITE_DROP_TRIGGERS, *SQLITE_TRIGGERS, SQLITE_REBUILD]:
+        schema_editor.execute(statement)
@@ -1,17 +1,62 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
-class Supplier(models.Model):
+def search_key(value):
+    # How names are compared in prefix search, both when stored and when
+    # queried. Done in Python: UPPER() and LOWER() only fold ASCII on SQLite.
+    return value.casefold()
+
+
+class SearchKeyField(models.CharField):
+    # search_key() of another field, kept in its own column so it can be
+    # indexed. Filled in by pre_save(), which save() and bulk_create() call;
+    # bulk_update() does not, see BulkModelMixin.
+    def __init__(self, *args, source=None, **kwargs):
+        self.source = source
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        # casefold() can make a name longer; a prefix match only needs the start.
+        value = search_key(getattr(model_instance, self.source) or '')[:self.max_length]
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class ChangeTracked(models.Model):
+    # Catalog models listed in warehouse.changes.SYNCED. change_seq is set from
+    # the catalog change counter after every write, for /sync/.
+    change_seq = models.BigIntegerField(default=0, editable=False, db_index=True)
+
+    class Meta:
+        abstract = True
+
+
+class Supplier(ChangeTracked):
     name = models.CharField(max_length=50)
+    name_search = SearchKeyField(source='name', max_length=50, editable=False, default='')
     email = models.EmailField(max_length=254, null=True, blank=True)
     phone = models.CharField(max_length=15, null=True, blank=True)
     address = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Backs the case-insensitive prefix search on name. The opclass
+            # lets LIKE 'prefix%' use it on PostgreSQL; other backends ignore it.
+            models.Index(fields=['name_search'], name='supplier_name_search_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
     def __str__(self):
         return self.name
 
 
-class Category(models.Model):
+class Category(ChangeTracked):
     name = models.CharField(max_length=50)
     description = models.TextField(null=True, blank=True)
 
@@ -19,13 +64,20 @@ class Category(models.Model):
         return self.name
 
 
-class Product(models.Model):
+class Product(ChangeTracked):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     name = models.CharField(max_length=50)
+    name_search = SearchKeyField(source='name', max_length=50, editable=False, default='')
     description = models.TextField(null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name_search'], name='product_name_search_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['price']),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -51,6 +103,28 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     stage = models.CharField(max_length=50, choices=STAGE_CHOICES, default='Draft')
     description = models.TextField(null=True, blank=True)
+    total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    line_count = models.PositiveIntegerField(default=0)
+    # Stock for the order's lines is reserved here when it is confirmed.
+    warehouse = models.ForeignKey('Warehouse', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
+    # Client-supplied Idempotency-Key of the request that created the order,
+    # unique per user, with a hash of that request's body.
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    idempotency_user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    idempotency_fingerprint = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stage', 'created_at']),
+            models.Index(fields=['created_at']),
+            # The incremental rollup run finds changed orders by updated_at.
+            models.Index(fields=['updated_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['idempotency_user', 'idempotency_key'], name='unique_order_idempotency_key'),
+        ]
 
     def __str__(self):
         return f'Order {self.id}'
@@ -59,12 +133,70 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product_quantity = models.ForeignKey(ProductQuantity, on_delete=models.CASCADE)
+    # Unit price when the line was added, so later price changes leave the
+    # order's total alone. Lines written without one (raw inserts, bulk_create
+    # outside the API) are priced at the product's current price.
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.order} - {self.product_quantity.product.name}"
 
 
-class Warehouse(models.Model):
+
+class ArchivedOrder(models.Model):
+    # A closed order moved out of Order by archive_orders; it keeps its id.
+    id = models.BigIntegerField(primary_key=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    stage = models.CharField(max_length=50, choices=Order.STAGE_CHOICES)
+    description = models.TextField(null=True, blank=True)
+    total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    line_count = models.PositiveIntegerField(default=0)
+    warehouse = models.ForeignKey('Warehouse', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    idempotency_user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    idempotency_fingerprint = models.CharField(max_length=64, null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['idempotency_user', 'idempotency_key'], name='unique_archived_order_idempotency_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f'Archived order {self.id}'
+
+
+class ArchivedOrderItem(models.Model):
+    # The line as it stood when archived, at the unit price it was sold for.
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product_quantity = models.ForeignKey(
+        ProductQuantity, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.order} - {self.quantity} x {self.price}"
+
+
+class Warehouse(ChangeTracked):
     name = models.CharField(max_length=50)
     address = models.TextField(null=True, blank=True)
     phone = models.CharField(max_length=15, null=True, blank=True)
@@ -77,5 +209,154 @@ class WarehouseItem(models.Model):
     product_quantity = models.ForeignKey(ProductQuantity, on_delete=models.CASCADE)
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['warehouse', 'id']),
+        ]
+        constraints = [
+            # Also serves as the (warehouse, product_quantity) composite index.
+            models.UniqueConstraint(fields=['warehouse', 'product_quantity'], name='unique_warehouse_product_quantity'),
+        ]
+
     def __str__(self):
         return f"{self.product_quantity.product.name} in {self.warehouse.name}"
+
+
+class StockLevel(models.Model):
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='stock_levels')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_levels')
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['warehouse', 'product'], name='unique_stock_level'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} in {self.warehouse.name} - {self.quantity}"
+
+
+class StockMovement(models.Model):
+    REASON_CHOICES = (
+        ('Opening', 'Opening'),
+        ('Received', 'Received'),
+        ('Adjusted', 'Adjusted'),
+        ('Removed', 'Removed'),
+        ('Reserved', 'Reserved'),
+        ('Released', 'Released'),
+    )
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='stock_movements')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=50, choices=REASON_CHOICES)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.product.name} in {self.warehouse.name} {self.delta:+d}"
+
+
+class SalesRollup(models.Model):
+    GRANULARITY_CHOICES = (
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    )
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    stage = models.CharField(max_length=50, choices=Order.STAGE_CHOICES)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True)
+    revenue = models.DecimalField(max_digits=15, decimal_places=2)
+    units = models.PositiveIntegerField()
+    lines = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['granularity', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:%M} {self.stage}"
+
+
+class RollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
+
+
+class StaleRollupDay(models.Model):
+    # A day that lost orders since the last rollup run; deleted orders leave
+    # no updated_at for the incremental run to find.
+    day = models.DateTimeField(unique=True)
+
+    def __str__(self):
+        return f"{self.day:%Y-%m-%d}"
+
+
+class ImportCheckpoint(models.Model):
+    source = models.CharField(max_length=255, unique=True)
+    rows = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} - {self.rows}"
+
+
+class ChangeCounter(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
+
+
+class Tombstone(models.Model):
+    # Left behind by a deleted catalog row so /sync/ can report the deletion.
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted @ {self.change_seq}"
+
+
+class Job(models.Model):
+    # Background work run by `manage.py run_workers`; see warehouse.jobs.
+    STATUS_CHOICES = (
+        ('Queued', 'Queued'),
+        ('Running', 'Running'),
+        ('Succeeded', 'Succeeded'),
+        ('Failed', 'Failed'),
+    )
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Queued')
+    progress = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    # Where a retried attempt resumes; written with the work it records.
+    checkpoint = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    worker = models.CharField(max_length=255, blank=True, default='')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Claiming: the oldest queued job that is due.
+            models.Index(fields=['status', 'run_after', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
@@ -0,0 +1,99 @@
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from warehouse.models import Order, OrderItem, ProductQuantity
+
+# The line's own price, or the product's current one for lines written
+# without a snapshot.
+UNIT_PRICE = Coalesce(F('price'), F('product_quantity__product__price'))
+
+LINE_AMOUNT = ExpressionWrapper(
+    F('product_quantity__quantity') * UNIT_PRICE,
+    output_field=DecimalField(max_digits=15, decimal_places=2),
+)
+
+CENT = Decimal('0.01')
+
+
+def computed_totals(order_ids):
+    # One aggregate query for any number of orders; orders without items are
+    # absent from the result.
+    rows = (
+        OrderItem.objects
+        .filter(order_id__in=order_ids)
+        .values('order_id')
+        .annotate(total=Sum(LINE_AMOUNT), line_count=Count('id'))
+        .order_by()
+    )
+    return {
+        row['order_id']: (Decimal(row['total']).quantize(CENT), row['line_count'])
+        for row in rows
+    }
+
+
+def price_items(items):
+    # Sets each unsaved line's price to its product's current price, with one
+    # query for any number of lines.
+    prices = dict(
+        ProductQuantity.objects
+        .filter(pk__in={item.product_quantity_id for item in items})
+        .values_list('pk', 'product__price')
+    )
+    for item in items:
+        item.price = prices.get(item.product_quantity_id)
+    return items
+
+
+def _apply(item_ids, sign):
+    if not item_ids:
+        return
+    rows = (
+        OrderItem.objects
+        .filter(pk__in=item_ids)
+        .values('order_id')
+        .annotate(amount=Sum(LINE_AMOUNT), lines=Count('id'))
+        .order_by('order_id')
+    )
+    now = timezone.now()
+    for row in rows:
+        # Clamped so that totals which drifted (e.g. lines written outside the
+        # API) never block a removal; reconcile_order_totals repairs them.
+        Order.objects.filter(pk=row['order_id']).update(
+            total=Greatest(F('total') + sign * Decimal(row['amount']).quantize(CENT), Value(Decimal('0.00'))),
+            line_count=Greatest(F('line_count') + sign * row['lines'], Value(0)),
+            updated_at=now,
+        )
+
+
+def items_added(items):
+    # Call after the items are written.
+    _apply([item.pk for item in items], 1)
+
+
+def items_removed(items):
+    # Call before the items are deleted or changed, while their current order
+    # and product quantity are still in the database.
+    _apply([item.pk for item in items], -1)
+
+
+def quantity_items(product_quantities):
+    # The lines using these product quantities. A quantity change moves their
+    # amounts, so they go through items_removed before it and items_added after.
+    return list(
+        OrderItem.objects.filter(product_quantity__in=[pq.pk for pq in product_quantities]).only('pk', 'order_id')
+    )
+
+
+def quantities_removed(product_quantities):
+    # Deleting a product quantity cascades to the order lines that use it.
+    items_removed(quantity_items(product_quantities))
+
+
+def products_removed(product_ids):
+    # Deleting a product cascades through its product quantities to the
+    # order lines that use them.
+    items = OrderItem.objects.filter(product_quantity__product__in=product_ids)
+    _apply(list(items.values_list('pk', flat=True)), -1)
@@ -0,0 +1,113 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from warehouse.models import (
+    ArchivedOrder, ArchivedOrderItem, Order, OrderItem, RollupWatermark, SalesRollup, StaleRollupDay,
+)
+from warehouse.orders import LINE_AMOUNT
+
+WATERMARK = 'sales'
+
+# Orders whose transaction commits a little after the run started can carry an
+# updated_at just below the new watermark; re-reading this window catches them.
+# Rebuilding a day is idempotent, so the overlap only costs time.
+WATERMARK_LAG = timedelta(minutes=5)
+
+DIMENSIONS = (
+    'order__stage',
+    'product_quantity__product_id',
+    'product_quantity__product__category_id',
+    'product_quantity__product__supplier_id',
+)
+
+# Archived lines carry their own snapshot of the same dimensions and price.
+ARCHIVED_DIMENSIONS = ('order__stage', 'product_id', 'category_id', 'supplier_id')
+ARCHIVED_AMOUNT = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=15, decimal_places=2))
+
+
+def build_rollups(full=False):
+    started_at = timezone.now()
+    watermark = RollupWatermark.objects.filter(name=WATERMARK).first()
+
+    stale = list(StaleRollupDay.objects.values_list('pk', 'day'))
+
+    if full or watermark is None:
+        days = set(Order.objects.annotate(day=TruncDay('created_at')).values_list('day', flat=True).order_by())
+        days.update(ArchivedOrder.objects.annotate(day=TruncDay('created_at')).values_list('day', flat=True).order_by())
+    else:
+        # Archiving moves orders without changing any day's totals.
+        since = watermark.value - WATERMARK_LAG
+        days = Order.objects.filter(updated_at__gt=since).annotate(day=TruncDay('created_at'))
+        days = set(days.values_list('day', flat=True).order_by())
+        days.update(day for _, day in stale)
+    days = sorted(days)
+
+    with transaction.atomic():
+        if full:
+            SalesRollup.objects.all().delete()
+        for day in days:
+            rebuild_day(day)
+        StaleRollupDay.objects.filter(pk__in=[pk for pk, _ in stale]).delete()
+        RollupWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': started_at})
+    return days
+
+
+def orders_deleted(orders):
+    # Call for orders deleted outside archiving, so the next incremental run
+    # rebuilds their days.
+    days = {timezone.localtime(order.created_at).replace(hour=0, minute=0, second=0, microsecond=0) for order in orders}
+    StaleRollupDay.objects.bulk_create((StaleRollupDay(day=day) for day in days), ignore_conflicts=True)
+
+
+def rebuild_day(day):
+    end = day + timedelta(days=1)
+    live = (
+        OrderItem.objects
+        .filter(order__created_at__gte=day, order__created_at__lt=end)
+        .annotate(bucket=TruncHour('order__created_at'))
+        .values('bucket', *DIMENSIONS)
+        .annotate(revenue=Sum(LINE_AMOUNT), units=Sum('product_quantity__quantity'), lines=Count('id'))
+        .order_by()
+    )
+    archived = (
+        ArchivedOrderItem.objects
+        .filter(order__created_at__gte=day, order__created_at__lt=end)
+        .annotate(bucket=TruncHour('order__created_at'))
+        .values('bucket', *ARCHIVED_DIMENSIONS)
+        .annotate(revenue=Sum(ARCHIVED_AMOUNT), units=Sum('quantity'), lines=Count('id'))
+        .order_by()
+    )
+
+    hourly = defaultdict(lambda: {'revenue': 0, 'units': 0, 'lines': 0})
+    daily = defaultdict(lambda: {'revenue': 0, 'units': 0, 'lines': 0})
+    for rows, dimensions in ((live, DIMENSIONS), (archived, ARCHIVED_DIMENSIONS)):
+        for row in rows:
+            key = tuple(row[dimension] for dimension in dimensions)
+            for metric in ('revenue', 'units', 'lines'):
+                hourly[row['bucket'], key][metric] += row[metric]
+                daily[key][metric] += row[metric]
+    rollups = [_rollup('hour', bucket, key, row) for (bucket, key), row in hourly.items()]
+    rollups.extend(_rollup('day', day, key, row) for key, row in daily.items())
+
+    SalesRollup.objects.filter(bucket__gte=day, bucket__lt=end).delete()
+    SalesRollup.objects.bulk_create(rollups)
+
+
+def _rollup(granularity, bucket, key, row):
+    stage, product_id, category_id, supplier_id = key
+    return SalesRollup(
+        granularity=granularity,
+        bucket=bucket,
+        stage=stage,
+        product_id=product_id,
+        category_id=category_id,
+        supplier_id=supplier_id,
+        revenue=row['revenue'],
+        units=row['units'],
+        lines=row['lines'],
+    )
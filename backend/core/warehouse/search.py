@@ -0,0 +1,143 @@
+from itertools import combinations
+
+from django.db import connection
+from django.db.models import Q
+
+from warehouse.api.filters import prefix_match
+from warehouse.models import Product, search_key
+
+# Product lookup for the till: partial names, typos, best match first. Backed
+# by the index from migration 0014 (FTS5 trigram on SQLite, pg_trgm on
+# PostgreSQL). Text shorter than a trigram cannot use either, so it is matched
+# as a prefix of the case-folded name_search column instead.
+
+TRIGRAM = 3
+# Trigrams taken from one word when matching with typos.
+MAX_WORD_TRIGRAMS = 12
+# Rows ranked per FTS step on SQLite.
+CANDIDATES = 200
+
+
+def find_products(text, limit):
+    # Ids of the best `limit` products for the text, best first.
+    text = ' '.join(text.split())
+    if not text:
+        return []
+    if len(text) < TRIGRAM:
+        return _prefix(text, limit)
+    if connection.vendor == 'sqlite':
+        return _sqlite(text, limit)
+    if connection.vendor == 'postgresql':
+        return _postgresql(text, limit)
+    return _unindexed(text, limit)
+
+
+def _words(text):
+    return [word for word in text.split() if len(word) >= TRIGRAM]
+
+
+def _trigrams(text):
+    # In order of appearance, within words, lowercased.
+    trigrams = []
+    for word in text.lower().split():
+        for i in range(len(word) - TRIGRAM + 1):
+            if word[i:i + TRIGRAM] not in trigrams:
+                trigrams.append(word[i:i + TRIGRAM])
+    return trigrams
+
+
+def _prefix(text, limit):
+    prefix = search_key(text)[:Product._meta.get_field('name_search').max_length]
+    return list(
+        Product.objects
+        .filter(prefix_match('name_search', prefix))
+        .order_by('name_search', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _fts_string(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _sqlite(text, limit):
+    # Name prefixes first (cheapest, and usually what the barista means), then
+    # rows containing every word, then, to absorb typos, rows sharing at
+    # least two trigrams of every word (one for words too short to have
+    # more). Each FTS step ranks at most CANDIDATES rows, so cost follows the
+    # limit rather than how many rows match.
+    ids = _prefix(text, limit)
+    words = _words(text)
+    if words and len(ids) < limit:
+        match = ' AND '.join(_fts_string(word) for word in words)
+        ids += _ranked(text, _fts_candidates(match, ids), limit - len(ids))
+    if words and len(ids) < limit:
+        ids += _ranked(text, _fts_candidates(_fuzzy_match(words), ids), limit - len(ids))
+    return ids
+
+
+def _fuzzy_match(words):
+    clauses = []
+    for word in words:
+        trigrams = _trigrams(word)[:MAX_WORD_TRIGRAMS]
+        needed = 1 if len(trigrams) <= 2 else 2
+        clauses.append('(' + ' OR '.join(
+            '(' + ' AND '.join(_fts_string(trigram) for trigram in group) + ')'
+            for group in combinations(trigrams, needed)
+        ) + ')')
+    return ' AND '.join(clauses)
+
+
+def _fts_candidates(match, exclude):
+    excluded = f"AND p.id NOT IN ({', '.join(['%s'] * len(exclude))})" if exclude else ''
+    sql = f"""
+        SELECT p.id, p.name
+        FROM warehouse_product_fts
+        JOIN warehouse_product p ON p.id = warehouse_product_fts.rowid
+        WHERE warehouse_product_fts MATCH %s {excluded}
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, *exclude, CANDIDATES])
+        return cursor.fetchall()
+
+
+def _ranked(text, candidates, limit):
+    # Most query trigrams found in the name first, then shorter names.
+    wanted = set(_trigrams(text))
+    scored = sorted(
+        (-len(wanted.intersection(_trigrams(name))), len(name), pk) for pk, name in candidates
+    )
+    return [pk for _, _, pk in scored[:limit]]
+
+
+def _postgresql(text, limit):
+    # ILIKE and the word-similarity operator (<%) both use the trigram GIN
+    # indexes; name prefixes rank first, then word_similarity, which also
+    # ranks the typo-tolerant matches.
+    contains = ' AND '.join(
+        f'(name ILIKE %(word{i})s OR description ILIKE %(word{i})s)' for i in range(len(text.split()))
+    )
+    sql = f"""
+        SELECT id
+        FROM warehouse_product
+        WHERE ({contains}) OR %(text)s <%% name
+        ORDER BY name ILIKE %(prefix)s DESC, word_similarity(%(text)s, name) DESC, id
+        LIMIT %(limit)s
+    """
+    params = {f'word{i}': f'%{_escape_like(word)}%' for i, word in enumerate(text.split())}
+    params.update(text=text, prefix=f'{_escape_like(text)}%', limit=limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _unindexed(text, limit):
+    matches = Q()
+    for word in text.split():
+        matches &= Q(name__icontains=word) | Q(description__icontains=word)
+    return list(Product.objects.filter(matches).order_by('name', 'id').values_list('id', flat=True)[:limit])
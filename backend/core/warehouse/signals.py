@@ -0,0 +1,69 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from warehouse import changes, events, orders
+from warehouse.api import caching
+from warehouse.models import Category, Order, OrderItem, Product, Supplier, Warehouse, WarehouseItem
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Supplier)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog(sender, **kwargs):
+    caching.invalidate(sender)
+
+
+FEEDS = {
+    Order: events.orders_changed,
+    OrderItem: events.order_items_changed,
+    WarehouseItem: events.warehouse_items_changed,
+}
+
+
+@receiver(pre_save, sender=OrderItem)
+def price_order_item(sender, instance, **kwargs):
+    # Snapshot the unit price of lines saved without one.
+    if instance.price is None:
+        orders.price_items([instance])
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_save, sender=WarehouseItem)
+def publish_saved(sender, instance, created, **kwargs):
+    FEEDS[sender]([instance], 'created' if created else 'updated')
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_delete, sender=WarehouseItem)
+def publish_deleted(sender, instance, **kwargs):
+    FEEDS[sender]([instance], 'deleted')
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Warehouse)
+def track_saved(sender, instance, **kwargs):
+    # Kept on the instance too, so saving it again does not write back 0.
+    instance.change_seq = changes.changed(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Supplier)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Warehouse)
+def track_deleted(sender, instance, **kwargs):
+    changes.deleted(sender, [instance.pk])
+
+
+@receiver(pre_delete, sender=Supplier)
+@receiver(pre_delete, sender=Category)
+def track_orphaned_products(sender, instance, **kwargs):
+    # SET_NULL clears the products' foreign key with a plain UPDATE.
+    field = sender._meta.model_name
+    changes.changed(Product, Product.objects.filter(**{field: instance}).values_list('pk', flat=True))
@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.utils import timezone
+
+from warehouse import events, stock
+from warehouse.models import Order
+
+# action -> (stages it may start from, stage it moves the order to)
+ACTIONS = {
+    'confirm': (('Draft',), 'Confirmed'),
+    'pay': (('Confirmed',), 'Paid'),
+    'deliver': (('Paid',), 'Delivered'),
+    'cancel': (('Draft', 'Confirmed', 'Paid'), 'Cancelled'),
+}
+
+# Every legal move, including the ones only reachable through a plain update.
+TRANSITIONS = {
+    'Draft': {'Confirmed', 'Cancelled', 'Trash'},
+    'Confirmed': {'Paid', 'Cancelled'},
+    'Paid': {'Delivered', 'Cancelled'},
+    'Delivered': set(),
+    'Cancelled': {'Trash'},
+    'Trash': set(),
+}
+
+
+# Stages in which the order's stock is reserved.
+HOLDING_STOCK = ('Confirmed', 'Paid')
+
+# Stages in which the order's lines may change. Confirming reserves stock for
+# the lines the order has then, so later changes would go unreserved.
+EDITABLE = ('Draft',)
+
+
+class TransitionConflict(Exception):
+    def __init__(self, current, target):
+        self.current = current
+        self.target = target
+        super().__init__(f'Cannot move an order from {current} to {target}.')
+
+
+class LinesLocked(Exception):
+    def __init__(self, order_ids):
+        self.order_ids = order_ids
+        super().__init__(f'Lines can only change on Draft orders; orders {", ".join(map(str, order_ids))} are not.')
+
+
+def lock_lines(order_ids):
+    # Call inside the transaction that changes the orders' lines. The order
+    # rows stay locked until it ends, so a confirmation running alongside
+    # waits and then reserves stock for the lines as changed.
+    order_ids = {pk for pk in order_ids if pk is not None}
+    if not order_ids:
+        return
+    current = Order.objects.select_for_update().filter(pk__in=order_ids).values_list('pk', 'stage')
+    locked = sorted(pk for pk, stage in current if stage not in EDITABLE)
+    if locked:
+        raise LinesLocked(locked)
+
+
+def can_transition(source, target):
+    return source == target or target in TRANSITIONS.get(source, ())
+
+
+def move(order, sources, target):
+    # One conditional UPDATE: it only matches while the order is still in one
+    # of `sources`, so concurrent transitions cannot both win and no row lock
+    # is held between reading the stage and writing it. Confirming reserves
+    # the order's stock and cancelling releases it, in the same transaction;
+    # stock.InsufficientStock rolls the stage change back.
+    now = timezone.now()
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order.pk, stage__in=sources).update(stage=target, updated_at=now)
+        if not updated:
+            current = Order.objects.filter(pk=order.pk).values_list('stage', flat=True).first()
+            if current is None:
+                raise Order.DoesNotExist
+            raise TransitionConflict(current, target)
+        if target == 'Confirmed':
+            stock.reserve(order)
+        elif target == 'Cancelled':
+            stock.release(order)
+        order.stage, order.updated_at = target, now
+        events.orders_changed([order], 'updated')
+    return order
+
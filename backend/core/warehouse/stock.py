@@ -0,0 +1,184 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from warehouse.models import OrderItem, StockLevel, StockMovement, WarehouseItem
+
+
+def record_movements(movements):
+    movements = [movement for movement in movements if movement.delta]
+    if not movements:
+        return []
+
+    deltas = defaultdict(int)
+    for movement in movements:
+        deltas[(movement.warehouse_id, movement.product_id)] += movement.delta
+
+    with transaction.atomic():
+        StockMovement.objects.bulk_create(movements)
+        # Sorted so concurrent writers touch stock rows in the same order.
+        for (warehouse_id, product_id), delta in sorted(deltas.items()):
+            if delta:
+                _apply_delta(warehouse_id, product_id, delta)
+    return movements
+
+
+def _apply_delta(warehouse_id, product_id, delta):
+    levels = StockLevel.objects.filter(warehouse_id=warehouse_id, product_id=product_id)
+    if levels.update(quantity=F('quantity') + delta):
+        return
+    try:
+        with transaction.atomic():
+            StockLevel.objects.create(warehouse_id=warehouse_id, product_id=product_id, quantity=delta)
+    except IntegrityError:
+        levels.update(quantity=F('quantity') + delta)
+
+
+def _item_movement(item, sign, reason):
+    product_quantity = item.product_quantity
+    return StockMovement(
+        warehouse_id=item.warehouse_id,
+        product_id=product_quantity.product_id,
+        delta=sign * product_quantity.quantity,
+        reason=reason,
+    )
+
+
+def items_added(items):
+    return record_movements(_item_movement(item, 1, 'Received') for item in items)
+
+
+def items_removed(items):
+    return record_movements(_item_movement(item, -1, 'Removed') for item in items)
+
+
+def items_changed(changes):
+    movements = []
+    for old_item, item in changes:
+        movements.append(_item_movement(old_item, -1, 'Adjusted'))
+        movements.append(_item_movement(item, 1, 'Adjusted'))
+    return record_movements(movements)
+
+
+def _warehouse_ids(product_quantities):
+    warehouse_ids = defaultdict(list)
+    rows = (
+        WarehouseItem.objects
+        .filter(product_quantity__in=[product_quantity.pk for product_quantity in product_quantities])
+        .values_list('product_quantity_id', 'warehouse_id')
+    )
+    for product_quantity_id, warehouse_id in rows:
+        warehouse_ids[product_quantity_id].append(warehouse_id)
+    return warehouse_ids
+
+
+def quantities_changed(changes):
+    warehouse_ids = _warehouse_ids([product_quantity for _, product_quantity in changes])
+    movements = []
+    for old_product_quantity, product_quantity in changes:
+        for warehouse_id in warehouse_ids[product_quantity.pk]:
+            movements.append(StockMovement(
+                warehouse_id=warehouse_id,
+                product_id=old_product_quantity.product_id,
+                delta=-old_product_quantity.quantity,
+                reason='Adjusted',
+            ))
+            movements.append(StockMovement(
+                warehouse_id=warehouse_id,
+                product_id=product_quantity.product_id,
+                delta=product_quantity.quantity,
+                reason='Adjusted',
+            ))
+    return record_movements(movements)
+
+
+def quantities_removed(product_quantities):
+    warehouse_ids = _warehouse_ids(product_quantities)
+    return record_movements(
+        StockMovement(
+            warehouse_id=warehouse_id,
+            product_id=product_quantity.product_id,
+            delta=-product_quantity.quantity,
+            reason='Removed',
+        )
+        for product_quantity in product_quantities
+        for warehouse_id in warehouse_ids[product_quantity.pk]
+    )
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f'Not enough stock for products {", ".join(map(str, product_ids))}.')
+
+
+def reserve(order):
+    # Takes the stock for every line of the order from its warehouse, or none
+    # of it. Each decrement is a single UPDATE guarded by quantity >= demand,
+    # so parallel confirmations can never drive a level below zero.
+    demand = dict(
+        OrderItem.objects
+        .filter(order=order)
+        .values_list('product_quantity__product_id')
+        .annotate(quantity=Sum('product_quantity__quantity'))
+        .order_by()
+    )
+    if not demand:
+        return []
+    if order.warehouse_id is None:
+        raise InsufficientStock(sorted(demand))
+
+    with transaction.atomic():
+        short = [
+            product_id
+            for product_id, quantity in sorted(demand.items())
+            if not StockLevel.objects
+            .filter(warehouse_id=order.warehouse_id, product_id=product_id, quantity__gte=quantity)
+            .update(quantity=F('quantity') - quantity)
+        ]
+        if short:
+            raise InsufficientStock(short)
+        return StockMovement.objects.bulk_create(
+            StockMovement(
+                warehouse_id=order.warehouse_id,
+                product_id=product_id,
+                delta=-quantity,
+                reason='Reserved',
+                order=order,
+            )
+            for product_id, quantity in sorted(demand.items())
+        )
+
+
+def release(order):
+    # Gives back whatever the order's movements still hold, wherever it was
+    # reserved, so it stays correct if lines changed after confirmation.
+    held = (
+        StockMovement.objects
+        .filter(order=order)
+        .values_list('warehouse_id', 'product_id')
+        .annotate(quantity=Sum('delta'))
+        .order_by()
+    )
+    return record_movements(
+        StockMovement(warehouse_id=warehouse_id, product_id=product_id, delta=-quantity, reason='Released', order=order)
+        for warehouse_id, product_id, quantity in held
+        if quantity < 0
+    )
+
+
+def rebuild_levels():
+    totals = (
+        StockMovement.objects
+        .values('warehouse_id', 'product_id')
+        .annotate(quantity=Sum('delta'))
+        .order_by()
+    )
+    with transaction.atomic():
+        StockLevel.objects.all().delete()
+        levels = StockLevel.objects.bulk_create(
+            StockLevel(warehouse_id=row['warehouse_id'], product_id=row['product_id'], quantity=row['quantity'])
+            for row in totals
+        )
+    return len(levels)
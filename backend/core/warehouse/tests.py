@@ -1,13 +1,41 @@
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from rest_framework.views import APIView
 from django.urls import reverse
 from django.contrib.auth.models import User
-from warehouse.models import Supplier, Category, Product, ProductQuantity, Order, OrderItem, Warehouse, WarehouseItem
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.client import AsyncClientHandler
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from warehouse import archive, changes, events, jobs, reports, stages, stock
+from warehouse.api import caching
+from warehouse.api.authentication import CachedJWTStatelessUserAuthentication, verified_tokens
+from warehouse.api.pagination import NestedItemCursorPagination
+from warehouse.api.renderers import to_columns
+from warehouse.migrations import _search as search_migration
+from warehouse.models import (
+    Supplier, Category, Product, ProductQuantity, Order, OrderItem, Warehouse, WarehouseItem, StockLevel, StockMovement,
+    ImportCheckpoint, ArchivedOrder, SalesRollup, StaleRollupDay, Job,
+)
 
 class AuthTests(APITestCase):
     def setUp(self):
         self.auth_url = '/api/token/'
         self.auth_data = {'username': 'berzezek', 'password': 'foo'}
+        caching.get_cache().clear()
         self.create_user()
         self.auth_user()
 
@@ -16,7 +44,18 @@ class AuthTests(APITestCase):
 
     def auth_user(self):
         auth_response = self.client.post(self.auth_url, self.auth_data, format='json')
-        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + auth_response.data['access'])
+        self.access_token = auth_response.data['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+
+class QueryCountMixin:
+    def assertMaxQueries(self, url, max_queries):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        queries = context.captured_queries
+        self.assertLessEqual(len(queries), max_queries, '\n'.join(query['sql'] for query in queries))
+        return response
+
 
 class SupplierTests(AuthTests):
     
@@ -398,7 +437,7 @@ class OrderItemTest(AuthTests):
     def test_update_items(self):
         order_item = OrderItem.objects.get(order=self.order)
         new_order = Order.objects.create(
-            stage='Confirmed',
+            stage='Draft',
             description='Test description'
         )
         update_data = {'order': new_order.id}
@@ -505,7 +544,7 @@ class WarehouseItemTest(AuthTests):
 
     def test_create_item(self):
         self.item_data['warehouse'] = self.warehouse.id
-        self.item_data['product_quantity'] = self.product_quantity.id
+        self.item_data['product_quantity'] = self.set_product_quantity().id
         response = self.client.post(self.url, self.item_data, format='json')
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -513,6 +552,14 @@ class WarehouseItemTest(AuthTests):
         self.assertEqual(WarehouseItem.objects.last().warehouse.name, 'Test Item')
         self.assertEqual(WarehouseItem.objects.last().product_quantity.product.name, 'Test Item')
 
+    def test_create_duplicate_item(self):
+        self.item_data['warehouse'] = self.warehouse.id
+        self.item_data['product_quantity'] = self.product_quantity.id
+        response = self.client.post(self.url, self.item_data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(WarehouseItem.objects.count(), 1)
+
     def test_get_items(self):
         response = self.client.get(self.url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -544,4 +591,1723 @@ class WarehouseItemTest(AuthTests):
         response = self.client.delete(f'{self.url}{warehouse_item.id}/', format='json')
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertEqual(WarehouseItem.objects.count(), 0)
\ No newline at end of file
+        self.assertEqual(WarehouseItem.objects.count(), 0)
+
+class NestedItemsPaginationTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.warehouse = Warehouse.objects.create(name='Test Warehouse')
+        self.order = Order.objects.create(stage='Draft')
+        product = Product.objects.create(name='Test Item', price=20.0)
+        for i in range(25):
+            product_quantity = ProductQuantity.objects.create(product=product, quantity=i + 1)
+            WarehouseItem.objects.create(warehouse=self.warehouse, product_quantity=product_quantity)
+            OrderItem.objects.create(order=self.order, product_quantity=product_quantity)
+
+    def collect_pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 10)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_warehouse_items_pages(self):
+        ids = self.collect_pages(f'/api/v1/items/{self.warehouse.id}/')
+
+        expected = list(WarehouseItem.objects.filter(warehouse=self.warehouse).order_by('id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_order_items_pages(self):
+        ids = self.collect_pages(f'/api/v1/order/{self.order.id}/')
+
+        expected = list(OrderItem.objects.filter(order=self.order).order_by('id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(f'/api/v1/items/{self.warehouse.id}/?page_size=5', format='json')
+        self.assertEqual(len(response.data['results']), 5)
+
+        with mock.patch.object(NestedItemCursorPagination, 'max_page_size', 20):
+            response = self.client.get(f'/api/v1/items/{self.warehouse.id}/?page_size=1000', format='json')
+        self.assertEqual(len(response.data['results']), 20)
+
+
+class StockLedgerTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.warehouse = Warehouse.objects.create(name='Test Warehouse')
+        self.product = Product.objects.create(name='Test Item', price=20.0)
+        self.url = f'/api/v1/warehouses/{self.warehouse.id}/stock/'
+
+    def stock_of(self, product):
+        return StockLevel.objects.get(warehouse=self.warehouse, product=product).quantity
+
+    def add_item(self, quantity):
+        product_quantity = ProductQuantity.objects.create(product=self.product, quantity=quantity)
+        response = self.client.post(
+            '/api/v1/warehouse-items/',
+            {'warehouse': self.warehouse.id, 'product_quantity': product_quantity.id},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return product_quantity, response.data['id']
+
+    def test_item_create_and_delete_update_stock(self):
+        self.add_item(5)
+        _, item_id = self.add_item(7)
+        self.assertEqual(self.stock_of(self.product), 12)
+
+        self.client.delete(f'/api/v1/warehouse-items/{item_id}/', format='json')
+        self.assertEqual(self.stock_of(self.product), 5)
+        self.assertEqual(StockMovement.objects.count(), 3)
+
+    def test_quantity_update_and_delete_update_stock(self):
+        product_quantity, _ = self.add_item(5)
+        other_product = Product.objects.create(name='Other Item', price=5.0)
+
+        self.client.patch(f'/api/v1/product-quantities/{product_quantity.id}/', {'quantity': 8}, format='json')
+        self.assertEqual(self.stock_of(self.product), 8)
+
+        self.client.patch(
+            f'/api/v1/product-quantities/{product_quantity.id}/', {'product': other_product.id}, format='json'
+        )
+        self.assertEqual(self.stock_of(self.product), 0)
+        self.assertEqual(self.stock_of(other_product), 8)
+
+        self.client.delete(f'/api/v1/product-quantities/{product_quantity.id}/', format='json')
+        self.assertEqual(self.stock_of(other_product), 0)
+
+    def test_stock_endpoint(self):
+        self.add_item(5)
+
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'warehouse': self.warehouse.id, 'product': self.product.id, 'quantity': 5}
+        ])
+
+        response = self.client.get(f'{self.url}?product={self.product.id + 1}', format='json')
+        self.assertEqual(response.data['results'], [])
+
+        for product in ('abc', '²'):
+            response = self.client.get(self.url, {'product': product})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data, {'product': ['A valid integer is required.']})
+
+    def test_rebuild_stock(self):
+        self.add_item(5)
+        self.add_item(3)
+        StockLevel.objects.update(quantity=0)
+
+        call_command('rebuild_stock', stdout=io.StringIO())
+        self.assertEqual(self.stock_of(self.product), 8)
+
+
+class BulkOperationsTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.url = '/api/v1/products/bulk/'
+        self.category = Category.objects.create(name='Test Category')
+
+    def test_bulk_create(self):
+        payload = [
+            {'name': f'Product {i}', 'price': '1.50', 'category': self.category.id}
+            for i in range(50)
+        ]
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 50)
+        self.assertEqual(Product.objects.filter(category=self.category).count(), 50)
+
+    def test_bulk_create_reports_row_errors(self):
+        payload = [
+            {'name': 'Good', 'price': '1.50'},
+            {'name': 'Bad'},
+        ]
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('price', response.data[1])
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_bulk_update(self):
+        products = Product.objects.bulk_create(Product(name=f'Product {i}', price=1) for i in range(3))
+        payload = [{'id': product.id, 'price': '2.00'} for product in products]
+        response = self.client.patch(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(Product.objects.values_list('price', flat=True)), {2})
+
+        response = self.client.patch(self.url, [{'id': products[-1].id + 1, 'price': '3.00'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {'id': ['Not found.']})
+
+    def test_bulk_destroy(self):
+        products = Product.objects.bulk_create(Product(name=f'Product {i}', price=1) for i in range(3))
+        response = self.client.delete(self.url, [products[0].id, products[1].id], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Product.objects.values_list('id', flat=True)), [products[2].id])
+
+    def test_bulk_warehouse_items_update_stock(self):
+        warehouse = Warehouse.objects.create(name='Test Warehouse')
+        product = Product.objects.create(name='Test Item', price=1)
+        product_quantities = ProductQuantity.objects.bulk_create(
+            ProductQuantity(product=product, quantity=quantity) for quantity in (2, 3)
+        )
+        payload = [{'warehouse': warehouse.id, 'product_quantity': pq.id} for pq in product_quantities]
+        response = self.client.post('/api/v1/warehouse-items/bulk/', payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(StockLevel.objects.get(warehouse=warehouse, product=product).quantity, 5)
+
+        payload = [{'id': pq.id, 'quantity': 10} for pq in product_quantities]
+        self.client.patch('/api/v1/product-quantities/bulk/', payload, format='json')
+        self.assertEqual(StockLevel.objects.get(warehouse=warehouse, product=product).quantity, 20)
+
+        ids = [item['id'] for item in response.data]
+        self.client.delete('/api/v1/warehouse-items/bulk/', ids, format='json')
+        self.assertEqual(StockLevel.objects.get(warehouse=warehouse, product=product).quantity, 0)
+
+    def test_bulk_conflicts_are_reported_by_row(self):
+        warehouse = Warehouse.objects.create(name='Test Warehouse')
+        product = Product.objects.create(name='Test Item', price=1)
+        product_quantities = ProductQuantity.objects.bulk_create(
+            ProductQuantity(product=product, quantity=quantity) for quantity in (2, 3)
+        )
+        payload = [{'warehouse': warehouse.id, 'product_quantity': pq.id} for pq in product_quantities]
+        payload.append(payload[0])
+
+        with self.assertLogs('warehouse.api.mixins', 'WARNING') as logs:
+            response = self.client.post('/api/v1/warehouse-items/bulk/', payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {}, {'non_field_errors': ['This row conflicts with existing data.']}])
+        self.assertIn('UNIQUE', logs.output[0])
+        self.assertFalse(WarehouseItem.objects.exists())
+
+
+class ExpandTest(QueryCountMixin, AuthTests):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Test Category')
+        warehouse = Warehouse.objects.create(name='Test Warehouse')
+        self.order = Order.objects.create(stage='Draft')
+        for i in range(20):
+            product = Product.objects.create(name=f'Product {i}', price=1, category=category)
+            product_quantity = ProductQuantity.objects.create(product=product, quantity=i + 1)
+            OrderItem.objects.create(order=self.order, product_quantity=product_quantity)
+            WarehouseItem.objects.create(warehouse=warehouse, product_quantity=product_quantity)
+
+    def test_expanded_order_items(self):
+        # user, count, items joined to their product quantity, product and order
+        response = self.assertMaxQueries('/api/v1/order-items/?expand=product_quantity.product,order', 3)
+
+        item = response.data['results'][0]
+        self.assertEqual(item['order']['id'], self.order.id)
+        self.assertEqual(item['product_quantity']['product']['name'], 'Product 0')
+        self.assertIsInstance(item['product_quantity']['product']['category'], int)
+
+    def test_expanded_order_with_items(self):
+        # user, count, orders, then one prefetch per level of items
+        response = self.assertMaxQueries('/api/v1/orders/?expand=items.product_quantity.product.category', 7)
+
+        items = response.data['results'][0]['items']
+        self.assertEqual(len(items), 20)
+        self.assertEqual(items[0]['product_quantity']['product']['category']['name'], 'Test Category')
+
+    def test_nested_endpoints_expand(self):
+        self.assertMaxQueries(f'/api/v1/items/{WarehouseItem.objects.first().warehouse_id}/?expand=warehouse,product_quantity.product', 2)
+        response = self.assertMaxQueries(f'/api/v1/order/{self.order.id}/?expand=product_quantity', 2)
+
+        self.assertEqual(response.data['results'][0]['product_quantity']['quantity'], 1)
+
+    def test_unknown_expand_is_ignored(self):
+        response = self.assertMaxQueries('/api/v1/order-items/?expand=nope,order.nope', 3)
+
+        self.assertIsInstance(response.data['results'][0]['product_quantity'], int)
+        self.assertIsInstance(response.data['results'][0]['order'], dict)
+
+    def test_flat_lists_are_bounded(self):
+        for url in ('/api/v1/products/', '/api/v1/product-quantities/', '/api/v1/order-items/', '/api/v1/warehouse-items/'):
+            self.assertMaxQueries(url, 3)
+
+
+class CatalogCacheTest(QueryCountMixin, AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Test Category')
+        self.product = Product.objects.create(name='Test Item', price=20.0, category=self.category)
+        self.url = '/api/v1/products/'
+
+    def test_cached_list_skips_database(self):
+        first = self.client.get(self.url, format='json')
+
+        # only the user lookup remains
+        second = self.assertMaxQueries(self.url, 1)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url, format='json')['ETag']
+
+        response = self.client.get(self.url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(f'{self.url}{self.product.id}/', {'name': 'Renamed'}, format='json')
+        response = self.client.get(self.url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed')
+
+    def test_related_change_invalidates_expanded_products(self):
+        url = f'{self.url}{self.product.id}/?expand=category'
+        self.client.get(url, format='json')
+
+        self.category.name = 'Renamed'
+        self.category.save()
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data['category']['name'], 'Renamed')
+
+    def test_bulk_changes_invalidate(self):
+        self.client.get(self.url, format='json')
+
+        self.client.post(f'{self.url}bulk/', [{'name': 'Bulk Item', 'price': '1.00'}], format='json')
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.data['count'], 2)
+
+
+class AsyncEndpointsTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.warehouse = Warehouse.objects.create(name='Test Warehouse')
+        self.products = Product.objects.bulk_create(Product(name=f'Product {i}', price=1) for i in range(5))
+        self.order = Order.objects.create(stage='Draft', description='Test description')
+        StockLevel.objects.create(warehouse=self.warehouse, product=self.products[0], quantity=7)
+
+    def test_product_list(self):
+        response = self.client.get('/api/v1/async/products/?limit=2&offset=2')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual([item['name'] for item in data['results']], ['Product 2', 'Product 3'])
+        self.assertIn('offset=4', data['next'])
+        self.assertNotIn('offset', data['previous'])
+
+    def test_order_detail(self):
+        response = self.client.get(f'/api/v1/async/orders/{self.order.id}/')
+        self.assertEqual(response.json(), self.client.get(f'/api/v1/orders/{self.order.id}/', format='json').json())
+
+        response = self.client.get(f'/api/v1/async/orders/{self.order.id + 1}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_warehouse_stock(self):
+        response = self.client.get(f'/api/v1/async/warehouses/{self.warehouse.id}/stock/')
+
+        self.assertEqual(response.json()['results'], [
+            {'warehouse': self.warehouse.id, 'product': self.products[0].id, 'quantity': 7}
+        ])
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        response = self.client.get('/api/v1/async/products/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer nope')
+        response = self.client.get('/api/v1/async/products/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class OrderTotalsTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(stage='Draft')
+        self.coffee = Product.objects.create(name='Coffee', price='2.50')
+        self.cake = Product.objects.create(name='Cake', price='4.00')
+        self.url = '/api/v1/order-items/'
+
+    def add_line(self, product, quantity, order=None):
+        product_quantity = ProductQuantity.objects.create(product=product, quantity=quantity)
+        response = self.client.post(
+            self.url, {'order': (order or self.order).id, 'product_quantity': product_quantity.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def assertTotals(self, order, total, line_count):
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.line_count), (Decimal(total), line_count))
+
+    def test_lines_update_totals(self):
+        self.add_line(self.coffee, 2)
+        item_id = self.add_line(self.cake, 1)
+        self.assertTotals(self.order, '9.00', 2)
+
+        other_order = Order.objects.create(stage='Draft')
+        self.client.patch(f'{self.url}{item_id}/', {'order': other_order.id}, format='json')
+        self.assertTotals(self.order, '5.00', 1)
+        self.assertTotals(other_order, '4.00', 1)
+
+        self.client.delete(f'{self.url}{item_id}/', format='json')
+        self.assertTotals(other_order, '0.00', 0)
+
+    def test_bulk_lines_update_totals(self):
+        product_quantities = ProductQuantity.objects.bulk_create(
+            ProductQuantity(product=self.coffee, quantity=quantity) for quantity in (1, 2, 3)
+        )
+        payload = [{'order': self.order.id, 'product_quantity': pq.id} for pq in product_quantities]
+        response = self.client.post(f'{self.url}bulk/', payload, format='json')
+        self.assertTotals(self.order, '15.00', 3)
+
+        self.client.delete(f'{self.url}bulk/', [response.data[0]['id']], format='json')
+        self.assertTotals(self.order, '12.50', 2)
+
+    def test_lines_keep_their_price(self):
+        item_id = self.add_line(self.coffee, 2)
+        self.client.patch(f'/api/v1/products/{self.coffee.id}/', {'price': '3.00'}, format='json')
+
+        self.assertEqual(self.client.get(f'{self.url}{item_id}/').data['price'], '2.50')
+        out = io.StringIO()
+        call_command('reconcile_order_totals', '--dry-run', stdout=out)
+        self.assertIn('found 0 with drift', out.getvalue())
+        self.client.delete(f'{self.url}{item_id}/', format='json')
+        self.assertTotals(self.order, '0.00', 0)
+
+    def test_quantity_changes_update_totals(self):
+        self.add_line(self.coffee, 2)
+        product_quantity = ProductQuantity.objects.get()
+
+        self.client.patch(f'/api/v1/product-quantities/{product_quantity.id}/', {'quantity': 3}, format='json')
+        self.assertTotals(self.order, '7.50', 1)
+
+        self.client.patch('/api/v1/product-quantities/bulk/', [{'id': product_quantity.id, 'quantity': 1}], format='json')
+        self.assertTotals(self.order, '2.50', 1)
+
+    def test_deleting_products_updates_totals(self):
+        self.add_line(self.coffee, 2)
+        self.add_line(self.cake, 1)
+        tea = Product.objects.create(name='Tea', price='1.50')
+        self.add_line(tea, 2)
+
+        self.client.delete(f'/api/v1/products/{self.cake.id}/', format='json')
+        self.assertTotals(self.order, '8.00', 2)
+
+        self.client.delete('/api/v1/products/bulk/', [tea.id], format='json')
+        self.assertTotals(self.order, '5.00', 1)
+
+    def test_totals_are_read_only(self):
+        response = self.client.patch(f'/api/v1/orders/{self.order.id}/', {'total': '100.00'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTotals(self.order, '0.00', 0)
+
+    def test_reconcile(self):
+        self.add_line(self.coffee, 2)
+        Order.objects.filter(pk=self.order.pk).update(total=1, line_count=5)
+
+        out = io.StringIO()
+        call_command('reconcile_order_totals', '--dry-run', stdout=out)
+        self.assertIn('found 1 with drift', out.getvalue())
+        self.assertTotals(self.order, '1.00', 5)
+
+        call_command('reconcile_order_totals', '--batch-size', '1', stdout=out)
+        self.assertTotals(self.order, '5.00', 1)
+
+
+class ReportsTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.drinks = Category.objects.create(name='Drinks')
+        self.coffee = Product.objects.create(name='Coffee', price='2.50', category=self.drinks)
+        self.cake = Product.objects.create(name='Cake', price='4.00')
+        self.paid = self.create_order('Paid', datetime(2024, 5, 1, 9, 30, tzinfo=dt_timezone.utc), [(self.coffee, 2)])
+        self.draft = self.create_order(
+            'Draft', datetime(2024, 5, 2, 14, 0, tzinfo=dt_timezone.utc), [(self.coffee, 1), (self.cake, 3)]
+        )
+        call_command('build_rollups', stdout=io.StringIO())
+
+    def create_order(self, stage, created_at, lines):
+        order = Order.objects.create(stage=stage)
+        for product, quantity in lines:
+            OrderItem.objects.create(
+                order=order, product_quantity=ProductQuantity.objects.create(product=product, quantity=quantity)
+            )
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        order.refresh_from_db()
+        return order
+
+    def revenue(self, query, key):
+        response = self.client.get(f'/api/v1/reports/revenue/?{query}', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row[key], row['revenue']) for row in response.data['results']]
+
+    def test_revenue_by_day_and_stage(self):
+        self.assertEqual(self.revenue('group_by=day', 'bucket'), [
+            (datetime(2024, 5, 1, tzinfo=dt_timezone.utc), Decimal('5.00')),
+            (datetime(2024, 5, 2, tzinfo=dt_timezone.utc), Decimal('14.50')),
+        ])
+        self.assertEqual(self.revenue('group_by=stage', 'stage'), [('Draft', Decimal('14.50')), ('Paid', Decimal('5.00'))])
+        self.assertEqual(self.revenue('group_by=category', 'category__name'), [(None, Decimal('12.00')), ('Drinks', Decimal('7.50'))])
+        self.assertEqual(self.revenue('group_by=hour&stage=Paid&start=2024-05-01&end=2024-05-01', 'bucket'), [
+            (datetime(2024, 5, 1, 9, tzinfo=dt_timezone.utc), Decimal('5.00')),
+        ])
+
+    def test_top_products(self):
+        response = self.client.get('/api/v1/reports/top-products/?limit=1', format='json')
+
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['product__name'], 'Cake')
+        self.assertEqual(response.data['results'][0]['revenue'], Decimal('12.00'))
+
+    def test_incremental_rebuild(self):
+        self.draft.stage = 'Paid'
+        self.draft.save()
+        call_command('build_rollups', stdout=io.StringIO())
+
+        self.assertEqual(self.revenue('group_by=stage', 'stage'), [('Paid', Decimal('19.50'))])
+
+    def test_incremental_rebuild_drops_deleted_orders(self):
+        self.client.delete(f'/api/v1/orders/{self.draft.id}/')
+        call_command('build_rollups', stdout=io.StringIO())
+
+        self.assertEqual(self.revenue('group_by=stage', 'stage'), [('Paid', Decimal('5.00'))])
+        self.assertFalse(StaleRollupDay.objects.exists())
+
+    def test_invalid_parameters(self):
+        response = self.client.get('/api/v1/reports/revenue/?group_by=week', format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get('/api/v1/reports/revenue/?start=yesterday', format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StatelessAuthenticationTest(QueryCountMixin, AuthTests):
+    def setUp(self):
+        super().setUp()
+        verified_tokens.clear()
+        patcher = mock.patch.object(APIView, 'authentication_classes', [CachedJWTStatelessUserAuthentication])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Order.objects.create(stage='Draft')
+
+    def test_no_user_query(self):
+        # count and page only: no user or session lookup
+        self.assertMaxQueries('/api/v1/orders/', 2)
+
+    def test_verified_tokens_are_cached(self):
+        self.client.get('/api/v1/orders/', format='json')
+
+        with mock.patch('rest_framework_simplejwt.authentication.JWTAuthentication.get_validated_token') as verify:
+            response = self.client.get('/api/v1/orders/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        verify.assert_not_called()
+
+    def test_invalid_token_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer nope')
+        response = self.client.get('/api/v1/orders/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_api_requests_do_not_touch_sessions(self):
+        self.client.cookies['sessionid'] = 'stale-session-key'
+        self.assertMaxQueries('/api/v1/orders/', 2)
+
+    def test_staff_status_comes_from_the_token(self):
+        response = self.client.post('/api/v1/jobs/', {'kind': 'build_rollups'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        user = User.objects.get(username=self.auth_data['username'])
+        User.objects.filter(pk=user.pk).update(is_staff=True)
+        self.auth_user()
+        response = self.client.post('/api/v1/jobs/', {'kind': 'build_rollups'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Job.objects.get().created_by_id, user.pk)
+
+
+class ExportTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.warehouse = Warehouse.objects.create(name='Test Warehouse')
+        self.product = Product.objects.create(name='Coffee', price='2.50')
+        self.orders = [Order.objects.create(stage=stage) for stage in ('Draft', 'Paid', 'Paid')]
+        OrderItem.objects.create(
+            order=self.orders[1], product_quantity=ProductQuantity.objects.create(product=self.product, quantity=2)
+        )
+        Order.objects.filter(pk=self.orders[0].pk).update(created_at=datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+        StockLevel.objects.create(warehouse=self.warehouse, product=self.product, quantity=4)
+
+    def get_lines(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_orders_csv(self):
+        lines = self.get_lines('/api/v1/export/orders.csv')
+
+        self.assertEqual(lines[0], 'id,created_at,updated_at,stage,description,total,line_count')
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith(f'{self.orders[0].id},2024-01-01T00:00:00+00:00,'))
+
+    def test_orders_jsonl_filters(self):
+        lines = self.get_lines('/api/v1/export/orders.jsonl?stage=Paid&created_after=2024-06-01')
+
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id'] for row in rows], [order.id for order in self.orders[1:]])
+        self.assertEqual(rows[0]['total'], '0.00')
+
+    def test_order_items_and_stock(self):
+        lines = self.get_lines('/api/v1/export/order-items.jsonl?stage=Paid')
+        self.assertEqual(json.loads(lines[0])['product_name'], 'Coffee')
+
+        lines = self.get_lines(f'/api/v1/export/stock.csv?warehouse={self.warehouse.id}')
+        self.assertEqual(lines[1], f'{self.warehouse.id},{self.product.id},Coffee,4')
+
+    def test_archived_orders_are_exported(self):
+        long_ago = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        Order.objects.filter(pk=self.orders[1].pk).update(stage='Delivered', created_at=long_ago, updated_at=long_ago)
+        archive.archive_orders(datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertTrue(ArchivedOrder.objects.filter(pk=self.orders[1].pk).exists())
+
+        lines = self.get_lines('/api/v1/export/orders.csv')
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]], [order.id for order in self.orders])
+
+        rows = [json.loads(line) for line in self.get_lines('/api/v1/export/order-items.jsonl?stage=Delivered')]
+        self.assertEqual([(row['order'], row['product_name'], row['quantity'], row['price']) for row in rows], [
+            (self.orders[1].id, 'Coffee', 2, '2.50'),
+        ])
+
+    async def test_streams_asynchronously_under_asgi(self):
+        with mock.patch('warehouse.api.export.CHUNK_SIZE', 2):
+            response = await self.async_client.get(
+                '/api/v1/export/orders.csv', headers={'Authorization': f'Bearer {self.access_token}'}
+            )
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(len(b''.join(chunks).decode().splitlines()), 4)
+
+    def test_invalid_filter(self):
+        response = self.client.get('/api/v1/export/orders.csv?created_before=soon')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportCatalogTest(AuthTests):
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as target:
+            target.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def run_import(self, *args):
+        out = io.StringIO()
+        call_command('import_catalog', *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_products_csv(self):
+        path = self.write_file('.csv', (
+            'name,price,category,supplier\n'
+            'Coffee,2.50,Drinks,Acme\n'
+            'Tea,1.75,Drinks,\n'
+            'Cake,3.00,Food,Acme\n'
+        ))
+
+        output = self.run_import('products', path, '--batch-size', '2')
+
+        self.assertIn('Imported 3 products rows', output)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(Supplier.objects.count(), 1)
+        tea = Product.objects.get(name='Tea')
+        self.assertEqual(tea.category.name, 'Drinks')
+        self.assertIsNone(tea.supplier)
+
+    def test_import_stock_jsonl(self):
+        Product.objects.create(name='Coffee', price='2.50')
+        path = self.write_file('.jsonl', (
+            '{"product": "Coffee", "quantity": 5, "warehouse": "Main"}\n'
+            '{"product": "Coffee", "quantity": 3, "warehouse": "Main"}\n'
+        ))
+
+        self.run_import('stock', path)
+
+        self.assertEqual(WarehouseItem.objects.count(), 2)
+        self.assertEqual(StockLevel.objects.get(warehouse__name='Main').quantity, 8)
+
+    def test_bad_row_rolls_back_batch(self):
+        path = self.write_file('.csv', 'product,quantity\nMissing,1\n')
+
+        with self.assertRaisesMessage(CommandError, "line 2: unknown product 'Missing'"):
+            self.run_import('stock', path)
+        self.assertEqual(ProductQuantity.objects.count(), 0)
+
+    def test_invalid_values_name_the_line(self):
+        for price, message in (('NaN', 'a finite number'), ('12345678901', 'less than 100000000'), ('two', 'a number')):
+            path = self.write_file('.csv', f'name,price\nCoffee,2.50\nTea,{price}\n')
+            with self.subTest(price=price), self.assertRaisesMessage(CommandError, f'line 3: price must be {message}'):
+                self.run_import('products', path)
+
+        path = self.write_file('.jsonl', '{"name": "Coffee", "price": 2.5}\n[1, 2]\n')
+        with self.assertRaisesMessage(CommandError, 'line 2: expected a JSON object'):
+            self.run_import('products', path)
+        self.assertFalse(Product.objects.exists())
+
+    def test_overlong_names_name_the_line(self):
+        long_name = 'x' * (Product._meta.get_field('name').max_length + 1)
+        for row, column in ((f'{long_name},2.50,', 'name'), (f'Tea,2.50,{long_name}', 'category')):
+            path = self.write_file('.csv', f'name,price,category\nCoffee,2.50,Drinks\n{row}\n')
+            with self.subTest(column=column), self.assertRaisesMessage(CommandError, f'line 3: {column} must be at most 50 characters'):
+                self.run_import('products', path)
+        self.assertFalse(Category.objects.exists())
+
+    def test_resume_skips_committed_rows(self):
+        path = self.write_file('.csv', 'name\nAcme\nGlobex\nInitech\n')
+        self.run_import('suppliers', path, '--batch-size', '2')
+        ImportCheckpoint.objects.update(rows=2)
+        Supplier.objects.filter(name='Initech').delete()
+
+        output = self.run_import('suppliers', path, '--resume')
+
+        self.assertIn('Imported 1 suppliers rows', output)
+        self.assertEqual(sorted(Supplier.objects.values_list('name', flat=True)), ['Acme', 'Globex', 'Initech'])
+
+
+class FilteringTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.drinks = Category.objects.create(name='Drinks')
+        self.acme = Supplier.objects.create(name='Acme')
+        Supplier.objects.create(name='Globex')
+        self.coffee = Product.objects.create(name='Coffee', price='2.50', category=self.drinks, supplier=self.acme)
+        self.cocoa = Product.objects.create(name='cocoa', price='3.50', category=self.drinks)
+        self.cake = Product.objects.create(name='Cake', price='4.00')
+        self.orders = [Order.objects.create(stage=stage) for stage in ('Draft', 'Paid', 'Delivered')]
+        Order.objects.filter(pk=self.orders[0].pk).update(created_at=datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+
+    def get_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.data['results']]
+
+    def test_product_search_is_case_insensitive_prefix(self):
+        self.assertEqual(self.get_ids('/api/v1/products/?search=CO'), [self.coffee.id, self.cocoa.id])
+        self.assertEqual(self.get_ids('/api/v1/suppliers/?search=glo'), [Supplier.objects.get(name='Globex').id])
+
+    def test_search_folds_non_ascii_names(self):
+        latte = Product.objects.create(name='Кофе латте', price='3.00')
+        self.client.patch('/api/v1/suppliers/bulk/', [{'id': self.acme.id, 'name': 'Straße Kaffee'}], format='json')
+
+        self.assertEqual(self.get_ids('/api/v1/products/?search=кофе'), [latte.id])
+        self.assertEqual(self.get_ids('/api/v1/products/?search=КОФЕ Л'), [latte.id])
+        self.assertEqual(self.get_ids('/api/v1/suppliers/?search=STRASSE'), [self.acme.id])
+
+    def test_product_filters(self):
+        self.assertEqual(self.get_ids(f'/api/v1/products/?category={self.drinks.id}&max_price=3'), [self.coffee.id])
+        self.assertEqual(self.get_ids(f'/api/v1/products/?supplier={self.acme.id}'), [self.coffee.id])
+        self.assertEqual(self.get_ids('/api/v1/products/?min_price=3.50'), [self.cocoa.id, self.cake.id])
+
+    def test_ordering(self):
+        self.assertEqual(
+            self.get_ids('/api/v1/products/?ordering=-price'),
+            [self.cake.id, self.cocoa.id, self.coffee.id],
+        )
+        # Fields outside the whitelist fall back to the default ordering.
+        self.assertEqual(
+            self.get_ids('/api/v1/products/?ordering=description'),
+            [self.coffee.id, self.cocoa.id, self.cake.id],
+        )
+
+    def test_order_stage_and_date_filters(self):
+        self.assertEqual(self.get_ids('/api/v1/orders/?stage=Paid,Delivered'), [order.id for order in self.orders[1:]])
+        self.assertEqual(self.get_ids('/api/v1/orders/?created_before=2024-06-01'), [self.orders[0].id])
+        self.assertEqual(
+            self.get_ids('/api/v1/orders/?stage=Draft,Paid&created_after=2024-06-01'), [self.orders[1].id]
+        )
+
+    def test_invalid_filter_values(self):
+        response = self.client.get('/api/v1/orders/?stage=Lost&created_after=soon')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'stage', 'created_after'})
+
+        response = self.client.get('/api/v1/products/?category=drinks')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        for value in ('NaN', 'sNaN', '-Infinity'):
+            response = self.client.get(f'/api/v1/products/?min_price={value}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SparseFieldsetTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Drinks')
+        self.product = Product.objects.create(name='Coffee', description='Long text', price='2.50', category=self.category)
+
+    def test_fields_narrow_response_and_select(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/products/?fields=id,name,price')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'name', 'price'])
+        selects = [query['sql'] for query in context.captured_queries if 'FROM "warehouse_product"' in query['sql']]
+        self.assertNotIn('"description"', selects[-1])
+
+    def test_fields_with_expand(self):
+        response = self.client.get(f'/api/v1/products/{self.product.id}/?fields=name,category&expand=category,supplier')
+
+        self.assertEqual(response.data, {
+            'name': 'Coffee',
+            'category': {'id': self.category.id, 'name': 'Drinks', 'description': None},
+        })
+
+    def test_nested_items_fields(self):
+        warehouse = Warehouse.objects.create(name='Main')
+        product_quantity = ProductQuantity.objects.create(product=self.product, quantity=1)
+        WarehouseItem.objects.create(warehouse=warehouse, product_quantity=product_quantity)
+
+        response = self.client.get(f'/api/v1/items/{warehouse.id}/?fields=product_quantity')
+
+        self.assertEqual(response.data['results'], [{'product_quantity': product_quantity.id}])
+
+    def test_compact_renderer(self):
+        Product.objects.create(name='Tea', price='1.75')
+
+        response = self.client.get('/api/v1/products/?fields=id,name', HTTP_ACCEPT='application/vnd.cafapp.compact+json')
+
+        self.assertEqual(response['Content-Type'], 'application/vnd.cafapp.compact+json')
+        body = json.loads(response.content)
+        self.assertEqual(body['count'], 2)
+        self.assertEqual(body['columns'], ['id', 'name'])
+        self.assertEqual(body['rows'], [[self.product.id, 'Coffee'], [self.product.id + 1, 'Tea']])
+
+    def test_compact_columns_cover_every_row(self):
+        rows = [{'id': 1, 'name': 'Coffee'}, {'id': 2, 'price': '1.75'}, {'name': 'Tea', 'id': 3}]
+
+        self.assertEqual(to_columns(rows), {
+            'columns': ['id', 'name', 'price'],
+            'rows': [[1, 'Coffee', None], [2, None, '1.75'], [3, 'Tea', None]],
+        })
+
+    def test_compact_renderer_detail_is_unchanged(self):
+        response = self.client.get(f'/api/v1/products/{self.product.id}/?format=compact&fields=name')
+
+        self.assertEqual(json.loads(response.content), {'name': 'Coffee'})
+
+
+class OrderStageTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(stage='Draft')
+        self.url = f'/api/v1/orders/{self.order.id}/'
+
+    def post_action(self, action):
+        return self.client.post(f'{self.url}{action}/')
+
+    def test_actions_walk_the_happy_path(self):
+        for action, stage in (('confirm', 'Confirmed'), ('pay', 'Paid'), ('deliver', 'Delivered')):
+            response = self.post_action(action)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['stage'], stage)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.stage, 'Delivered')
+
+    def test_illegal_action_conflicts(self):
+        response = self.post_action('deliver')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['current_stage'], 'Draft')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.stage, 'Draft')
+
+    def test_cancel_twice(self):
+        self.assertEqual(self.post_action('cancel').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.post_action('cancel').status_code, status.HTTP_409_CONFLICT)
+
+    def test_patch_checks_transitions(self):
+        response = self.client.patch(self.url, {'stage': 'Delivered'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(self.url, {'stage': 'Confirmed', 'description': 'Table 4'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.stage, self.order.description), ('Confirmed', 'Table 4'))
+
+    def test_patch_losing_a_race_conflicts(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        Order.objects.filter(pk=self.order.pk).update(stage='Cancelled')
+
+        with mock.patch('warehouse.api.views.OrderViewSet.get_object', return_value=stale):
+            response = self.client.patch(self.url, {'stage': 'Confirmed'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.stage, 'Cancelled')
+
+    def test_patch_keeps_concurrent_stage_and_totals(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        Order.objects.filter(pk=self.order.pk).update(stage='Confirmed', total='9.00', line_count=2)
+
+        with mock.patch('warehouse.api.views.OrderViewSet.get_object', return_value=stale):
+            response = self.client.patch(self.url, {'description': 'Table 4'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.order.refresh_from_db()
+        self.assertEqual(
+            (self.order.stage, self.order.total, self.order.line_count, self.order.description),
+            ('Confirmed', Decimal('9.00'), 2, 'Table 4'),
+        )
+
+    def test_bulk_create_checks_stages(self):
+        response = self.client.post('/api/v1/orders/bulk/', [{'stage': 'Paid'}, {'stage': 'Delivered'}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post('/api/v1/orders/bulk/', [{'stage': 'Confirmed'}, {}])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([order['stage'] for order in response.data], ['Confirmed', 'Draft'])
+
+    def test_bulk_update_checks_transitions(self):
+        other = Order.objects.create(stage='Paid')
+
+        response = self.client.patch('/api/v1/orders/bulk/', [
+            {'id': self.order.id, 'stage': 'Confirmed'},
+            {'id': other.id, 'stage': 'Draft'},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(Order.objects.values_list('stage', flat=True)), {'Draft', 'Paid'})
+
+
+class StockReservationTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.warehouse = Warehouse.objects.create(name='Main')
+        self.coffee = Product.objects.create(name='Coffee', price='2.50')
+        self.level = StockLevel.objects.create(warehouse=self.warehouse, product=self.coffee, quantity=5)
+        self.order = Order.objects.create(warehouse=self.warehouse)
+        for quantity in (2, 1):
+            OrderItem.objects.create(
+                order=self.order, product_quantity=ProductQuantity.objects.create(product=self.coffee, quantity=quantity)
+            )
+        self.url = f'/api/v1/orders/{self.order.id}/'
+
+    def assertLevel(self, quantity):
+        self.level.refresh_from_db()
+        self.assertEqual(self.level.quantity, quantity)
+
+    def test_confirm_reserves_and_cancel_releases(self):
+        self.assertEqual(self.client.post(f'{self.url}confirm/').status_code, status.HTTP_200_OK)
+        self.assertLevel(2)
+        self.assertEqual(StockMovement.objects.get(order=self.order).delta, -3)
+
+        self.assertEqual(self.client.post(f'{self.url}cancel/').status_code, status.HTTP_200_OK)
+        self.assertLevel(5)
+        self.assertEqual(StockMovement.objects.filter(order=self.order, reason='Released').get().delta, 3)
+
+    def test_insufficient_stock_conflicts(self):
+        StockLevel.objects.filter(pk=self.level.pk).update(quantity=2)
+
+        response = self.client.post(f'{self.url}confirm/')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()['products'], [self.coffee.id])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.stage, 'Draft')
+        self.assertLevel(2)
+
+    def test_confirm_without_warehouse_conflicts(self):
+        Order.objects.filter(pk=self.order.pk).update(warehouse=None)
+
+        self.assertEqual(self.client.post(f'{self.url}confirm/').status_code, status.HTTP_409_CONFLICT)
+
+    def test_patch_reserves_from_new_warehouse(self):
+        other = Warehouse.objects.create(name='Kiosk')
+        StockLevel.objects.create(warehouse=other, product=self.coffee, quantity=3)
+
+        response = self.client.patch(self.url, {'stage': 'Confirmed', 'warehouse': other.id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(StockLevel.objects.get(warehouse=other).quantity, 0)
+        self.assertLevel(5)
+
+        response = self.client.patch(self.url, {'warehouse': self.warehouse.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_lines_of_confirmed_orders_cannot_change(self):
+        self.client.post(f'{self.url}confirm/')
+        product_quantity = ProductQuantity.objects.create(product=self.coffee, quantity=1)
+        line = self.order.items.first()
+        total = Order.objects.get(pk=self.order.pk).total
+
+        responses = [
+            self.client.post('/api/v1/order-items/', {'order': self.order.id, 'product_quantity': product_quantity.id}),
+            self.client.post('/api/v1/order-items/bulk/', [{'order': self.order.id, 'product_quantity': product_quantity.id}], format='json'),
+            self.client.patch(f'/api/v1/order-items/{line.id}/', {'product_quantity': product_quantity.id}),
+            self.client.delete(f'/api/v1/order-items/{line.id}/'),
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_409_CONFLICT] * 4)
+        self.assertEqual(responses[0].json()['orders'], [self.order.id])
+        self.assertEqual(self.order.items.count(), 2)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total, total)
+        self.assertLevel(2)
+
+    def test_quantities_used_by_confirmed_orders_cannot_change(self):
+        self.client.post(f'{self.url}confirm/')
+        product_quantity = self.order.items.first().product_quantity
+        total = Order.objects.get(pk=self.order.pk).total
+
+        responses = [
+            self.client.patch(f'/api/v1/product-quantities/{product_quantity.id}/', {'quantity': 50}),
+            self.client.patch('/api/v1/product-quantities/bulk/', [{'id': product_quantity.id, 'quantity': 50}], format='json'),
+            self.client.delete(f'/api/v1/product-quantities/{product_quantity.id}/'),
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_409_CONFLICT] * 3)
+        product_quantity.refresh_from_db()
+        self.assertEqual(product_quantity.quantity, 2)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total, total)
+        self.assertLevel(2)
+
+    def test_draft_lines_are_reserved_as_changed(self):
+        self.client.patch(f'/api/v1/product-quantities/{self.order.items.first().product_quantity_id}/', {'quantity': 4})
+
+        self.assertEqual(self.client.post(f'{self.url}confirm/').status_code, status.HTTP_200_OK)
+        self.assertLevel(0)
+
+    def test_delivery_keeps_and_delete_releases(self):
+        stages.move(self.order, ('Draft',), 'Confirmed')
+        self.client.post(f'{self.url}pay/')
+        self.assertLevel(2)
+
+        self.client.delete(self.url)
+
+        self.assertLevel(5)
+
+
+class StockReservationConcurrencyTest(TransactionTestCase):
+    workers = 16
+
+    def test_parallel_confirmations_never_oversell(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('threads need a test database they can all open')
+        warehouse = Warehouse.objects.create(name='Main')
+        product = Product.objects.create(name='Coffee', price='2.50')
+        level = StockLevel.objects.create(warehouse=warehouse, product=product, quantity=10)
+        product_quantity = ProductQuantity.objects.create(product=product, quantity=1)
+        orders = [Order.objects.create(warehouse=warehouse) for _ in range(self.workers * 2)]
+        OrderItem.objects.bulk_create(OrderItem(order=order, product_quantity=product_quantity) for order in orders)
+
+        confirmed, failed = [], []
+        barrier = threading.Barrier(self.workers)
+
+        def confirm(batch):
+            barrier.wait()
+            try:
+                for order in batch:
+                    try:
+                        stages.move(order, ('Draft',), 'Confirmed')
+                        confirmed.append(order.pk)
+                    except stock.InsufficientStock:
+                        failed.append(order.pk)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=confirm, args=(orders[i::self.workers],)) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        level.refresh_from_db()
+        self.assertEqual(len(confirmed), 10)
+        self.assertEqual(len(failed), len(orders) - 10)
+        self.assertEqual(level.quantity, 0)
+        self.assertEqual(Order.objects.filter(stage='Confirmed').count(), 10)
+        self.assertEqual(StockMovement.objects.filter(reason='Reserved').count(), 10)
+
+
+class MetricsTest(AuthTests):
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+
+    @override_settings(METRICS_SAMPLE_RATE=1.0)
+    def test_sampled_request_is_recorded(self):
+        Product.objects.create(name='Coffee', price='2.50')
+        self.client.get('/api/v1/products/')
+
+        body = self.scrape()
+
+        self.assertIn('http_requests_total{view="warehouse:product-list",method="GET",status="200"}', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="warehouse:product-list",le="+Inf"}', body)
+        self.assertIn('db_queries_per_request_count{view="warehouse:product-list"}', body)
+        self.assertIn('serializer_duration_seconds_count{view="warehouse:product-list"}', body)
+        self.assertNotIn('view="metrics"', body)
+
+    def value(self, body, series):
+        # The registry is process-wide, so earlier tests may have recorded the same series.
+        for line in body.splitlines():
+            if line.startswith(series + ' '):
+                return float(line.split()[-1])
+        return 0
+
+    @override_settings(METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_request_skips_query_accounting(self):
+        sizes = 'http_response_size_bytes_count{view="warehouse:supplier-list"}'
+        queries = 'db_queries_per_request_count{view="warehouse:supplier-list"}'
+        before = self.scrape()
+
+        self.client.get('/api/v1/suppliers/')
+
+        body = self.scrape()
+        self.assertEqual(self.value(body, sizes), self.value(before, sizes) + 1)
+        self.assertEqual(self.value(body, queries), self.value(before, queries))
+
+    @override_settings(METRICS_SAMPLE_RATE=1.0)
+    async def test_async_requests_count_their_queries(self):
+        queries = 'db_queries_per_request_sum{view="warehouse:async-product-list"}'
+        before = (await self.async_client.get('/metrics')).content.decode()
+
+        response = await self.async_client.get(
+            '/api/v1/async/products/', headers={'Authorization': f'Bearer {self.access_token}'}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = (await self.async_client.get('/metrics')).content.decode()
+        self.assertGreaterEqual(self.value(body, queries), self.value(before, queries) + 2)
+
+    @override_settings(DEBUG=True)
+    def test_async_handler_does_not_adapt_middleware(self):
+        # Django logs every sync/async adaptation it makes while loading middleware.
+        with self.assertNoLogs('django.request', level='DEBUG'):
+            AsyncClientHandler().load_middleware(is_async=True)
+
+    @override_settings(METRICS_SAMPLE_RATE=1.0, METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('core.slow_requests', level='WARNING') as logs:
+            self.client.get('/api/v1/categories/')
+
+        self.assertIn('GET /api/v1/categories/ (warehouse:category-list)', logs.output[0])
+        self.assertIn('queries in', logs.output[0])
+
+
+class NestedOrderCreateTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.warehouse = Warehouse.objects.create(name='Main')
+        self.coffee = Product.objects.create(name='Coffee', price='2.50')
+        self.cake = Product.objects.create(name='Cake', price='4.00')
+        self.url = '/api/v1/orders/'
+        self.payload = {
+            'description': 'Table 4',
+            'warehouse': self.warehouse.id,
+            'lines': [{'product': self.coffee.id, 'quantity': 2}, {'product': self.cake.id, 'quantity': 1}],
+        }
+
+    def test_create_with_lines(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, self.payload)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total'], '9.00')
+        self.assertEqual(response.data['line_count'], 2)
+        self.assertNotIn('lines', response.data)
+        order = Order.objects.get()
+        self.assertEqual(
+            sorted(order.items.values_list('product_quantity__product__name', 'product_quantity__quantity')),
+            [('Cake', 1), ('Coffee', 2)],
+        )
+        product_queries = [query for query in context.captured_queries if 'FROM "warehouse_product"' in query['sql']]
+        self.assertEqual(len(product_queries), 1)
+
+    def test_unknown_product_creates_nothing(self):
+        self.payload['lines'].append({'product': 999, 'quantity': 1})
+
+        response = self.client.post(self.url, self.payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('999', str(response.data['lines']))
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(ProductQuantity.objects.count(), 0)
+
+    def test_create_confirmed_reserves_stock(self):
+        StockLevel.objects.create(warehouse=self.warehouse, product=self.coffee, quantity=2)
+
+        response = self.client.post(self.url, {**self.payload, 'stage': 'Confirmed'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Order.objects.count(), 0)
+
+        StockLevel.objects.create(warehouse=self.warehouse, product=self.cake, quantity=1)
+        response = self.client.post(self.url, {**self.payload, 'stage': 'Confirmed'})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['stage'], 'Confirmed')
+        self.assertEqual(sum(StockLevel.objects.values_list('quantity', flat=True)), 0)
+
+    def test_idempotency_key_replays(self):
+        first = self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY='till-1-0042')
+        second = self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY='till-1-0042')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 2)
+
+    def test_idempotency_key_is_scoped_to_the_user(self):
+        first = self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY='till-1-0042')
+        User.objects.create_user(username='other', password='foo')
+        self.auth_data = {'username': 'other', 'password': 'foo'}
+        self.auth_user()
+
+        second = self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY='till-1-0042')
+
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_idempotency_key_from_before_user_scoping_is_claimed(self):
+        legacy = Order.objects.create(idempotency_key='till-1-0041')
+        user = User.objects.get(username=self.auth_data['username'])
+
+        response = self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY='till-1-0041')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], legacy.id)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.idempotency_user, user)
+
+        User.objects.create_user(username='other', password='foo')
+        self.auth_data = {'username': 'other', 'password': 'foo'}
+        self.auth_user()
+        response = self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY='till-1-0041')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_idempotency_key_reused_for_another_request_is_rejected(self):
+        self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY='till-1-0042')
+        self.payload['lines'][0]['quantity'] = 5
+
+        response = self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY='till-1-0042')
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_idempotency_key_race_is_settled_by_constraint(self):
+        user = User.objects.get(username=self.auth_data['username'])
+        existing = Order.objects.create(idempotency_key='till-1-0043', idempotency_user=user)
+
+        # The first lookup misses, as if the other attempt had not committed yet.
+        lookups = [Order.objects.none(), Order.objects.filter(idempotency_key='till-1-0043')]
+        with mock.patch('warehouse.api.views.Order.objects.filter', side_effect=lookups):
+            response = self.client.post(self.url, self.payload, HTTP_IDEMPOTENCY_KEY='till-1-0043')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], existing.id)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class EventFeedTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        events._broker = None
+        self.addCleanup(setattr, events, '_broker', None)
+        self.token = f'Bearer {self.access_token}'
+        self.warehouse = Warehouse.objects.create(name='Main')
+
+    def published(self):
+        return [(event['type'], event['id']) for event in events.get_broker().history]
+
+    def test_changes_are_published_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/orders/', {'warehouse': self.warehouse.id})
+        order_id = response.data['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/v1/orders/{order_id}/confirm/')
+
+        self.assertEqual(self.published(), [('order.created', order_id), ('order.updated', order_id)])
+        self.assertEqual(events.get_broker().history[-1]['stage'], 'Confirmed')
+
+    def test_rolled_back_changes_are_not_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/orders/', {'stage': 'Confirmed', 'lines': [
+                {'product': Product.objects.create(name='Coffee', price='2.50').id, 'quantity': 1},
+            ]})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.published(), [])
+
+    def test_bulk_changes_are_published(self):
+        product_quantity = ProductQuantity.objects.create(
+            product=Product.objects.create(name='Coffee', price='2.50'), quantity=1
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/warehouse-items/bulk/', [
+                {'warehouse': self.warehouse.id, 'product_quantity': product_quantity.id},
+            ])
+
+        self.assertEqual(self.published(), [('warehouse_item.created', response.data[0]['id'])])
+
+    async def read_event(self, chunks):
+        while True:
+            chunk = (await asyncio.wait_for(anext(chunks), 5)).decode()
+            if chunk.startswith('id:'):
+                return chunk
+
+    async def test_stream_filters_by_stage_and_warehouse(self):
+        response = await self.async_client.get(
+            f'/api/v1/events/?stage=Confirmed&warehouse={self.warehouse.id}', headers={'Authorization': self.token}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+
+        events.get_broker().publish([
+            {'type': 'order.updated', 'id': 1, 'warehouse': self.warehouse.id, 'stage': 'Draft'},
+            {'type': 'order.updated', 'id': 2, 'warehouse': self.warehouse.id + 1, 'stage': 'Confirmed'},
+            {'type': 'order.updated', 'id': 3, 'warehouse': self.warehouse.id, 'stage': 'Confirmed'},
+        ])
+
+        chunk = await self.read_event(chunks)
+        self.assertTrue(chunk.startswith('id: 3\nevent: order.updated\n'))
+        self.assertEqual(json.loads(chunk.split('data: ', 1)[1])['id'], 3)
+        await response.streaming_content.aclose()
+
+    async def test_stream_resumes_from_last_event_id(self):
+        events.get_broker().publish([
+            {'type': 'order.created', 'id': order_id, 'warehouse': None, 'stage': 'Draft'} for order_id in (1, 2, 3)
+        ])
+
+        response = await self.async_client.get(
+            '/api/v1/events/', headers={'Authorization': self.token, 'Last-Event-ID': '2'}
+        )
+        chunks = aiter(response.streaming_content)
+
+        self.assertTrue((await self.read_event(chunks)).startswith('id: 3\n'))
+        await response.streaming_content.aclose()
+
+    async def test_stream_requires_authentication_and_valid_filters(self):
+        response = await self.async_client.get('/api/v1/events/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = await self.async_client.get('/api/v1/events/?stage=Lost', headers={'Authorization': self.token})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SyncTest(AuthTests):
+    def sync(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get('/api/v1/sync/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def changed_ids(self, data, name):
+        return [row['id'] for row in data['changed'][name]]
+
+    def test_delta_contains_only_rows_changed_since_token(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            supplier = Supplier.objects.create(name='Acme')
+            product = Product.objects.create(name='Coffee', price='2.50', supplier=supplier)
+        full = self.sync()
+        self.assertEqual(self.changed_ids(full, 'suppliers'), [supplier.id])
+        self.assertEqual(self.changed_ids(full, 'products'), [product.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/v1/products/{product.id}/', {'price': '3.00'})
+        delta = self.sync(full['token'])
+
+        self.assertEqual(self.changed_ids(delta, 'suppliers'), [])
+        self.assertEqual(self.changed_ids(delta, 'products'), [product.id])
+        self.assertEqual(delta['changed']['products'][0]['price'], '3.00')
+        self.assertEqual(self.sync(delta['token'])['changed']['products'], [])
+
+    def test_rows_are_stamped_with_the_write(self):
+        # No on-commit callbacks run here: the stamp commits with the row.
+        supplier = Supplier.objects.create(name='Acme')
+        self.assertGreater(Supplier.objects.get(pk=supplier.pk).change_seq, 0)
+        self.assertEqual(self.changed_ids(self.sync(0), 'suppliers'), [supplier.id])
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Supplier.objects.create(name='Globex')
+            raise RuntimeError
+        self.assertEqual(changes.get_counter(changes.CATALOG), supplier.change_seq)
+
+    def test_deletions_leave_tombstones(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(name='Drinks')
+            product = Product.objects.create(name='Coffee', price='2.50', category=category)
+        token = self.sync()['token']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/v1/categories/{category.id}/')
+        delta = self.sync(token)
+
+        self.assertEqual(delta['deleted']['categories'], [category.id])
+        # The product lost its category through SET_NULL.
+        self.assertEqual(self.changed_ids(delta, 'products'), [product.id])
+        self.assertIsNone(delta['changed']['products'][0]['category'])
+
+    def test_pages_end_on_a_whole_batch(self):
+        token = self.sync()['token']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/suppliers/bulk/', [{'name': name} for name in ('Acme', 'Globex', 'Initech')])
+        with self.captureOnCommitCallbacks(execute=True):
+            warehouse = Warehouse.objects.create(name='Main')
+
+        first = self.sync(token, limit=2)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(first['changed']['suppliers']), 3)
+        self.assertEqual(first['changed']['warehouses'], [])
+
+        second = self.sync(first['token'], limit=2)
+        self.assertFalse(second['has_more'])
+        self.assertEqual(self.changed_ids(second, 'warehouses'), [warehouse.id])
+
+    def test_token_older_than_pruned_tombstones_must_resync(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            supplier = Supplier.objects.create(name='Acme')
+        token = self.sync()['token']
+        with self.captureOnCommitCallbacks(execute=True):
+            supplier.delete()
+
+        changes.prune_tombstones(before=timezone.now() + timedelta(seconds=1))
+
+        response = self.client.get('/api/v1/sync/', {'since': token})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertEqual(self.sync()['deleted']['suppliers'], [])
+
+    def test_invalid_token_is_rejected(self):
+        for since in ('abc', '²', '-1'):
+            with self.subTest(since=since):
+                response = self.client.get('/api/v1/sync/', {'since': since})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ArchiveTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        self.coffee = Product.objects.create(name='Coffee', price='2.50')
+        self.old = datetime(2024, 5, 1, 9, 30, tzinfo=dt_timezone.utc)
+        self.delivered = self.create_order('Delivered', [2, 3], key='delivered-1')
+        self.draft = self.create_order('Draft', [1])
+        self.recent = Order.objects.create(stage='Cancelled')
+
+    def create_order(self, stage, quantities, key=None):
+        user = User.objects.get(username=self.auth_data['username']) if key else None
+        order = Order.objects.create(stage=stage, idempotency_key=key, idempotency_user=user)
+        for quantity in quantities:
+            OrderItem.objects.create(
+                order=order, product_quantity=ProductQuantity.objects.create(product=self.coffee, quantity=quantity)
+            )
+        Order.objects.filter(pk=order.pk).update(created_at=self.old, updated_at=self.old)
+        return order
+
+    def archive(self):
+        out = io.StringIO()
+        call_command('archive_orders', '--days', '30', stdout=out)
+        return out.getvalue()
+
+    def test_only_old_closed_orders_are_archived(self):
+        self.assertIn('Archived 1 order(s)', self.archive())
+
+        self.assertEqual(sorted(Order.objects.values_list('id', flat=True)), [self.draft.id, self.recent.id])
+        self.assertFalse(OrderItem.objects.filter(order_id=self.delivered.id).exists())
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual((archived.id, archived.stage, archived.created_at), (self.delivered.id, 'Delivered', self.old))
+        self.assertEqual(sorted(archived.items.values_list('quantity', flat=True)), [2, 3])
+
+    def test_archived_order_is_still_retrievable(self):
+        self.archive()
+
+        response = self.client.get(f'/api/v1/orders/{self.delivered.id}/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['stage'], 'Delivered')
+        self.assertEqual([item['price'] for item in response.data['items']], ['2.50', '2.50'])
+        self.assertNotIn(self.delivered.id, [order['id'] for order in self.client.get('/api/v1/orders/').data['results']])
+
+    def test_async_detail_serves_archived_orders(self):
+        self.archive()
+
+        response = self.client.get(f'/api/v1/async/orders/{self.delivered.id}/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), self.client.get(f'/api/v1/orders/{self.delivered.id}/').json())
+        self.assertEqual(self.client.get('/api/v1/orders/999999/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_idempotent_retry_replays_archived_order(self):
+        self.archive()
+
+        response = self.client.post('/api/v1/orders/', {}, HTTP_IDEMPOTENCY_KEY='delivered-1')
+
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.data['id'], self.delivered.id)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_restore_brings_order_and_lines_back(self):
+        self.archive()
+
+        response = self.client.post(f'/api/v1/orders/{self.delivered.id}/restore/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order = Order.objects.get(pk=self.delivered.id)
+        self.assertEqual((order.stage, order.created_at, order.idempotency_key), ('Delivered', self.old, 'delivered-1'))
+        self.assertEqual(order.items.count(), 2)
+        self.assertFalse(ArchivedOrder.objects.exists())
+        self.assertEqual(
+            self.client.post(f'/api/v1/orders/{self.delivered.id}/restore/').status_code, status.HTTP_404_NOT_FOUND
+        )
+
+    def test_restore_conflicts_when_lines_cannot_be_rebuilt(self):
+        self.archive()
+        ProductQuantity.objects.filter(orderitem__isnull=True, quantity=2).delete()
+
+        with self.assertRaises(archive.ArchiveError):
+            archive.restore(self.delivered.id)
+        response = self.client.post(f'/api/v1/orders/{self.delivered.id}/restore/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_rollups_include_archived_orders(self):
+        reports.build_rollups(full=True)
+        before = sorted(SalesRollup.objects.values_list('granularity', 'stage', 'revenue'))
+
+        self.archive()
+        reports.build_rollups(full=True)
+
+        self.assertEqual(sorted(SalesRollup.objects.values_list('granularity', 'stage', 'revenue')), before)
+
+
+class ProductSearchTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        for name, description in (
+            ('Flat White', None),
+            ('Oat Milk Latte', None),
+            ('Latte Macchiato', None),
+            ('Chocolate Cake', 'Rich and dark'),
+        ):
+            Product.objects.create(name=name, description=description, price='3.00')
+
+    def search(self, query, **params):
+        response = self.client.get('/api/v1/products/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['name'] for product in response.data['results']]
+
+    def test_prefix_matches_rank_first(self):
+        self.assertEqual(self.search('latte')[0], 'Latte Macchiato')
+        self.assertEqual(set(self.search('latte')), {'Latte Macchiato', 'Oat Milk Latte'})
+        self.assertEqual(self.search('ch'), ['Chocolate Cake'])
+        self.assertEqual(self.search('milk lat'), ['Oat Milk Latte'])
+
+    def test_short_non_ascii_prefix(self):
+        Product.objects.create(name='Кофе латте', price='3.00')
+
+        self.assertEqual(self.search('ко'), ['Кофе латте'])
+        self.assertEqual(self.search('КО'), ['Кофе латте'])
+        self.assertEqual(self.search('кофе'), ['Кофе латте'])
+
+    def test_matches_description_and_tolerates_typos(self):
+        self.assertEqual(self.search('rich'), ['Chocolate Cake'])
+        self.assertEqual(self.search('machiato'), ['Latte Macchiato'])
+        self.assertEqual(self.search('chocolat cak'), ['Chocolate Cake'])
+
+    def test_index_follows_saves_and_deletes(self):
+        product = Product.objects.get(name='Flat White')
+        product.name = 'Cortado'
+        product.save()
+        Product.objects.filter(name='Chocolate Cake').delete()
+
+        self.assertEqual(self.search('cortado'), ['Cortado'])
+        self.assertEqual(self.search('flat white'), [])
+        self.assertEqual(self.search('chocolate'), [])
+
+    def sqlite_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'warehouse_product'")
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_triggers_survive_migrations(self):
+        # A later migration that rebuilds warehouse_product without calling
+        # restore_sqlite_triggers would silently stop indexing new products.
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS triggers exist on SQLite only')
+        self.assertEqual(self.sqlite_triggers(), set(search_migration.TRIGGER_NAMES))
+
+    def test_restore_sqlite_triggers(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS triggers exist on SQLite only')
+        # The schema editor refuses to open inside the test transaction on
+        # SQLite; the helper only needs the connection and execute().
+        with connection.cursor() as cursor:
+            for statement in search_migration.SQLITE_DROP_TRIGGERS:
+                cursor.execute(statement)
+            Product.objects.create(name='Cortado', price='3.00')
+            schema_editor = mock.Mock(connection=connection, execute=cursor.execute)
+            search_migration.restore_sqlite_triggers(None, schema_editor)
+        Product.objects.create(name='Cold Brew', price='3.00')
+
+        self.assertEqual(self.sqlite_triggers(), set(search_migration.TRIGGER_NAMES))
+        self.assertEqual(self.search('cortado'), ['Cortado'])
+        self.assertEqual(self.search('brew'), ['Cold Brew'])
+
+    def test_limit(self):
+        self.assertEqual(self.search('la', limit=1), ['Latte Macchiato'])
+        self.assertEqual(len(self.search('lat', limit=1)), 1)
+        response = self.client.get('/api/v1/products/search/', {'q': 'lat', 'limit': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class JobQueueTest(AuthTests):
+    def setUp(self):
+        super().setUp()
+        User.objects.filter(username=self.auth_data['username']).update(is_staff=True)
+        self.drinks = Category.objects.create(name='Drinks')
+        self.coffee = Product.objects.create(name='Coffee', price='2.50', category=self.drinks)
+        self.tea = Product.objects.create(name='Tea', price='1.99', category=self.drinks)
+        self.cake = Product.objects.create(name='Cake', price='4.00')
+
+    def test_queuing_is_validated_and_for_staff(self):
+        response = self.client.post('/api/v1/jobs/', {'kind': 'shutdown'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/v1/jobs/', {'kind': 'change_prices', 'params': {}}, format='json')
+        self.assertEqual(response.data['params'], ['Missing: percent.'])
+
+        User.objects.filter(username=self.auth_data['username']).update(is_staff=False)
+        response = self.client.post('/api/v1/jobs/', {'kind': 'build_rollups'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_percent_must_be_a_finite_number(self):
+        for percent in ('NaN', 'Infinity', True, [10], 'ten', -150):
+            with self.subTest(percent=percent):
+                response = self.client.post('/api/v1/jobs/', {
+                    'kind': 'change_prices', 'params': {'percent': percent},
+                }, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Job.objects.exists())
+
+    def test_job_runs_off_the_request_and_reports_progress(self):
+        response = self.client.post('/api/v1/jobs/', {
+            'kind': 'change_prices', 'params': {'percent': 10, 'category': self.drinks.id},
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'Queued')
+
+        jobs.run(jobs.claim('test-worker'))
+
+        job = self.client.get(f'/api/v1/jobs/{response.data["id"]}/').data
+        self.assertEqual(job['status'], 'Succeeded')
+        self.assertEqual((job['progress'], job['total'], job['result']), (2, 2, {'updated': 2}))
+        self.assertEqual(job['attempts'], 1)
+        prices = dict(Product.objects.values_list('name', 'price'))
+        self.assertEqual(prices, {'Coffee': Decimal('2.75'), 'Tea': Decimal('2.19'), 'Cake': Decimal('4.00')})
+
+    def test_failed_job_records_the_error(self):
+        job = jobs.enqueue('import_catalog', {'kind': 'products', 'path': '/nonexistent/products.csv'})
+
+        with self.assertLogs('warehouse.jobs', 'ERROR'):
+            jobs.run(jobs.claim('test-worker'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'Failed')
+        self.assertTrue(job.error.startswith('FileNotFoundError'))
+
+    def test_claim_takes_each_due_job_once(self):
+        job = jobs.enqueue('build_rollups')
+        jobs.enqueue('build_rollups', run_after=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(jobs.claim('worker-a').pk, job.pk)
+        self.assertIsNone(jobs.claim('worker-b'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ('Running', 'worker-a'))
+
+    def test_stale_jobs_are_requeued_until_attempts_run_out(self):
+        job = jobs.enqueue('build_rollups', max_attempts=2)
+        long_ago = timezone.now() - timedelta(days=1)
+
+        for expected in ('Queued', 'Failed'):
+            jobs.claim('worker-a')
+            Job.objects.filter(pk=job.pk).update(heartbeat_at=long_ago)
+            with self.assertLogs('warehouse.jobs', 'WARNING'):
+                jobs.reclaim_stale()
+            job.refresh_from_db()
+            self.assertEqual(job.status, expected)
+        self.assertEqual(job.attempts, 2)
+
+
+    def test_retried_price_change_resumes_after_the_last_batch(self):
+        job = jobs.enqueue('change_prices', {'percent': 10})
+        job = jobs.claim('worker-a')
+
+        # The first attempt dies during its second batch.
+        with mock.patch.object(jobs, 'PRICE_BATCH_SIZE', 1), \
+                mock.patch('warehouse.jobs.changes.changed', side_effect=[None, RuntimeError('worker died')]):
+            with self.assertRaises(RuntimeError):
+                jobs.change_prices(job.params, jobs.Progress(job))
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(days=1))
+        with self.assertLogs('warehouse.jobs', 'WARNING'):
+            jobs.reclaim_stale()
+
+        with mock.patch.object(jobs, 'PRICE_BATCH_SIZE', 1):
+            jobs.run(jobs.claim('worker-b'))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.result), ('Succeeded', 2, {'updated': 3}))
+        prices = dict(Product.objects.values_list('name', 'price'))
+        self.assertEqual(prices, {'Coffee': Decimal('2.75'), 'Tea': Decimal('2.19'), 'Cake': Decimal('4.40')})
+
+    def test_retried_import_resumes_after_the_last_batch(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as source:
+            source.write('name\nAcme\nGlobex\nInitech\n')
+        self.addCleanup(os.remove, source.name)
+        job = jobs.enqueue('import_catalog', {'kind': 'suppliers', 'path': source.name, 'batch_size': 2})
+        job = jobs.claim('worker-a')
+
+        # The first attempt dies after committing its first batch.
+        with mock.patch('warehouse.importing.changes.changed', side_effect=[None, RuntimeError('worker died')]):
+            with self.assertRaises(RuntimeError):
+                jobs.import_catalog(job.params, jobs.Progress(job))
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(days=1))
+        with self.assertLogs('warehouse.jobs', 'WARNING'):
+            jobs.reclaim_stale()
+
+        jobs.run(jobs.claim('worker-b'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'Succeeded')
+        self.assertEqual(sorted(Supplier.objects.values_list('name', flat=True)), ['Acme', 'Globex', 'Initech'])
+
+    def test_reclaimed_job_does_not_commit_more_work(self):
+        jobs.enqueue('change_prices', {'percent': 10})
+        job = jobs.claim('worker-a')
+        Job.objects.filter(pk=job.pk).update(worker='worker-b')
+
+        with self.assertLogs('warehouse.jobs', 'WARNING'):
+            jobs.run(job)
+
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'Running')
+        prices = dict(Product.objects.values_list('name', 'price'))
+        self.assertEqual(prices, {'Coffee': Decimal('2.50'), 'Tea': Decimal('1.99'), 'Cake': Decimal('4.00')})
+
+
+class RunWorkersTest(TransactionTestCase):
+    def test_burst_worker_drains_the_queue(self):
+        Order.objects.create(stage='Paid')
+        queued = [jobs.enqueue('build_rollups'), jobs.enqueue('build_rollups', {'full': True})]
+        out = io.StringIO()
+
+        call_command('run_workers', '--processes', '1', '--burst', stdout=out)
+
+        self.assertIn('Ran 2 job(s)', out.getvalue())
+        self.assertEqual(
+            [Job.objects.get(pk=job.pk).status for job in queued], ['Succeeded', 'Succeeded']
+        )